@@ -0,0 +1,206 @@
+"""Velocity/turnover analytics over the daily movement rollups, registered by create_app() as a blueprint"""
+from datetime import datetime, timedelta
+import click
+from flask import Blueprint, current_app, request, abort
+from sqlalchemy import case, func
+
+from app import init_db, versioned_response, api_error, requested_limit
+from models import db, Product, Location, StockBalance, MovementRollup, fan_out
+from rollups import ROLLUP_COLUMNS, total_movement_rollups, find_rollup_drift, rebuild_movement_rollups
+
+# cli_group=None keeps the command at the top level: flask rebuild-rollups
+bp = Blueprint('analytics', __name__, cli_group=None)
+
+@bp.cli.command('rebuild-rollups')
+@click.option('--check-only', is_flag=True, help='Report drift without rewriting movement_rollups.')
+def rebuild_rollups_command(check_only):
+    """Recompute the daily movement rollups behind the analytics endpoints from the ledger and its archive"""
+    init_db()
+    totals = total_movement_rollups()
+    drift = find_rollup_drift(totals)
+    
+    for day, product_id, location_id in drift[:20]:
+        print(f"Drift for product {product_id} at {location_id} on {day}")
+    if len(drift) > 20:
+        print(f"... and {len(drift) - 20} more")
+    print(f"{len(drift)} drifted rollup rows found.")
+    
+    if check_only:
+        if drift:
+            raise SystemExit(1)
+        return
+    
+    count = rebuild_movement_rollups(totals)
+    print(f"Rebuilt {count} rollup rows from the ledger.")
+
+def rollup_window_totals(today, windows, by='location', product_id=None, location_id=None):
+    """(product_id, location_id), or product_id when by='product', -> [incoming, outgoing] per window of days ending
+    today; per product only receipts and dispatches count, since transfers do not change its stock"""
+    incoming, outgoing = (MovementRollup.received, MovementRollup.dispatched) if by == 'product' else \
+        (MovementRollup.incoming, MovementRollup.outgoing)
+    keys = (MovementRollup.product_id,) if by == 'product' else (MovementRollup.product_id, MovementRollup.location_id)
+    
+    def load():
+        columns = []
+        for days in windows:
+            since = today - timedelta(days=days - 1)
+            columns.extend(func.sum(case((MovementRollup.day >= since, column), else_=0)) for column in (incoming, outgoing))
+        query = db.session.query(*keys, *columns).filter(MovementRollup.day >= today - timedelta(days=max(windows) - 1))
+        if product_id:
+            query = query.filter(MovementRollup.product_id == product_id)
+        if location_id:
+            query = query.filter(MovementRollup.location_id == location_id)
+        return query.group_by(*keys).all()
+    
+    totals = {}
+    for rows in fan_out(load):
+        for row in rows:
+            key = row[0] if by == 'product' else (row[0], row[1])
+            flows = totals.setdefault(key, [[0, 0] for _ in windows])
+            for i, flow in enumerate(flows):
+                flow[0] += row[len(keys) + 2 * i]
+                flow[1] += row[len(keys) + 2 * i + 1]
+    return totals
+
+def velocity_metrics(days, incoming, outgoing, balance):
+    """Flow per day, days of cover and turnover for a window of days ending at the current balance"""
+    outbound_per_day = outgoing / days
+    # Average stock over the window, from the balance at its start and now
+    average = (balance - incoming + outgoing + balance) / 2
+    if balance <= 0:
+        days_of_cover = 0
+    elif outbound_per_day:
+        days_of_cover = round(balance / outbound_per_day, 1)
+    else:
+        days_of_cover = None
+    return {
+        'incoming': incoming,
+        'outgoing': outgoing,
+        'inbound_per_day': round(incoming / days, 2),
+        'outbound_per_day': round(outbound_per_day, 2),
+        'days_of_cover': days_of_cover,
+        'turnover': round(outgoing / average, 2) if average > 0 else None
+    }
+
+def movement_velocity(by='location', product_id=None, location_id=None, sort='name', window=None, limit=None, today=None):
+    """Velocity rows per product and location (or per product, counting only receipts and dispatches)"""
+    today = today or datetime.utcnow().date()
+    windows = current_app.config['ANALYTICS_WINDOWS']
+    totals = rollup_window_totals(today, windows, by, product_id, location_id)
+    
+    def load_balances():
+        keys = (StockBalance.product_id,) if by == 'product' else (StockBalance.product_id, StockBalance.location_id)
+        query = db.session.query(*keys, func.sum(StockBalance.balance))
+        if product_id:
+            query = query.filter(StockBalance.product_id == product_id)
+        if location_id:
+            query = query.filter(StockBalance.location_id == location_id)
+        return query.group_by(*keys).all()
+    
+    balances = {}
+    for rows in fan_out(load_balances):
+        for *key, balance in rows:
+            key = key[0] if by == 'product' else tuple(key)
+            balances[key] = balances.get(key, 0) + balance
+    # Stock that has not moved within the longest window still shows, with no velocity
+    for key, balance in balances.items():
+        if balance and key not in totals:
+            totals[key] = [[0, 0] for _ in windows]
+    
+    product_query = db.session.query(Product.id, Product.name, Product.sku)
+    if product_id:
+        product_query = product_query.filter(Product.id == product_id)
+    products = {product.id: product for product in product_query}
+    locations = {} if by == 'product' else dict(db.session.query(Location.id, Location.name))
+    keys = [key for key in totals if (key if by == 'product' else key[0]) in products]
+    
+    # Rank on the one figure being sorted by, so full metrics are only built for the rows returned
+    column = windows.index(window) if window in windows else len(windows) // 2
+    if sort == 'velocity':
+        keys.sort(key=lambda key: -totals[key][column][1])
+    elif sort == 'cover':
+        # Soonest to run out first; stock that is not moving at all goes last
+        def cover(key):
+            balance, outgoing = balances.get(key, 0), totals[key][column][1]
+            return (False, 0) if balance <= 0 else (not outgoing, balance / outgoing if outgoing else 0)
+        keys.sort(key=cover)
+    elif by == 'product':
+        keys.sort(key=lambda key: products[key].name)
+    else:
+        keys.sort(key=lambda key: (products[key[0]].name, locations.get(key[1]) or ''))
+    
+    rows = []
+    for key in keys[:limit]:
+        balance, flows = balances.get(key, 0), totals[key]
+        product = products[key if by == 'product' else key[0]]
+        row = {'product_id': product.id, 'product_name': product.name, 'sku': product.sku}
+        if by != 'product':
+            row.update(location_id=key[1], location_name=locations.get(key[1]))
+        row['balance'] = balance
+        row['windows'] = {
+            str(days): velocity_metrics(days, incoming, outgoing, balance)
+            for days, (incoming, outgoing) in zip(windows, flows)
+        }
+        rows.append(row)
+    return rows
+
+def daily_movement_series(days, product_id=None, location_id=None, today=None):
+    """Per-day totals for the last days days (zero-filled), summed over the matching rollup rows"""
+    today = today or datetime.utcnow().date()
+    since = today - timedelta(days=days - 1)
+    
+    def load():
+        query = db.session.query(MovementRollup.day, *(func.sum(getattr(MovementRollup, name)) for name in ROLLUP_COLUMNS)).filter(
+            MovementRollup.day >= since
+        )
+        if product_id:
+            query = query.filter(MovementRollup.product_id == product_id)
+        if location_id:
+            query = query.filter(MovementRollup.location_id == location_id)
+        return query.group_by(MovementRollup.day).all()
+    
+    series = {since + timedelta(days=offset): [0, 0, 0, 0] for offset in range(days)}
+    for rows in fan_out(load):
+        for day, *values in rows:
+            for i, value in enumerate(values):
+                series[day][i] += value
+    return [{'day': day.isoformat(), **dict(zip(ROLLUP_COLUMNS, values))} for day, values in series.items()]
+
+VELOCITY_SORTS = ('name', 'velocity', 'cover')
+
+@bp.route('/api/v1/analytics/velocity')
+def api_velocity():
+    by = request.args.get('by', 'location')
+    if by not in ('location', 'product'):
+        abort(api_error(400, 'by must be location or product'))
+    sort = request.args.get('sort', 'name')
+    if sort not in VELOCITY_SORTS:
+        abort(api_error(400, f"sort must be one of {', '.join(VELOCITY_SORTS)}"))
+    windows = [str(days) for days in current_app.config['ANALYTICS_WINDOWS']]
+    window = request.args.get('window', windows[len(windows) // 2])
+    if window not in windows:
+        abort(api_error(400, f"window must be one of {', '.join(windows)}"))
+    today = datetime.utcnow().date()
+    
+    def build():
+        rows = movement_velocity(by, request.args.get('product_id'), request.args.get('location_id'), sort, int(window),
+                                 requested_limit(), today)
+        return {'as_of': today.isoformat(), 'by': by, 'windows': windows, 'rows': rows}
+    
+    # Windows end today, so the same ledger gives different answers after midnight UTC
+    return versioned_response(('movements', 'products', 'locations'), build, tag=today.isoformat())
+
+@bp.route('/api/v1/analytics/daily')
+def api_daily_movements():
+    days = request.args.get('days', max(current_app.config['ANALYTICS_WINDOWS']), type=int)
+    if not days or not 1 <= days <= 366:
+        abort(api_error(400, 'days must be between 1 and 366'))
+    today = datetime.utcnow().date()
+    
+    def build():
+        return {
+            'as_of': today.isoformat(),
+            'days': daily_movement_series(days, request.args.get('product_id'), request.args.get('location_id'), today)
+        }
+    
+    return versioned_response(('movements',), build, tag=today.isoformat())
@@ -1,165 +1,1718 @@
+import base64
+import bisect
+import csv
+import hashlib
+import heapq
+import json
+import multiprocessing
+import os
+import queue
+import re
+import sqlite3
+import statistics
+import threading
+import time
 import uuid
-from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, flash, Response
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import and_, or_, func
+import weakref
+from collections import Counter, defaultdict, deque, namedtuple
+from functools import lru_cache
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from datetime import datetime, timedelta, timezone
+import click
+from flask import Flask, render_template, request, redirect, url_for, flash, Response, stream_with_context, jsonify, send_file, abort
+from flask import current_app, g, has_request_context, before_render_template, template_rendered
+from flask.cli import AppGroup
+from sqlalchemy import or_, func, select, tuple_, union_all, bindparam, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import aliased 
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-from reportlab.lib.units import inch
+from markupsafe import Markup, escape
+from werkzeug.utils import import_string
 import io
 
+from cache import get_cache
+from models import (
+    db, UUIDKey, Product, Location, ProductMovement, ArchivedMovement, LedgerCompaction, COMPACTION_USER, StockBalance,
+    BalanceSnapshot, BalanceSnapshotRow, ReorderThreshold, StockAlert, bump_version, get_version_stamps, get_versions,
+    sharding_enabled, ledger_shards, ledger_shard, fan_out, assigned_shard, location_shards, location_shard,
+    shard_ledger_tables
+)
+from rollups import (
+    apply_rollup_delta, apply_movement_to_rollups, apply_movements_to_rollups, rebuild_movement_rollups,
+    backfill_movement_rollups
+)
 
 
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///inventory.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = str(uuid.uuid4())
 
-db = SQLAlchemy(app)
+class AppSetup:
+    """Routes, hooks and CLI commands declared at import time and registered on every app create_app() builds"""
+    
+    def __init__(self):
+        self.cli = AppGroup('arele')
+        self._deferred = []
+    
+    def _defer(self, register):
+        def decorator(func):
+            self._deferred.append(lambda app: register(app, func))
+            return func
+        return decorator
+    
+    def route(self, rule, **options):
+        return self._defer(lambda app, view: app.add_url_rule(rule, view_func=view, **options))
+    
+    def before_request(self, func):
+        return self._defer(lambda app, hook: app.before_request(hook))(func)
+    
+    def after_request(self, func):
+        return self._defer(lambda app, hook: app.after_request(hook))(func)
+    
+    def errorhandler(self, code):
+        return self._defer(lambda app, handler: app.register_error_handler(code, handler))
+    
+    def template_global(self):
+        return self._defer(lambda app, func: app.add_template_global(func))
+    
+    def connect_via(self, signal):
+        """Connect a receiver to a Flask signal for each app, like signal.connect_via(app)"""
+        return self._defer(lambda app, receiver: signal.connect(receiver, app))
+    
+    def init_app(self, app):
+        for register in self._deferred:
+            register(app)
+        for command in self.cli.commands.values():
+            app.cli.add_command(command)
+
+setup = AppSetup()
 
-class Product(db.Model):
-    __tablename__ = 'products'
+class LazyGroup(click.Group):
+    """CLI group whose commands are imported from import_name the first time the group is listed or run"""
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    name = db.Column(db.String(100), nullable=False, unique=True)
-    sku = db.Column(db.String(50), nullable=False, unique=True)
-    description = db.Column(db.Text, nullable=True)
-    unit_of_measure = db.Column(db.String(20), nullable=False, default='unit')
+    def __init__(self, name, import_name, **attrs):
+        super().__init__(name, **attrs)
+        self.import_name = import_name
+    
+    def list_commands(self, ctx):
+        return import_string(self.import_name).list_commands(ctx)
+    
+    def get_command(self, ctx, name):
+        return import_string(self.import_name).get_command(ctx, name)
+
+_apps = weakref.WeakSet()
 
-class Location(db.Model):
-    __tablename__ = 'locations'
+def create_app(config=None):
+    """Build an application: defaults, then ARELE_SETTINGS and ARELE_* overrides, then the config mapping"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///inventory.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or str(uuid.uuid4())
+    app.config['MOVEMENTS_PAGE_SIZE'] = 50
+    app.config['MOVEMENTS_MAX_PAGE_SIZE'] = 500
+    app.config['API_PAGE_SIZE'] = 100
+    app.config['API_MAX_PAGE_SIZE'] = 1000
+    app.config['EXPORT_BATCH_SIZE'] = 1000
+    app.config['REPORT_CACHE_DIR'] = os.path.join(app.instance_path, 'reports')
+    app.config['REPORT_CACHE_KEEP'] = 5
+    app.config['REPORT_WORKERS'] = 2
+    app.config['REPORT_SYNC_WAIT'] = 5
+    app.config['REPORT_TABLE_ROWS'] = 250
+    app.config['BULK_CHUNK_SIZE'] = 5000
+    # Below this many movements one GROUP BY beats starting worker processes (see flask bench aggregation)
+    app.config['AGGREGATION_MIN_MOVEMENTS'] = 5000000
+    # Group commit: one writer thread per process commits queued movements together (ignored while the ledger is sharded)
+    app.config['MOVEMENT_GROUP_COMMIT'] = False
+    app.config['GROUP_COMMIT_MAX_BATCH'] = 64
+    app.config['GROUP_COMMIT_MAX_WAIT_MS'] = 5
+    app.config['CACHE_BACKEND'] = None
+    app.config['CACHE_OPTIONS'] = {'max_entries': 1024}
+    app.config['DASHBOARD_CACHE_TTL'] = 300
+    app.config['FRAGMENT_CACHE_TTL'] = None
+    app.config['SEARCH_TYPEAHEAD_THRESHOLD'] = 500
+    app.config['SEARCH_MAX_RESULTS'] = 50
+    app.config['ANALYTICS_WINDOWS'] = (7, 30, 90)
+    app.config['SNAPSHOT_EVERY_N_MOVEMENTS'] = 10000
+    app.config['SNAPSHOT_GRACE_SECONDS'] = 60
+    app.config['SSE_CLIENT_BUFFER'] = 256
+    app.config['SSE_MAX_CLIENTS'] = 500
+    app.config['SSE_KEEPALIVE_SECONDS'] = 15
+    app.config['SSE_MAX_MOVEMENT_EVENTS'] = 100
+    app.config['PERF_INSTRUMENTATION'] = True
+    app.config['PERF_BUFFER_SIZE'] = 1000
+    app.config['PERF_SLOW_STATEMENTS'] = 5
+    app.config['PERF_DEBUG_ENDPOINT'] = False
+    app.config['SQLITE_PRAGMAS'] = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -65536,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY'
+    }
+    app.config['COMPACT_UUID_KEYS'] = False
+    app.config['POOL_DEFAULTS'] = {'pool_size': 10, 'max_overflow': 20, 'pool_pre_ping': True, 'pool_recycle': 1800}
+    # Bind key -> location ids or names whose movements and balances live on that bind, e.g. {'north': ['Main Warehouse']}
+    app.config['LEDGER_SHARDS'] = {}
+    app.config['LEDGER_FANOUT_WORKERS'] = 8
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    name = db.Column(db.String(100), nullable=False, unique=True)
-    address = db.Column(db.Text, nullable=True)
-    type = db.Column(db.String(50), nullable=False, default='Warehouse')
+    # Deployment overrides: a Python settings file named by ARELE_SETTINGS, then ARELE_* variables
+    # (JSON values, nested keys with __, e.g. ARELE_SQLALCHEMY_ENGINE_OPTIONS__pool_size=20)
+    app.config.from_envvar('ARELE_SETTINGS', silent=True)
+    app.config.from_prefixed_env('ARELE')
+    if config:
+        app.config.update(config)
+    if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        engine_options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+        for option, value in app.config['POOL_DEFAULTS'].items():
+            engine_options.setdefault(option, value)
+    # Ledger shards without an explicit SQLALCHEMY_BINDS entry get a SQLite file in the instance folder
+    for shard in app.config['LEDGER_SHARDS']:
+        app.config.setdefault('SQLALCHEMY_BINDS', {}).setdefault(shard, f'sqlite:///ledger_{shard}.db')
+    
+    db.init_app(app)
+    with app.app_context():
+        listener = sqlite_pragma_listener(dict(app.config['SQLITE_PRAGMAS']))
+        for engine in db.engines.values():
+            event.listen(engine, 'connect', listener)
+    setup.init_app(app)
+    # Imported here: analytics.py imports this module, and the bench tooling loads only when a bench command runs
+    from analytics import bp as analytics_bp
+    app.register_blueprint(analytics_bp)
+    app.cli.add_command(LazyGroup('bench', 'bench:cli', help='Seed scale data, run benchmarks and stress tests on scratch databases.'))
+    _apps.add(app)
+    return app
+
+def reset_after_fork():
+    """Give a forked worker (gunicorn --preload) its own connections, executors and writer instead of the parent's"""
+    _report_jobs.clear()
+    for app in list(_apps):
+        # The writer thread and process pools did not survive the fork; the child starts its own on first use
+        app.extensions.pop('arele_writer', None)
+        app.extensions.pop('arele_reports', None)
+        app.extensions.pop('arele_aggregation', None)
+        with app.app_context():
+            for engine in db.engines.values():
+                # close=False drops the inherited connections without closing sockets the parent still uses
+                engine.dispose(close=False)
+
+os.register_at_fork(after_in_child=reset_after_fork)
+
+def sqlite_pragma_listener(pragmas):
+    """Connect listener for one app's engines that tunes each new SQLite connection with pragmas"""
+    def apply_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers run alongside the single writer
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        
+        cursor = dbapi_connection.cursor()
+        for pragma, value in pragmas.items():
+            cursor.execute(f'PRAGMA {pragma}={value}')
+        cursor.close()
+    return apply_sqlite_pragmas
+
+class Subscription:
+    def __init__(self, topics, buffer_size):
+        self.topics = frozenset(topics)
+        self.queue = queue.Queue(maxsize=buffer_size)
+        self.overflowed = False
 
-class ProductMovement(db.Model):
-    __tablename__ = 'product_movements'
+class EventBroker:
+    """In-process pub/sub fanning server-sent events out to bounded per-client queues"""
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False)
-    from_location_id = db.Column(db.String(36), db.ForeignKey('locations.id'), nullable=True)
-    to_location_id = db.Column(db.String(36), db.ForeignKey('locations.id'), nullable=True)
-    qty = db.Column(db.Integer, nullable=False)
-    note = db.Column(db.Text, nullable=True)
-    user_id = db.Column(db.String(50), nullable=False, default='SYSTEM_ADMIN')
+    def __init__(self, buffer_size):
+        self.buffer_size = buffer_size
+        self._subscriptions = set()
+        self._lock = threading.Lock()
     
-    product = db.relationship('Product', backref='movements')
-    from_location = db.relationship('Location', foreign_keys=[from_location_id], backref='outgoing_movements')
-    to_location = db.relationship('Location', foreign_keys=[to_location_id], backref='incoming_movements')
+    def subscribe(self, topics):
+        subscription = Subscription(topics, self.buffer_size)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+    
+    def subscriber_count(self):
+        return len(self._subscriptions)
+    
+    def publish(self, topic, event, data):
+        """Encode once and enqueue for every subscriber of topic; a full queue marks that client for resync"""
+        message = f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'), default=str)}\n\n"
+        with self._lock:
+            subscriptions = [subscription for subscription in self._subscriptions if topic in subscription.topics]
+        for subscription in subscriptions:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                subscription.overflowed = True
 
-def get_inventory_balances():
-    # Subquery for incoming quantities
-    incoming_subquery = db.session.query(
-        ProductMovement.to_location_id.label('location_id'),
-        ProductMovement.product_id.label('product_id'),
-        func.sum(ProductMovement.qty).label('incoming_qty')
-    ).filter(
-        ProductMovement.to_location_id.isnot(None)
-    ).group_by(
-        ProductMovement.to_location_id, 
-        ProductMovement.product_id
-    ).subquery('incoming')
-    
-    # Subquery for outgoing quantities
-    outgoing_subquery = db.session.query(
-        ProductMovement.from_location_id.label('location_id'),
-        ProductMovement.product_id.label('product_id'),
-        func.sum(ProductMovement.qty).label('outgoing_qty')
+def get_event_broker():
+    broker = current_app.extensions.get('arele_events')
+    if broker is None:
+        broker = current_app.extensions['arele_events'] = EventBroker(current_app.config['SSE_CLIENT_BUFFER'])
+    return broker
+
+def apply_balance_delta(product_id, location_id, incoming=0, outgoing=0):
+    """Add incoming/outgoing quantities to one materialized balance row"""
+    table = StockBalance.__table__
+    result = db.session.execute(
+        table.update().where(
+            table.c.product_id == product_id,
+            table.c.location_id == location_id
+        ).values(
+            incoming=table.c.incoming + incoming,
+            outgoing=table.c.outgoing + outgoing,
+            balance=table.c.balance + incoming - outgoing
+        )
+    )
+    
+    if result.rowcount == 0:
+        db.session.execute(
+            table.insert().values(
+                product_id=product_id,
+                location_id=location_id,
+                incoming=incoming,
+                outgoing=outgoing,
+                balance=incoming - outgoing
+            )
+        )
+
+def apply_movement_to_balances(movement):
+    """Update stock_balances for a movement in the caller's transaction"""
+    if movement.from_location_id:
+        apply_balance_delta(movement.product_id, movement.from_location_id, outgoing=movement.qty)
+    if movement.to_location_id:
+        apply_balance_delta(movement.product_id, movement.to_location_id, incoming=movement.qty)
+
+class InsufficientStockError(Exception):
+    def __init__(self, available):
+        super().__init__(f'Insufficient stock ({available} units available)')
+        self.available = available
+
+def lock_stock_for_write():
+    """Take the write lock up front so balance reads and decrements are serialized"""
+    connection = db.session.connection(bind_arguments={'mapper': StockBalance})
+    
+    # pysqlite only issues BEGIN lazily before the first write, which would let two
+    # pickers read the same balance; BEGIN IMMEDIATE grabs the RESERVED lock now.
+    if connection.dialect.name == 'sqlite' and not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+def reserve_stock(product_id, location_id, qty):
+    """Lock a single balance row and decrement it, or raise InsufficientStockError"""
+    lock_stock_for_write()
+    
+    # FOR UPDATE is a no-op on SQLite, where BEGIN IMMEDIATE already holds the lock
+    row = db.session.query(StockBalance.balance).filter(
+        StockBalance.product_id == product_id,
+        StockBalance.location_id == location_id
+    ).with_for_update().first()
+    
+    available = row.balance if row else 0
+    if available < qty:
+        raise InsufficientStockError(available)
+    
+    table = StockBalance.__table__
+    result = db.session.execute(
+        table.update().where(
+            table.c.product_id == product_id,
+            table.c.location_id == location_id,
+            table.c.balance >= qty
+        ).values(
+            outgoing=table.c.outgoing + qty,
+            balance=table.c.balance - qty
+        )
+    )
+    
+    if result.rowcount != 1:
+        raise InsufficientStockError(available)
+
+def new_movement(product_id, from_location_id, to_location_id, qty, note, user_id):
+    """Add a movement to the session and detach it once flushed, so commits (possibly on another shard) never expire it"""
+    movement = ProductMovement(
+        id=str(uuid.uuid4()),
+        timestamp=datetime.utcnow(),
+        product_id=product_id,
+        from_location_id=from_location_id,
+        to_location_id=to_location_id,
+        qty=qty,
+        note=note,
+        user_id=user_id
+    )
+    db.session.add(movement)
+    db.session.flush()
+    db.session.expunge(movement)
+    return movement
+
+def record_movement(product_id, from_location_id, to_location_id, qty, note=None, user_id='SYSTEM_ADMIN'):
+    """Reserve stock, insert the movement and update balances in one transaction on the owning ledger shard"""
+    shards = {location_shard(location_id) for location_id in (from_location_id, to_location_id) if location_id}
+    if len(shards) > 1:
+        movement = record_cross_shard_movement(product_id, from_location_id, to_location_id, qty, note, user_id)
+    else:
+        with ledger_shard(next(iter(shards), None)):
+            try:
+                # Every writer takes the lock before its timestamp is assigned, so no movement
+                # can commit with a timestamp earlier than a snapshot cutoff taken before it.
+                lock_stock_for_write()
+                if from_location_id:
+                    reserve_stock(product_id, from_location_id, qty)
+                
+                movement = new_movement(product_id, from_location_id, to_location_id, qty, note, user_id)
+                
+                if to_location_id:
+                    apply_balance_delta(product_id, to_location_id, incoming=qty)
+                apply_movement_to_rollups(movement)
+                
+                bump_version('movements')
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+    
+    after_movements_committed([{
+        'id': movement.id,
+        'timestamp': movement.timestamp,
+        'product_id': product_id,
+        'from_location_id': from_location_id,
+        'to_location_id': to_location_id,
+        'qty': qty,
+        'note': note
+    }])
+    return movement
+
+def record_cross_shard_movement(product_id, from_location_id, to_location_id, qty, note, user_id):
+    """Two-phase transfer between ledger shards: lock and stage both sides, then commit them together"""
+    source, destination = location_shard(from_location_id), location_shard(to_location_id)
+    session = db.session()
+    # Connections joining a two-phase transaction must all begin in it, so end the read transaction first
+    session.commit()
+    session.twophase = all(db.engines[shard].dialect.name != 'sqlite' for shard in (source, destination))
+    committing = False
+    try:
+        # Phase 1: write-lock both shards in a fixed order, so opposing transfers cannot deadlock, then stage
+        # the movement and stock decrement on the source and the stock increment on the destination
+        for shard in sorted((source, destination), key=lambda shard: shard or ''):
+            with ledger_shard(shard):
+                lock_stock_for_write()
+        with ledger_shard(source):
+            reserve_stock(product_id, from_location_id, qty)
+            movement = new_movement(product_id, from_location_id, to_location_id, qty, note, user_id)
+            apply_rollup_delta(movement.timestamp.date(), product_id, from_location_id, outgoing=qty)
+            bump_version('movements')
+        with ledger_shard(destination):
+            apply_balance_delta(product_id, to_location_id, incoming=qty)
+            apply_rollup_delta(movement.timestamp.date(), product_id, to_location_id, incoming=qty)
+            bump_version('movements')
+        
+        # Phase 2: PREPARE where the backend supports two-phase commit (SQLite holds both locks instead), then commit
+        committing = True
+        session.commit()
+    except Exception:
+        session.rollback()
+        if committing:
+            # One shard may have committed before the other failed; re-derive both balances from the ledgers
+            repair_stock_balances({(product_id, from_location_id), (product_id, to_location_id)})
+        raise
+    finally:
+        session.twophase = False
+    return movement
+
+def alert_kind(balance, threshold):
+    """The alert a balance calls for: negative stock first, then at or below the reorder threshold"""
+    if balance < 0:
+        return 'negative'
+    if threshold is not None and balance <= threshold:
+        return 'low_stock'
+    return None
+
+def pair_filter(product_column, location_column, pairs):
+    return tuple_(product_column, location_column).in_(list(pairs))
+
+def reconcile_alert_batch(batch, now, apply):
+    """Count (and with apply, make) the alert changes needed for a batch of pairs; None means every pair"""
+    balance_query = db.session.query(StockBalance.product_id, StockBalance.location_id, StockBalance.balance)
+    threshold_query = db.session.query(ReorderThreshold.product_id, ReorderThreshold.location_id, ReorderThreshold.min_qty)
+    alert_query = StockAlert.query.filter(StockAlert.resolved_at.is_(None))
+    if batch is not None:
+        balance_query = balance_query.filter(pair_filter(StockBalance.product_id, StockBalance.location_id, batch))
+        threshold_query = threshold_query.filter(pair_filter(ReorderThreshold.product_id, ReorderThreshold.location_id, batch))
+        alert_query = alert_query.filter(pair_filter(StockAlert.product_id, StockAlert.location_id, batch))
+    
+    # Each shard only holds balance rows for the locations it owns
+    balances = {
+        (row.product_id, row.location_id): row.balance
+        for rows in fan_out(lambda: balance_query.with_session(db.session()).all())
+        for row in rows
+    }
+    thresholds = {(row.product_id, row.location_id): row.min_qty for row in threshold_query}
+    open_alerts = {(alert.product_id, alert.location_id): alert for alert in alert_query}
+    
+    raised = resolved = updated = 0
+    for key in set(balances) | set(thresholds) | set(open_alerts):
+        balance, threshold = balances.get(key, 0), thresholds.get(key)
+        kind = alert_kind(balance, threshold)
+        alert = open_alerts.get(key)
+        
+        if alert is not None and alert.kind == kind:
+            if (alert.balance, alert.threshold) != (balance, threshold):
+                updated += 1
+                if apply:
+                    alert.balance, alert.threshold = balance, threshold
+            continue
+        if alert is not None:
+            resolved += 1
+            if apply:
+                alert.resolved_at = now
+        if kind is not None:
+            raised += 1
+            if apply:
+                db.session.add(StockAlert(
+                    product_id=key[0], location_id=key[1], kind=kind,
+                    balance=balance, threshold=threshold, raised_at=now
+                ))
+    return raised, resolved, updated
+
+# Transaction-level advisory lock key shared by every alert writer on PostgreSQL
+ALERT_LOCK_KEY = 0x6172656C
+
+def lock_alerts_for_write():
+    """Serialize alert writers, so two of them cannot both open an alert for the same pair"""
+    lock_stock_for_write()
+    connection = db.session.connection(bind_arguments={'mapper': StockAlert})
+    if connection.dialect.name == 'postgresql':
+        # Held until commit; the open alerts are read after it is granted, so they include the previous writer's
+        connection.execute(select(func.pg_advisory_xact_lock(ALERT_LOCK_KEY)))
+    elif connection.dialect.name != 'sqlite':
+        # Elsewhere, updating the alerts counter first holds its row lock until commit
+        bump_version('alerts')
+
+def evaluate_stock_alerts(pairs=None, batch_size=500):
+    """Raise, update or resolve alerts for the given (product_id, location_id) pairs, or for every pair"""
+    if pairs is not None:
+        pairs = list(pairs)
+        if not pairs:
+            return 0, 0
+    batches = [pairs[i:i + batch_size] for i in range(0, len(pairs), batch_size)] if pairs is not None else [None]
+    raised = resolved = 0
+    now = datetime.utcnow()
+    
+    for batch in batches:
+        # Most movements change no alert, so check read-only before taking the write lock
+        needed = reconcile_alert_batch(batch, now, apply=False)
+        db.session.commit()
+        if not any(needed):
+            continue
+        
+        lock_alerts_for_write()
+        batch_raised, batch_resolved, _ = reconcile_alert_batch(batch, now, apply=True)
+        raised += batch_raised
+        resolved += batch_resolved
+        bump_version('alerts')
+        db.session.commit()
+    
+    return raised, resolved
+
+def touched_pairs(movements):
+    pairs = set()
+    for movement in movements:
+        for location_id in (movement['from_location_id'], movement['to_location_id']):
+            if location_id:
+                pairs.add((movement['product_id'], location_id))
+    return pairs
+
+def set_reorder_threshold(product_id, location_id, min_qty):
+    """Store (or with min_qty None, remove) a reorder threshold and re-evaluate that pair"""
+    threshold = db.session.get(ReorderThreshold, (product_id, location_id))
+    if min_qty is None:
+        if threshold is not None:
+            db.session.delete(threshold)
+    elif threshold is None:
+        db.session.add(ReorderThreshold(product_id=product_id, location_id=location_id, min_qty=min_qty))
+    else:
+        threshold.min_qty = min_qty
+    bump_version('alerts')
+    db.session.commit()
+    evaluate_stock_alerts([(product_id, location_id)])
+
+def publish_inventory_events(movements):
+    """Push new movements and the touched balance rows to live subscribers"""
+    broker = get_event_broker()
+    if not broker.subscriber_count():
+        return
+    
+    # Large bulk chunks would overflow every client buffer; ask them to reload once instead
+    if len(movements) > current_app.config['SSE_MAX_MOVEMENT_EVENTS']:
+        for topic in ('movements', 'balances'):
+            broker.publish(topic, 'resync', {'movements': len(movements)})
+        return
+    
+    pairs = touched_pairs(movements)
+    for row in inventory_balance_rows(pairs):
+        broker.publish('balances', 'balance', row._asdict())
+    
+    product_names = dict(db.session.query(Product.id, Product.name).filter(
+        Product.id.in_({movement['product_id'] for movement in movements})
+    ))
+    location_names = dict(db.session.query(Location.id, Location.name).filter(
+        Location.id.in_({location_id for _, location_id in pairs})
+    ))
+    for movement in movements:
+        broker.publish('movements', 'movement', {
+            'id': movement['id'],
+            'timestamp': movement['timestamp'].isoformat(),
+            'product_id': movement['product_id'],
+            'product_name': product_names.get(movement['product_id']),
+            'from_location_id': movement['from_location_id'],
+            'from_location_name': location_names.get(movement['from_location_id']),
+            'to_location_id': movement['to_location_id'],
+            'to_location_name': location_names.get(movement['to_location_id']),
+            'qty': movement['qty'],
+            'note': movement.get('note')
+        })
+    db.session.commit()
+
+_snapshot_counter = {'movements': 0}
+_snapshot_counter_lock = threading.Lock()
+
+def after_movements_committed(movements):
+    """Post-commit bookkeeping for newly recorded movement rows; failures are logged, not raised"""
+    try:
+        adjust_dashboard_stats(
+            movement_count=len(movements),
+            total_inflow=sum(movement['qty'] for movement in movements if movement['to_location_id']),
+            total_outflow=sum(movement['qty'] for movement in movements if movement['from_location_id'])
+        )
+        evaluate_stock_alerts(touched_pairs(movements))
+        publish_inventory_events(movements)
+        
+        with _snapshot_counter_lock:
+            _snapshot_counter['movements'] += len(movements)
+            due = _snapshot_counter['movements'] >= current_app.config['SNAPSHOT_EVERY_N_MOVEMENTS']
+            if due:
+                _snapshot_counter['movements'] = 0
+        if due:
+            take_balance_snapshot()
+    except Exception:
+        # The movements are durable: an error here would make clients resubmit them. Stale alerts or
+        # stats are repaired by evaluate-alerts and the cache TTL, and the next snapshot catches up.
+        db.session.rollback()
+        current_app.logger.exception('Post-commit bookkeeping failed for %d movements', len(movements))
+
+class PendingMovement:
+    def __init__(self, product_id, from_location_id, to_location_id, qty, note, user_id):
+        self.args = (product_id, from_location_id, to_location_id, qty, note, user_id)
+        self.future = Future()
+
+class MovementWriter:
+    """Single writer thread that validates queued movements against current balances and commits them in groups"""
+    
+    def __init__(self, app, max_batch, max_wait):
+        self.app = app
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='arele-movement-writer', daemon=True)
+        self._thread.start()
+    
+    def submit(self, product_id, from_location_id, to_location_id, qty, note=None, user_id='SYSTEM_ADMIN'):
+        """Queue a movement; the future resolves to the movement or raises InsufficientStockError once its group commits"""
+        pending = PendingMovement(product_id, from_location_id, to_location_id, qty, note, user_id)
+        self._queue.put(pending)
+        return pending.future
+    
+    def close(self):
+        """Commit whatever is queued and stop the writer thread"""
+        self._queue.put(None)
+        self._thread.join()
+    
+    def _next_batch(self):
+        """Block for the first movement, then gather more until the batch is full or max_wait has passed"""
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                pending = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if pending is None:
+                # Finish this batch first; the sentinel stops the loop on the next turn
+                self._queue.put(None)
+                break
+            batch.append(pending)
+        return batch
+    
+    def _run(self):
+        with self.app.app_context():
+            while (batch := self._next_batch()) is not None:
+                try:
+                    self._write(batch)
+                finally:
+                    db.session.remove()
+    
+    def _write(self, batch):
+        """Validate the group against balances read once under the write lock, then insert it with the bulk-ingest helpers"""
+        rows, refused, deltas = [], [], {}
+        try:
+            lock_stock_for_write()
+            pairs = {
+                (pending.args[0], location_id) for pending in batch
+                for location_id in pending.args[1:3] if location_id
+            }
+            balances = {
+                (row.product_id, row.location_id): row.balance
+                for row in db.session.query(StockBalance.product_id, StockBalance.location_id, StockBalance.balance).filter(
+                    pair_filter(StockBalance.product_id, StockBalance.location_id, pairs)
+                ).with_for_update()
+            }
+            existing_pairs = set(balances)
+            
+            # Earlier movements in the group are counted before later ones are checked, as if committed one by one
+            accepted = []
+            for pending in batch:
+                product_id, from_location_id, to_location_id, qty, note, user_id = pending.args
+                if from_location_id:
+                    available = balances.get((product_id, from_location_id), 0)
+                    if available < qty:
+                        refused.append((pending, InsufficientStockError(available)))
+                        continue
+                    balances[(product_id, from_location_id)] = available - qty
+                    deltas.setdefault((product_id, from_location_id), [0, 0])[1] += qty
+                if to_location_id:
+                    balances[(product_id, to_location_id)] = balances.get((product_id, to_location_id), 0) + qty
+                    deltas.setdefault((product_id, to_location_id), [0, 0])[0] += qty
+                
+                rows.append({
+                    'id': str(uuid.uuid4()),
+                    'timestamp': datetime.utcnow(),
+                    'product_id': product_id,
+                    'from_location_id': from_location_id,
+                    'to_location_id': to_location_id,
+                    'qty': qty,
+                    'note': note,
+                    'user_id': user_id
+                })
+                accepted.append(pending)
+            
+            if rows:
+                db.session.execute(ProductMovement.__table__.insert(), rows)
+                apply_balance_deltas(deltas, existing_pairs)
+                apply_movements_to_rollups(rows)
+                bump_version('movements')
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            for pending in batch:
+                pending.future.set_exception(error)
+            return
+        
+        for pending, error in refused:
+            pending.future.set_exception(error)
+        if rows:
+            after_movements_committed(rows)
+        for pending, row in zip(accepted, rows):
+            pending.future.set_result(ProductMovement(**row))
+
+_movement_writer_lock = threading.Lock()
+
+def get_movement_writer():
+    writer = current_app.extensions.get('arele_writer')
+    if writer is None:
+        with _movement_writer_lock:
+            writer = current_app.extensions.get('arele_writer')
+            if writer is None:
+                writer = current_app.extensions['arele_writer'] = MovementWriter(
+                    current_app._get_current_object(),
+                    current_app.config['GROUP_COMMIT_MAX_BATCH'],
+                    current_app.config['GROUP_COMMIT_MAX_WAIT_MS'] / 1000
+                )
+    return writer
+
+def submit_movement(product_id, from_location_id, to_location_id, qty, note=None, user_id='SYSTEM_ADMIN'):
+    """record_movement(), through the group-commit writer when MOVEMENT_GROUP_COMMIT is on"""
+    if not current_app.config['MOVEMENT_GROUP_COMMIT'] or sharding_enabled():
+        return record_movement(product_id, from_location_id, to_location_id, qty, note, user_id)
+    # Release this request's read transaction so it does not hold up the writer's lock
+    db.session.commit()
+    return get_movement_writer().submit(product_id, from_location_id, to_location_id, qty, note, user_id).result()
+
+def parse_movement_records(payload, fmt):
+    """Turn a JSON array/object or CSV text into a list of movement record dicts"""
+    if fmt == 'csv':
+        return list(csv.DictReader(io.StringIO(payload)))
+    
+    data = json.loads(payload)
+    if isinstance(data, dict):
+        data = data.get('movements')
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array of movements or {"movements": [...]}')
+    return data
+
+def _validate_movement_chunk(records, offset, user_id):
+    """Check a chunk against catalog and balances loaded once, returning rows to insert and errors"""
+    def clean(value):
+        value = (value or '').strip() if isinstance(value, str) else value
+        return value or None
+    
+    skus = {clean(record.get('sku')) for record in records if isinstance(record, dict)} - {None}
+    product_ids = {clean(record.get('product_id')) for record in records if isinstance(record, dict)} - {None}
+    location_ids = {
+        clean(record.get(key)) for record in records if isinstance(record, dict)
+        for key in ('from_location_id', 'to_location_id')
+    } - {None}
+    
+    sku_to_id = dict(db.session.query(Product.sku, Product.id).filter(Product.sku.in_(skus))) if skus else {}
+    known_products = {
+        product_id for (product_id,) in db.session.query(Product.id).filter(Product.id.in_(product_ids | set(sku_to_id.values())))
+    }
+    known_locations = {
+        location_id for (location_id,) in db.session.query(Location.id).filter(Location.id.in_(location_ids))
+    }
+    
+    balances = {}
+    if known_products and known_locations:
+        balances = {
+            (row.product_id, row.location_id): row.balance
+            for row in db.session.query(StockBalance.product_id, StockBalance.location_id, StockBalance.balance).filter(
+                StockBalance.product_id.in_(known_products),
+                StockBalance.location_id.in_(known_locations)
+            )
+        }
+    existing_pairs = set(balances)
+    
+    rows, errors, deltas = [], [], {}
+    for index, record in enumerate(records, offset + 1):
+        if not isinstance(record, dict):
+            errors.append({'row': index, 'error': 'Movement must be an object'})
+            continue
+        
+        product_id = clean(record.get('product_id')) or sku_to_id.get(clean(record.get('sku')))
+        from_location_id = clean(record.get('from_location_id'))
+        to_location_id = clean(record.get('to_location_id'))
+        qty = record.get('qty')
+        try:
+            # int() would silently turn JSON true into 1 and 2.9 into 2
+            if isinstance(qty, bool) or (isinstance(qty, float) and not qty.is_integer()):
+                raise ValueError(qty)
+            qty = int(qty)
+        except (TypeError, ValueError):
+            errors.append({'row': index, 'error': 'Quantity must be an integer'})
+            continue
+        
+        if product_id not in known_products:
+            errors.append({'row': index, 'error': 'Unknown product'})
+            continue
+        if not from_location_id and not to_location_id:
+            errors.append({'row': index, 'error': 'Either source or destination location must be specified'})
+            continue
+        if any(location_id and location_id not in known_locations for location_id in (from_location_id, to_location_id)):
+            errors.append({'row': index, 'error': 'Unknown location'})
+            continue
+        if qty <= 0:
+            errors.append({'row': index, 'error': 'Quantity must be greater than 0'})
+            continue
+        
+        if from_location_id:
+            available = balances.get((product_id, from_location_id), 0)
+            if available < qty:
+                errors.append({'row': index, 'error': f'Insufficient stock ({available} units available)'})
+                continue
+            balances[(product_id, from_location_id)] = available - qty
+            deltas.setdefault((product_id, from_location_id), [0, 0])[1] += qty
+        if to_location_id:
+            balances[(product_id, to_location_id)] = balances.get((product_id, to_location_id), 0) + qty
+            deltas.setdefault((product_id, to_location_id), [0, 0])[0] += qty
+        
+        rows.append({
+            'id': str(uuid.uuid4()),
+            'timestamp': datetime.utcnow(),
+            'product_id': product_id,
+            'from_location_id': from_location_id,
+            'to_location_id': to_location_id,
+            'qty': qty,
+            'note': clean(record.get('note')),
+            'user_id': clean(record.get('user_id')) or user_id
+        })
+    
+    return rows, errors, deltas, existing_pairs
+
+def apply_balance_deltas(deltas, existing_pairs):
+    """Apply aggregated (incoming, outgoing) deltas to stock_balances with two executemany calls"""
+    table = StockBalance.__table__
+    updates, inserts = [], []
+    for (product_id, location_id), (incoming, outgoing) in deltas.items():
+        if (product_id, location_id) in existing_pairs:
+            updates.append({'b_product_id': product_id, 'b_location_id': location_id, 'b_in': incoming, 'b_out': outgoing})
+        else:
+            inserts.append({
+                'product_id': product_id,
+                'location_id': location_id,
+                'incoming': incoming,
+                'outgoing': outgoing,
+                'balance': incoming - outgoing
+            })
+    
+    if updates:
+        db.session.execute(
+            table.update().where(
+                table.c.product_id == bindparam('b_product_id'),
+                table.c.location_id == bindparam('b_location_id')
+            ).values(
+                incoming=table.c.incoming + bindparam('b_in'),
+                outgoing=table.c.outgoing + bindparam('b_out'),
+                balance=table.c.balance + bindparam('b_in') - bindparam('b_out')
+            ),
+            updates
+        )
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+
+def ingest_movements(records, chunk_size=None, user_id='SYSTEM_ADMIN'):
+    """Validate and insert movement records in chunked transactions, collecting per-row errors"""
+    if sharding_enabled():
+        raise ValueError('Bulk ingestion is not supported while the ledger is sharded; post movements one at a time.')
+    chunk_size = chunk_size or current_app.config['BULK_CHUNK_SIZE']
+    inserted, errors = 0, []
+    
+    for offset in range(0, len(records), chunk_size):
+        chunk = records[offset:offset + chunk_size]
+        try:
+            lock_stock_for_write()
+            rows, chunk_errors, deltas, existing_pairs = _validate_movement_chunk(chunk, offset, user_id)
+            if rows:
+                db.session.execute(ProductMovement.__table__.insert(), rows)
+                apply_balance_deltas(deltas, existing_pairs)
+                apply_movements_to_rollups(rows)
+                bump_version('movements')
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        
+        if rows:
+            after_movements_committed(rows)
+        inserted += len(rows)
+        errors.extend(chunk_errors)
+    
+    return {'inserted': inserted, 'rejected': len(errors), 'errors': errors}
+
+def compute_ledger_balances(start=None, end=None, model=ProductMovement, products=None):
+    """Recompute (product_id, location_id) -> (incoming, outgoing) from the ledger, optionally for start <= timestamp < end
+    and for product ids in the inclusive (low, high) range products"""
+    def in_window(query):
+        if products is not None:
+            query = query.filter(model.product_id.between(*products))
+        if start is not None:
+            query = query.filter(model.timestamp >= start)
+        if end is not None:
+            query = query.filter(model.timestamp < end)
+        return query
+    
+    incoming_rows = in_window(db.session.query(
+        model.product_id,
+        model.to_location_id,
+        func.sum(model.qty)
     ).filter(
-        ProductMovement.from_location_id.isnot(None)
-    ).group_by(
-        ProductMovement.from_location_id, 
-        ProductMovement.product_id
-    ).subquery('outgoing')
-    
-    # Get all product-location pairs that have movements
-    product_location_pairs = db.session.query(
-        ProductMovement.product_id.label('product_id'),
-        ProductMovement.to_location_id.label('location_id')
+        model.to_location_id.isnot(None)
+    )).group_by(
+        model.product_id,
+        model.to_location_id
+    )
+    
+    outgoing_rows = in_window(db.session.query(
+        model.product_id,
+        model.from_location_id,
+        func.sum(model.qty)
     ).filter(
-        ProductMovement.to_location_id.isnot(None)
-    ).union(
-        db.session.query(
-            ProductMovement.product_id.label('product_id'),
-            ProductMovement.from_location_id.label('location_id')
-        ).filter(
-            ProductMovement.from_location_id.isnot(None)
-        )
-    ).distinct().subquery('pairs')
+        model.from_location_id.isnot(None)
+    )).group_by(
+        model.product_id,
+        model.from_location_id
+    )
+    
+    totals = {}
+    for product_id, location_id, qty in incoming_rows:
+        totals.setdefault((product_id, location_id), [0, 0])[0] += qty
+    for product_id, location_id, qty in outgoing_rows:
+        totals.setdefault((product_id, location_id), [0, 0])[1] += qty
+    
+    return {key: tuple(value) for key, value in totals.items()}
+
+def merge_ledger_totals(results):
+    totals = {}
+    for result in results:
+        for key, (incoming, outgoing) in result.items():
+            base_incoming, base_outgoing = totals.get(key, (0, 0))
+            totals[key] = (base_incoming + incoming, base_outgoing + outgoing)
+    return totals
+
+def total_ledger_balances(start=None, end=None):
+    """compute_ledger_balances() summed across every ledger shard"""
+    if not sharding_enabled():
+        return compute_ledger_balances(start, end)
+    return merge_ledger_totals(fan_out(lambda: compute_ledger_balances(start, end)))
+
+# Settings a worker process needs to open the same databases as the app that started it
+AGGREGATION_WORKER_CONFIG = ('SQLALCHEMY_DATABASE_URI', 'SQLALCHEMY_BINDS', 'SQLALCHEMY_ENGINE_OPTIONS',
+                             'LEDGER_SHARDS', 'COMPACT_UUID_KEYS', 'SQLITE_PRAGMAS')
+
+_aggregation_app = None
+
+def init_aggregation_worker(config):
+    """Worker-process initializer: build one app per process for every partition it sums"""
+    global _aggregation_app
+    _aggregation_app = create_app(config)
+
+def aggregate_ledger_partition(shard, low, high, start, end):
+    """Worker-process entry point: compute_ledger_balances() for one shard's products low..high"""
+    with _aggregation_app.app_context(), ledger_shard(shard):
+        try:
+            return compute_ledger_balances(start, end, products=(low, high))
+        finally:
+            db.session.remove()
+
+def ledger_partitions(count, start=None, end=None):
+    """Split each shard's ledger into up to count contiguous product id ranges with as many products each"""
+    partitions = []
+    for shard in ledger_shards():
+        with ledger_shard(shard):
+            product_ids = [row[0] for row in db.session.query(ProductMovement.product_id).distinct().order_by(ProductMovement.product_id)]
+        parts = min(count, len(product_ids))
+        for part in range(parts):
+            low = product_ids[part * len(product_ids) // parts]
+            high = product_ids[(part + 1) * len(product_ids) // parts - 1]
+            partitions.append((shard, low, high, start, end))
+    return partitions
+
+def get_aggregation_executor(workers):
+    """The app's aggregation pool, kept between recomputes so workers pay the app import only once"""
+    pool = current_app.extensions.get('arele_aggregation')
+    if pool is not None and pool[0] == workers:
+        return pool[1]
+    if pool is not None:
+        pool[1].shutdown()
+    
+    config = {key: current_app.config[key] for key in AGGREGATION_WORKER_CONFIG if key in current_app.config}
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        # spawn keeps the parent's pooled DB connections out of the worker processes
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=init_aggregation_worker,
+        initargs=(config,)
+    )
+    current_app.extensions['arele_aggregation'] = (workers, executor)
+    return executor
+
+def parallel_ledger_balances(workers, start=None, end=None):
+    """total_ledger_balances() summed by a pool of worker processes, for offline recomputes of a large ledger"""
+    # Several partitions per worker keep the pool busy when a few products hold most of the movements
+    partitions = ledger_partitions(workers * 4, start, end)
+    if not partitions:
+        return {}
+    
+    executor = get_aggregation_executor(workers)
+    db.session.remove()
+    return merge_ledger_totals(executor.map(aggregate_ledger_partition, *zip(*partitions)))
+
+def recompute_ledger_balances(workers=1, start=None, end=None):
+    """Ledger totals from the worker pool when it can win, otherwise from the single GROUP BY query"""
+    workers = min(workers, os.cpu_count() or 1)
+    if workers < 2:
+        return total_ledger_balances(start, end)
+    movements = sum(fan_out(lambda: db.session.query(func.count(ProductMovement.id)).scalar()))
+    if movements < current_app.config['AGGREGATION_MIN_MOVEMENTS']:
+        return total_ledger_balances(start, end)
+    return parallel_ledger_balances(workers, start, end)
+
+def pair_ledger_totals(product_id, location_id):
+    """(incoming, outgoing) for one pair from the active shard's ledger"""
+    def total(column):
+        return db.session.query(func.coalesce(func.sum(ProductMovement.qty), 0)).filter(
+            ProductMovement.product_id == product_id,
+            column == location_id
+        ).scalar()
+    return {(product_id, location_id): (total(ProductMovement.to_location_id), total(ProductMovement.from_location_id))}
+
+def repair_stock_balances(pairs):
+    """Rewrite the stored balance of each (product_id, location_id) pair from its totals across every shard"""
+    table = StockBalance.__table__
+    for product_id, location_id in pairs:
+        with ledger_shard(location_shard(location_id)):
+            try:
+                # Every movement touching the pair locks its owning shard, so the totals cannot move underneath
+                lock_stock_for_write()
+                totals = merge_ledger_totals(fan_out(lambda: pair_ledger_totals(product_id, location_id)))
+                incoming, outgoing = totals[(product_id, location_id)]
+                db.session.execute(table.delete().where(table.c.product_id == product_id, table.c.location_id == location_id))
+                if incoming or outgoing:
+                    db.session.execute(table.insert().values(
+                        product_id=product_id,
+                        location_id=location_id,
+                        incoming=incoming,
+                        outgoing=outgoing,
+                        balance=incoming - outgoing
+                    ))
+                bump_version('movements')
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+    invalidate_dashboard_stats()
+
+def latest_compaction():
+    return LedgerCompaction.query.order_by(LedgerCompaction.before.desc()).first()
+
+def latest_snapshot_before(as_of):
+    query = BalanceSnapshot.query.filter(BalanceSnapshot.taken_at <= as_of)
+    
+    # Opening-balance entries sit just before the compaction cutoff, so older snapshots would count them twice
+    compaction = latest_compaction()
+    if compaction is not None:
+        query = query.filter(BalanceSnapshot.taken_at >= compaction.before)
+    return query.order_by(BalanceSnapshot.taken_at.desc()).first()
+
+def balance_totals_as_of(as_of):
+    """(incoming, outgoing) per pair for movements before as_of: nearest snapshot plus a bounded delta scan"""
+    compaction = latest_compaction()
+    if compaction is not None and as_of < compaction.before:
+        return compute_ledger_balances(end=as_of, model=ArchivedMovement)
+    
+    snapshot = latest_snapshot_before(as_of)
+    totals = {}
+    if snapshot is not None:
+        for row in db.session.query(
+            BalanceSnapshotRow.product_id,
+            BalanceSnapshotRow.location_id,
+            BalanceSnapshotRow.incoming,
+            BalanceSnapshotRow.outgoing
+        ).filter(BalanceSnapshotRow.snapshot_id == snapshot.id):
+            totals[(row.product_id, row.location_id)] = (row.incoming, row.outgoing)
+    
+    delta = total_ledger_balances(snapshot.taken_at if snapshot else None, as_of)
+    for key, (incoming, outgoing) in delta.items():
+        base_incoming, base_outgoing = totals.get(key, (0, 0))
+        totals[key] = (base_incoming + incoming, base_outgoing + outgoing)
+    
+    return totals
+
+def take_balance_snapshot(taken_at=None):
+    """Store balances for every movement before taken_at (default: now minus the grace window)"""
+    if taken_at is None:
+        taken_at = datetime.utcnow() - timedelta(seconds=current_app.config['SNAPSHOT_GRACE_SECONDS'])
+    
+    latest = latest_snapshot_before(datetime.max)
+    if latest is not None and latest.taken_at >= taken_at:
+        return latest
+    
+    totals = balance_totals_as_of(taken_at)
+    snapshot = BalanceSnapshot(taken_at=taken_at)
+    db.session.add(snapshot)
+    db.session.flush()
+    
+    rows = [
+        {
+            'snapshot_id': snapshot.id,
+            'product_id': product_id,
+            'location_id': location_id,
+            'incoming': incoming,
+            'outgoing': outgoing,
+            'balance': incoming - outgoing
+        }
+        for (product_id, location_id), (incoming, outgoing) in totals.items()
+    ]
+    if rows:
+        db.session.execute(BalanceSnapshotRow.__table__.insert(), rows)
+    db.session.commit()
+    return snapshot
+
+def find_balance_drift(ledger_totals):
+    """Compare stock_balances against ledger totals, returning mismatched pairs"""
+    owners = location_shards() if sharding_enabled() else {}
+    stored = {}
+    drift = []
+    for shard, rows in zip(ledger_shards(), fan_out(lambda: StockBalance.query.all())):
+        for row in rows:
+            key = (row.product_id, row.location_id)
+            if owners.get(row.location_id) != shard:
+                # A row on a shard that does not own the location is never read, so it is drift in itself
+                drift.append((key, None, (row.incoming, row.outgoing, row.balance)))
+                continue
+            stored[key] = (row.incoming, row.outgoing, row.balance)
+    
+    for key in sorted(set(stored) | set(ledger_totals)):
+        incoming, outgoing = ledger_totals.get(key, (0, 0))
+        expected = (incoming, outgoing, incoming - outgoing)
+        actual = stored.get(key)
+        if actual != expected:
+            drift.append((key, expected, actual))
+    
+    return drift
+
+def rebuild_stock_balances(ledger_totals=None):
+    """Replace the contents of stock_balances with totals from the ledger"""
+    if ledger_totals is None:
+        ledger_totals = total_ledger_balances()
+    
+    # Each balance row lives on the shard that owns its location
+    owners = location_shards() if sharding_enabled() else {}
+    rows_by_shard = {shard: [] for shard in ledger_shards()}
+    for (product_id, location_id), (incoming, outgoing) in ledger_totals.items():
+        rows_by_shard[owners.get(location_id)].append({
+            'product_id': product_id,
+            'location_id': location_id,
+            'incoming': incoming,
+            'outgoing': outgoing,
+            'balance': incoming - outgoing
+        })
     
-    # Main query joining everything together
-    query = db.session.query(
+    for shard, rows in rows_by_shard.items():
+        with ledger_shard(shard):
+            db.session.execute(StockBalance.__table__.delete())
+            if rows:
+                db.session.execute(StockBalance.__table__.insert(), rows)
+            bump_version('movements')
+            db.session.commit()
+    invalidate_dashboard_stats()
+    evaluate_stock_alerts()
+    return len(ledger_totals)
+
+def compact_ledger(before):
+    """Archive movements older than before and replace them with opening-balance entries"""
+    if sharding_enabled():
+        raise ValueError('Ledger compaction is not supported while the ledger is sharded.')
+    lock_stock_for_write()
+    
+    previous = latest_compaction()
+    if previous is not None and before <= previous.before:
+        raise ValueError(f"The ledger is already compacted up to {previous.before.isoformat()}.")
+    
+    totals = compute_ledger_balances(end=before)
+    live = ProductMovement.__table__
+    archive = ArchivedMovement.__table__
+    
+    # Earlier opening entries are dropped rather than archived: their originals are already in the archive
+    archived = db.session.execute(archive.insert().from_select(
+        [column.name for column in live.columns],
+        select(*live.columns).where(live.c.timestamp < before, live.c.user_id != COMPACTION_USER)
+    )).rowcount
+    db.session.execute(live.delete().where(live.c.timestamp < before))
+    
+    # A receipt for each pair's archived inflow and an issue for its outflow keep
+    # both stock_balances columns reproducible from the live ledger alone
+    opening_at = before - timedelta(microseconds=1)
+    note = f'Opening balance (ledger compacted before {before.isoformat()})'
+    rows = []
+    for (product_id, location_id), (incoming, outgoing) in sorted(totals.items()):
+        for from_location_id, to_location_id, qty in ((None, location_id, incoming), (location_id, None, outgoing)):
+            if qty:
+                rows.append({
+                    'id': str(uuid.uuid4()),
+                    'timestamp': opening_at,
+                    'product_id': product_id,
+                    'from_location_id': from_location_id,
+                    'to_location_id': to_location_id,
+                    'qty': qty,
+                    'note': note,
+                    'user_id': COMPACTION_USER
+                })
+    if rows:
+        db.session.execute(live.insert(), rows)
+    
+    # Core deletes skip the ORM cascade, so remove the snapshots' rows first
+    stale_snapshots = select(BalanceSnapshot.id).where(BalanceSnapshot.taken_at < before)
+    db.session.execute(BalanceSnapshotRow.__table__.delete().where(BalanceSnapshotRow.snapshot_id.in_(stale_snapshots)))
+    db.session.execute(BalanceSnapshot.__table__.delete().where(BalanceSnapshot.taken_at < before))
+    compaction = LedgerCompaction(before=before, archived=archived, opening_entries=len(rows))
+    db.session.add(compaction)
+    bump_version('movements')
+    db.session.commit()
+    invalidate_dashboard_stats()
+    return compaction
+
+def init_db():
+    # Every model lives on the default bind; db.metadatas also keeps the shard keys of any other app built in this process
+    db.create_all(bind_key=None)
+    
+    # create_all skips tables that already exist, so add indexes introduced later
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    
+    if sharding_enabled():
+        metadata, tables = shard_ledger_tables()
+        for shard in ledger_shards()[1:]:
+            metadata.create_all(db.engines[shard])
+            for table in tables:
+                for index in table.indexes:
+                    index.create(db.engines[shard], checkfirst=True)
+    
+    # Databases created before stock_balances existed need a one-off backfill
+    if StockBalance.query.first() is None and ProductMovement.query.first() is not None:
+        rebuild_stock_balances()
+    # ... and likewise for movement_rollups
+    backfill_movement_rollups()
+
+def inventory_balances_query():
+    return db.session.query(
         Product.name.label('product_name'),
         Location.name.label('location_name'),
         Product.sku.label('sku'),
-        func.coalesce(incoming_subquery.c.incoming_qty, 0).label('incoming'),
-        func.coalesce(outgoing_subquery.c.outgoing_qty, 0).label('outgoing'),
-        (func.coalesce(incoming_subquery.c.incoming_qty, 0) - func.coalesce(outgoing_subquery.c.outgoing_qty, 0)).label('balance')
-    ).select_from(
-        product_location_pairs
+        StockBalance.incoming.label('incoming'),
+        StockBalance.outgoing.label('outgoing'),
+        StockBalance.balance.label('balance'),
+        StockBalance.product_id.label('product_id'),
+        StockBalance.location_id.label('location_id')
     ).join(
-        Product, product_location_pairs.c.product_id == Product.id
+        Product, StockBalance.product_id == Product.id
     ).join(
-        Location, product_location_pairs.c.location_id == Location.id
-    ).outerjoin(
-        incoming_subquery, 
-        and_(
-            incoming_subquery.c.product_id == product_location_pairs.c.product_id,
-            incoming_subquery.c.location_id == product_location_pairs.c.location_id
-        )
-    ).outerjoin(
-        outgoing_subquery,
-        and_(
-            outgoing_subquery.c.product_id == product_location_pairs.c.product_id,
-            outgoing_subquery.c.location_id == product_location_pairs.c.location_id
-        )
+        Location, StockBalance.location_id == Location.id
     ).order_by(
-        Product.name, 
+        Product.name,
         Location.name
     )
+
+BalanceRow = namedtuple('BalanceRow', [
+    'product_name', 'location_name', 'sku', 'incoming', 'outgoing', 'balance', 'product_id', 'location_id'
+])
+
+def catalog_balance_rows(totals):
+    """BalanceRows for (incoming, outgoing) totals keyed by pair, named from the catalog and sorted like inventory_balances_query()"""
+    product_ids = {product_id for product_id, _ in totals}
+    location_ids = {location_id for _, location_id in totals}
+    products = {
+        row.id: row for row in db.session.query(Product.id, Product.name, Product.sku).filter(Product.id.in_(product_ids))
+    }
+    locations = dict(db.session.query(Location.id, Location.name).filter(Location.id.in_(location_ids)))
     
-    return query.all()
+    balances = [
+        BalanceRow(
+            products[product_id].name,
+            locations[location_id],
+            products[product_id].sku,
+            incoming,
+            outgoing,
+            incoming - outgoing,
+            product_id,
+            location_id
+        )
+        for (product_id, location_id), (incoming, outgoing) in totals.items()
+        if product_id in products and location_id in locations
+    ]
+    balances.sort(key=lambda row: (row.product_name, row.location_name))
+    return balances
 
-def get_movement_log(product_id=None, location_id=None):
+def inventory_balance_rows(pairs=None):
+    """Current balance rows, optionally only some (product_id, location_id) pairs, gathered from every ledger shard"""
+    if not sharding_enabled():
+        query = inventory_balances_query()
+        if pairs is not None:
+            query = query.filter(pair_filter(StockBalance.product_id, StockBalance.location_id, pairs))
+        return query.all()
+    
+    # Shards hold no catalog tables, so join the names in after collecting the bare balance rows
+    def load():
+        query = StockBalance.query
+        if pairs is not None:
+            query = query.filter(pair_filter(StockBalance.product_id, StockBalance.location_id, pairs))
+        return query.all()
+    
+    return catalog_balance_rows({
+        (row.product_id, row.location_id): (row.incoming, row.outgoing)
+        for rows in fan_out(load)
+        for row in rows
+    })
+
+def get_inventory_balances(as_of=None):
+    if as_of is None:
+        return inventory_balance_rows()
+    return catalog_balance_rows(balance_totals_as_of(as_of))
+
+MovementPage = namedtuple('MovementPage', ['rows', 'next_cursor', 'prev_cursor'])
+
+def encode_cursor(movement):
+    raw = f"{movement.timestamp.isoformat()}|{movement.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Turn a page cursor back into a (timestamp, id) key, or None if it is malformed"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, movement_id = raw.split('|', 1)
+        return datetime.fromisoformat(timestamp), movement_id
+    except ValueError:
+        return None
+
+def movement_log_query(product_id=None, location_id=None, cursor=None, backwards=False, limit=None, start=None, end=None,
+                       model=ProductMovement, exclude_opening=False, with_catalog=True):
+    """Movement rows newest first, optionally starting after a (timestamp, id) keyset cursor"""
     FromLocation = aliased(Location) 
     ToLocation = aliased(Location)   
 
-    query = db.session.query(
-        ProductMovement, 
-        Product, 
-        FromLocation, 
-        ToLocation    
-    ).outerjoin(
-        Product, ProductMovement.product_id == Product.id
-    ).outerjoin(
-        FromLocation, ProductMovement.from_location_id == FromLocation.id 
-    ).outerjoin(
-        ToLocation, ProductMovement.to_location_id == ToLocation.id       
-    )
+    if with_catalog:
+        query = db.session.query(
+            model, 
+            Product, 
+            FromLocation, 
+            ToLocation    
+        ).outerjoin(
+            Product, model.product_id == Product.id
+        ).outerjoin(
+            FromLocation, model.from_location_id == FromLocation.id 
+        ).outerjoin(
+            ToLocation, model.to_location_id == ToLocation.id       
+        )
+    else:
+        query = db.session.query(model)
+    
+    key = tuple_(model.timestamp, model.id)
+    if backwards:
+        order = (model.timestamp.asc(), model.id.asc())
+        after_cursor = key > cursor if cursor else None
+    else:
+        order = (model.timestamp.desc(), model.id.desc())
+        after_cursor = key < cursor if cursor else None
     
     if product_id:
-        query = query.filter(ProductMovement.product_id == product_id)
+        query = query.filter(model.product_id == product_id)
+    
+    if exclude_opening:
+        query = query.filter(model.user_id != COMPACTION_USER)
+    
+    if start:
+        query = query.filter(model.timestamp >= start)
     
-    if location_id:
+    if end:
+        query = query.filter(model.timestamp < end)
+    
+    if location_id and limit:
+        # An OR across both location columns forces a sort of the location's whole
+        # history; walk each (location, timestamp, id) index for one page instead.
+        candidates = []
+        for column in (model.from_location_id, model.to_location_id):
+            keys = db.session.query(model.id).filter(column == location_id)
+            if product_id:
+                keys = keys.filter(model.product_id == product_id)
+            if exclude_opening:
+                keys = keys.filter(model.user_id != COMPACTION_USER)
+            if start:
+                keys = keys.filter(model.timestamp >= start)
+            if end:
+                keys = keys.filter(model.timestamp < end)
+            if after_cursor is not None:
+                keys = keys.filter(after_cursor)
+            candidates.append(keys.order_by(*order).limit(limit).subquery())
+        query = query.filter(
+            model.id.in_(union_all(*(select(keys.c.id) for keys in candidates)))
+        )
+    elif location_id:
         query = query.filter(
             or_(
-                ProductMovement.from_location_id == location_id,
-                ProductMovement.to_location_id == location_id
+                model.from_location_id == location_id,
+                model.to_location_id == location_id
             )
         )
     
-    return query.order_by(ProductMovement.timestamp.desc()).all()
+    if after_cursor is not None:
+        query = query.filter(after_cursor)
+    
+    query = query.order_by(*order)
+    if limit:
+        query = query.limit(limit)
+    return query
+
+def movement_sort_key(row):
+    return row[0].timestamp, row[0].id
+
+def ledger_movement_rows(product_id=None, location_id=None, cursor=None, backwards=False, limit=None, start=None, end=None,
+                         exclude_opening=False):
+    """movement_log_query() rows from the live ledger; with sharding, every shard's rows merged in log order"""
+    if not sharding_enabled():
+        return movement_log_query(product_id, location_id, cursor, backwards, limit, start, end,
+                                  exclude_opening=exclude_opening).all()
+    
+    # The same keyset applies on every shard, so the merged page is the head of the per-shard pages
+    movements = list(islice(heapq.merge(*fan_out(lambda: movement_log_query(
+        product_id, location_id, cursor, backwards, limit, start, end,
+        exclude_opening=exclude_opening, with_catalog=False
+    ).all()), key=lambda movement: (movement.timestamp, movement.id), reverse=not backwards), limit))
+    
+    products = {
+        product.id: product
+        for product in Product.query.filter(Product.id.in_({movement.product_id for movement in movements}))
+    }
+    location_ids = {movement.from_location_id for movement in movements} | {movement.to_location_id for movement in movements}
+    locations = {location.id: location for location in Location.query.filter(Location.id.in_(location_ids - {None}))}
+    return [
+        (movement, products.get(movement.product_id), locations.get(movement.from_location_id), locations.get(movement.to_location_id))
+        for movement in movements
+    ]
+
+def get_movement_log(product_id=None, location_id=None, start=None, end=None, include_archived=False):
+    """Full movement history; with include_archived, compacted originals replace their opening entries"""
+    rows = ledger_movement_rows(product_id, location_id, start=start, end=end, exclude_opening=include_archived)
+    if include_archived:
+        archived = movement_log_query(product_id, location_id, start=start, end=end, model=ArchivedMovement).all()
+        rows = list(heapq.merge(rows, archived, key=movement_sort_key, reverse=True))
+    return rows
+
+def get_movement_page(product_id=None, location_id=None, after=None, before=None, page_size=None, start=None, end=None,
+                      include_archived=False):
+    """One page of the movement log plus cursors for the older and newer neighbours"""
+    page_size = page_size or current_app.config['MOVEMENTS_PAGE_SIZE']
+    backwards = bool(before) and decode_cursor(before) is not None
+    cursor = decode_cursor(before if backwards else after)
+    
+    rows = ledger_movement_rows(product_id, location_id, cursor, backwards, page_size + 1, start, end,
+                                exclude_opening=include_archived)
+    if include_archived:
+        # The same keyset applies to both tables, so one page is the head of the merged pages
+        archived = movement_log_query(product_id, location_id, cursor, backwards, page_size + 1, start, end,
+                                      model=ArchivedMovement).all()
+        rows = list(heapq.merge(rows, archived, key=movement_sort_key, reverse=not backwards))[:page_size + 1]
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+    
+    if not rows:
+        return MovementPage(rows, None, None)
+    
+    first, last = rows[0][0], rows[-1][0]
+    if backwards:
+        next_cursor = encode_cursor(last)
+        prev_cursor = encode_cursor(first) if has_more else None
+    else:
+        next_cursor = encode_cursor(last) if has_more else None
+        prev_cursor = encode_cursor(first) if cursor else None
+    
+    return MovementPage(rows, next_cursor, prev_cursor)
+
+@setup.template_global()
+def page_url(**cursor):
+    """URL for the current view with the same filters but a different page cursor"""
+    args = request.args.to_dict()
+    args.pop('after', None)
+    args.pop('before', None)
+    args.update({key: value for key, value in cursor.items() if value})
+    return url_for(request.endpoint, **args)
+
+def parse_date_arg(value, end_of_day=False):
+    """Parse a YYYY-MM-DD or ISO timestamp query argument; bare end dates include the whole day"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+def requested_date_range():
+    return (
+        parse_date_arg(request.args.get('date_from')),
+        parse_date_arg(request.args.get('date_to'), end_of_day=True)
+    )
+
+def requested_page_size():
+    per_page = request.args.get('per_page', type=int)
+    if not per_page or per_page < 1:
+        return current_app.config['MOVEMENTS_PAGE_SIZE']
+    return min(per_page, current_app.config['MOVEMENTS_MAX_PAGE_SIZE'])
+
+def movements_for_product(product_id):
+    return ProductMovement.query.filter(ProductMovement.product_id == product_id)
+
+def has_movements(query):
+    """Whether a movements_for_*() query matches a row on any ledger shard"""
+    return any(fan_out(lambda: query().first() is not None))
 
-@app.cli.command('seed')
+def movements_for_location(location_id):
+    return ProductMovement.query.filter(
+        or_(
+            ProductMovement.to_location_id == location_id,
+            ProductMovement.from_location_id == location_id
+        )
+    )
+
+@setup.cli.command('init-db')
+def init_db_command():
+    init_db()
+    print("Database initialized.")
+
+@setup.cli.command('rebuild-balances')
+@click.option('--check-only', is_flag=True, help='Report drift without rewriting stock_balances.')
+@click.option('--workers', default=1, show_default=True,
+              help='Worker processes summing the ledger in parallel. Capped at the CPU count; ledgers below '
+                   'AGGREGATION_MIN_MOVEMENTS (5M) use the single query, which wins below that size.')
+def rebuild_balances_command(check_only, workers):
+    init_db()
+    ledger_totals = recompute_ledger_balances(workers)
+    drift = find_balance_drift(ledger_totals)
+    
+    for (product_id, location_id), expected, actual in drift[:20]:
+        print(f"Drift for product {product_id} at {location_id}: expected {expected}, stored {actual}")
+    if len(drift) > 20:
+        print(f"... and {len(drift) - 20} more")
+    print(f"{len(drift)} drifted balance rows found.")
+    
+    if check_only:
+        if drift:
+            raise SystemExit(1)
+        return
+    
+    count = rebuild_stock_balances(ledger_totals)
+    print(f"Rebuilt {count} balance rows from the ledger.")
+
+@setup.cli.command('compact-ledger')
+@click.option('--before', required=True, help='Archive movements older than this date (YYYY-MM-DD or ISO timestamp).')
+def compact_ledger_command(before):
+    """Move old movements to the archive table, leaving opening-balance entries in their place"""
+    init_db()
+    cutoff = parse_date_arg(before)
+    if cutoff is None:
+        raise click.BadParameter('Use YYYY-MM-DD or an ISO timestamp.', param_hint='--before')
+    if cutoff > datetime.utcnow() - timedelta(seconds=current_app.config['SNAPSHOT_GRACE_SECONDS']):
+        raise click.BadParameter('The cutoff must be in the past, outside the snapshot grace window.', param_hint='--before')
+    
+    try:
+        compaction = compact_ledger(cutoff)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    
+    print(f"Archived {compaction.archived} movements before {cutoff.isoformat()}; "
+          f"wrote {compaction.opening_entries} opening-balance entries.")
+    drift = find_balance_drift(compute_ledger_balances())
+    print(f"{len(drift)} drifted balance rows found.")
+    if drift:
+        raise SystemExit(1)
+
+@setup.cli.command('evaluate-alerts')
+def evaluate_alerts_command():
+    """Re-evaluate stock alerts for every product/location pair"""
+    init_db()
+    raised, resolved = evaluate_stock_alerts()
+    print(f"Raised {raised} alerts, resolved {resolved}; {alerts_query().count()} open.")
+
+def uuid_key_columns():
+    """(table name, column names) for every column declared as UUIDKey"""
+    return [
+        (table.name, [column.name for column in table.columns if isinstance(column.type, UUIDKey)])
+        for table in db.metadata.sorted_tables
+        if any(isinstance(column.type, UUIDKey) for column in table.columns)
+    ]
+
+def convert_uuid_keys(to_binary, batch_size=10000):
+    """Rewrite every UUID key in place between 36-char text and 16-byte blobs; returns rows touched"""
+    def convert(value):
+        if to_binary and isinstance(value, str) and len(value) == 36:
+            return uuid.UUID(value).bytes
+        if not to_binary and isinstance(value, bytes) and len(value) == 16:
+            return str(uuid.UUID(bytes=value))
+        return value
+    
+    lock_stock_for_write()
+    connection = db.session.connection()
+    touched = 0
+    for table, columns in uuid_key_columns():
+        # Raw SQL on rowid so values come back exactly as stored, bypassing UUIDKey
+        select_sql = f"SELECT rowid, {', '.join(columns)} FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?"
+        update_sql = f"UPDATE {table} SET {', '.join(f'{column} = ?' for column in columns)} WHERE rowid = ?"
+        last_rowid = 0
+        while True:
+            rows = connection.exec_driver_sql(select_sql, (last_rowid, batch_size)).fetchall()
+            if not rows:
+                break
+            last_rowid = rows[-1][0]
+            updates = [
+                tuple(convert(value) for value in row[1:]) + (row[0],)
+                for row in rows
+                if any(convert(value) is not value for value in row[1:])
+            ]
+            if updates:
+                connection.exec_driver_sql(update_sql, updates)
+                touched += len(updates)
+    db.session.commit()
+    return touched
+
+def sqlite_database_path():
+    return db.engine.url.database if db.engine.dialect.name == 'sqlite' else None
+
+def vacuum_database():
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.exec_driver_sql('VACUUM')
+
+@setup.cli.command('migrate-uuid-keys')
+@click.option('--revert', is_flag=True, help='Convert 16-byte keys back to 36-character text.')
+def migrate_uuid_keys_command(revert):
+    """Convert UUID primary and foreign keys of a SQLite database to 16-byte blobs (or back)"""
+    path = sqlite_database_path()
+    if path is None:
+        raise click.ClickException('Compact UUID keys are only supported on SQLite.')
+    if sharding_enabled():
+        raise click.ClickException('Compact UUID keys are not supported while the ledger is sharded.')
+    
+    init_db()
+    size_before = os.path.getsize(path)
+    started = time.perf_counter()
+    touched = convert_uuid_keys(to_binary=not revert)
+    vacuum_database()
+    elapsed = time.perf_counter() - started
+    
+    print(f"Converted {touched} rows in {elapsed:.1f}s; database {size_before / 1048576:.1f} MB -> "
+          f"{os.path.getsize(path) / 1048576:.1f} MB.")
+    print(f"Now {'unset' if revert else 'set'} COMPACT_UUID_KEYS (e.g. ARELE_COMPACT_UUID_KEYS={'false' if revert else 'true'}) and restart.")
+
+@setup.cli.command('snapshot-balances')
+@click.option('--at', 'taken_at', default=None, help='Cutoff timestamp (UTC, ISO format); defaults to now minus SNAPSHOT_GRACE_SECONDS.')
+def snapshot_balances_command(taken_at):
+    """Store a point-in-time balance snapshot; schedule daily for fast as-of reports"""
+    cutoff = parse_date_arg(taken_at)
+    if taken_at and cutoff is None:
+        raise click.BadParameter('Expected an ISO date or timestamp.', param_hint='--at')
+    
+    snapshot = take_balance_snapshot(cutoff)
+    count = BalanceSnapshotRow.query.filter_by(snapshot_id=snapshot.id).count()
+    print(f"Snapshot {snapshot.id} covers movements before {snapshot.taken_at} ({count} balance rows).")
+
+@setup.cli.command('import-movements')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['json', 'csv']), default=None, help='Defaults to the file extension.')
+@click.option('--chunk-size', default=None, type=int, help='Rows per transaction (default BULK_CHUNK_SIZE).')
+def import_movements_command(path, fmt, chunk_size):
+    """Bulk-load movements from a JSON or CSV file"""
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'json')
+    with open(path, encoding='utf-8') as handle:
+        records = parse_movement_records(handle.read(), fmt)
+    
+    started = datetime.now()
+    try:
+        result = ingest_movements(records, chunk_size)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    elapsed = (datetime.now() - started).total_seconds()
+    
+    for error in result['errors'][:20]:
+        print(f"Row {error['row']}: {error['error']}")
+    if result['rejected'] > 20:
+        print(f"... and {result['rejected'] - 20} more rejected rows")
+    rate = result['inserted'] / elapsed if elapsed else 0
+    print(f"Imported {result['inserted']} movements, rejected {result['rejected']} ({elapsed:.2f}s, {rate:.0f} rows/s).")
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+@setup.cli.command('seed')
 def seed_database():
-    db.create_all()
+    init_db()
     
     products_data = [
         {'name': 'Laptop Pro X', 'sku': 'LPX-2025', 'description': 'High-performance laptop for professionals', 'unit_of_measure': 'unit'},
@@ -189,6 +1742,8 @@ def seed_database():
             location = Location(**location_data)
             db.session.add(location)
     
+    bump_version('products')
+    bump_version('locations')
     db.session.commit()
     
     products = Product.query.all()
@@ -259,38 +1814,348 @@ def seed_database():
             note=movement_data['note'],
             user_id='SYSTEM_ADMIN'
         )
-        db.session.add(movement)
+        # A movement lives on the shard of its source location (its destination for receipts)
+        with ledger_shard(location_shard(movement.from_location_id or movement.to_location_id)):
+            db.session.add(movement)
+            db.session.flush()
+        apply_movement_to_balances(movement)
+        apply_movement_to_rollups(movement)
     
+    bump_version('movements')
     db.session.commit()
+    if sharding_enabled():
+        # apply_movement_to_balances() wrote every row to the default database; place them on their shards
+        rebuild_stock_balances()
+        rebuild_movement_rollups()
+    invalidate_dashboard_stats()
     print("Database seeded successfully!")
 
-@app.route('/')
+PERF_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+def get_perf_buffer():
+    """Ring buffer of the most recent request timings"""
+    if 'arele_perf' not in current_app.extensions:
+        current_app.extensions['arele_perf'] = (deque(maxlen=current_app.config['PERF_BUFFER_SIZE']), threading.Lock())
+    return current_app.extensions['arele_perf']
+
+def current_perf():
+    if has_request_context():
+        return g.get('perf')
+    return None
+
+def perf_span(name, elapsed_ms):
+    """Add time spent in a named phase (template, pdf, ...) to the current request"""
+    perf = current_perf()
+    if perf is not None:
+        perf['spans'][name] = perf['spans'].get(name, 0.0) + elapsed_ms
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def perf_before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_perf() is not None:
+        conn.info.setdefault('perf_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def perf_after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    perf = current_perf()
+    started = conn.info.get('perf_started')
+    if perf is None or not started:
+        return
+    
+    elapsed_ms = (time.perf_counter() - started.pop()) * 1000
+    perf['queries'] += 1
+    perf['db_ms'] += elapsed_ms
+    # Min-heap keeps only the slowest statements without sorting every query
+    heapq.heappush(perf['slowest'], (elapsed_ms, perf['queries'], ' '.join(statement.split())))
+    if len(perf['slowest']) > current_app.config['PERF_SLOW_STATEMENTS']:
+        heapq.heappop(perf['slowest'])
+
+@setup.connect_via(before_render_template)
+def perf_template_started(sender, template, context, **extra):
+    perf = current_perf()
+    if perf is not None:
+        perf['template_started'].append(time.perf_counter())
+
+@setup.connect_via(template_rendered)
+def perf_template_finished(sender, template, context, **extra):
+    perf = current_perf()
+    if perf is not None and perf['template_started']:
+        perf_span('template', (time.perf_counter() - perf['template_started'].pop()) * 1000)
+
+@setup.before_request
+def start_request_timing():
+    if current_app.config['PERF_INSTRUMENTATION']:
+        g.perf = {
+            'started': time.perf_counter(), 'queries': 0, 'db_ms': 0.0,
+            'slowest': [], 'spans': {}, 'template_started': []
+        }
+
+@setup.after_request
+def record_request_timing(response):
+    perf = g.pop('perf', None)
+    if perf is None:
+        return response
+    
+    total_ms = (time.perf_counter() - perf['started']) * 1000
+    timings = [f'db;dur={perf["db_ms"]:.1f};desc="{perf["queries"]} queries"']
+    timings += [f'{name};dur={elapsed_ms:.1f}' for name, elapsed_ms in perf['spans'].items()]
+    timings.append(f'total;dur={total_ms:.1f}')
+    response.headers['Server-Timing'] = ', '.join(timings)
+    
+    if request.endpoint != 'debug_perf':
+        records, lock = get_perf_buffer()
+        with lock:
+            records.append({
+                'endpoint': request.endpoint or '<unmatched>',
+                'method': request.method,
+                'path': request.full_path.rstrip('?'),
+                'status': response.status_code,
+                'at': datetime.utcnow().isoformat(),
+                'total_ms': round(total_ms, 2),
+                'db_ms': round(perf['db_ms'], 2),
+                'queries': perf['queries'],
+                'spans': {name: round(elapsed_ms, 2) for name, elapsed_ms in perf['spans'].items()},
+                'slowest': [
+                    {'ms': round(elapsed_ms, 2), 'statement': statement}
+                    for elapsed_ms, _, statement in sorted(perf['slowest'], reverse=True)
+                ]
+            })
+    return response
+
+def perf_histogram(samples):
+    """Latency counts per bucket; le_ms is the inclusive upper bound, None for the overflow bucket"""
+    counts = [0] * (len(PERF_BUCKETS_MS) + 1)
+    for sample in samples:
+        counts[next((i for i, limit in enumerate(PERF_BUCKETS_MS) if sample <= limit), len(PERF_BUCKETS_MS))] += 1
+    return [{'le_ms': limit, 'count': count} for limit, count in zip(PERF_BUCKETS_MS + (None,), counts)]
+
+@setup.route('/_debug/perf')
+def debug_perf():
+    if not (current_app.debug or current_app.config['PERF_DEBUG_ENDPOINT']):
+        abort(404)
+    
+    records, lock = get_perf_buffer()
+    with lock:
+        records = list(records)
+    
+    routes = {}
+    for record in records:
+        routes.setdefault(record['endpoint'], []).append(record)
+    
+    summary = {}
+    for endpoint, entries in sorted(routes.items()):
+        totals = [entry['total_ms'] for entry in entries]
+        queries = [entry['queries'] for entry in entries]
+        summary[endpoint] = {
+            'requests': len(entries),
+            'p50_ms': percentile(totals, 0.5),
+            'p95_ms': percentile(totals, 0.95),
+            'max_ms': max(totals),
+            'mean_db_ms': round(statistics.mean(entry['db_ms'] for entry in entries), 2),
+            'mean_queries': round(statistics.mean(queries), 1),
+            'max_queries': max(queries),
+            'histogram': perf_histogram(totals),
+            'slowest': max(entries, key=lambda entry: entry['total_ms'])['slowest']
+        }
+    
+    recent = request.args.get('recent', 20, type=int)
+    return jsonify({'routes': summary, 'recent': records[-recent:] if recent > 0 else []})
+
+DASHBOARD_STATS_KEY = 'dashboard_stats'
+
+def compute_dashboard_stats():
+    # Inflow/outflow totals equal the summed incoming/outgoing columns of stock_balances
+    def ledger_stats():
+        inflow, outflow = db.session.query(
+            func.coalesce(func.sum(StockBalance.incoming), 0),
+            func.coalesce(func.sum(StockBalance.outgoing), 0)
+        ).one()
+        return inflow, outflow, ProductMovement.query.count()
+    
+    total_inflow, total_outflow, movement_count = (sum(column) for column in zip(*fan_out(ledger_stats)))
+    return {
+        'product_count': Product.query.count(),
+        'location_count': Location.query.count(),
+        'movement_count': movement_count,
+        'total_inflow': total_inflow,
+        'total_outflow': total_outflow
+    }
+
+def get_dashboard_stats():
+    return get_cache().get_or_set(DASHBOARD_STATS_KEY, compute_dashboard_stats, current_app.config['DASHBOARD_CACHE_TTL'])
+
+def adjust_dashboard_stats(**deltas):
+    """Apply counter deltas to cached dashboard stats; a cold cache is left for the next read"""
+    get_cache().update(
+        DASHBOARD_STATS_KEY,
+        lambda stats: {key: value + deltas.get(key, 0) for key, value in stats.items()}
+    )
+
+def invalidate_dashboard_stats():
+    get_cache().delete(DASHBOARD_STATS_KEY)
+
+CATALOG_FRAGMENTS = {
+    'product_options': ('fragments/product_options.html', 'products'),
+    'product_rows': ('fragments/product_rows.html', 'products'),
+    'location_options': ('fragments/location_options.html', 'locations'),
+    'location_names': ('fragments/location_names.html', 'locations'),
+    'location_rows': ('fragments/location_rows.html', 'locations'),
+}
+
+def catalog_loader(table):
+    model = Product if table == 'products' else Location
+    return model.query.all()
+
+def catalog_fragments(*names):
+    """Rendered catalog fragments keyed by the products/locations versions, so edits invalidate them"""
+    tables = {CATALOG_FRAGMENTS[name][1] for name in names}
+    versions = get_versions(*tables)
+    loaded = {}
+    fragments = {}
+    for name in names:
+        template_name, table = CATALOG_FRAGMENTS[name]
+        
+        def render(template_name=template_name, table=table):
+            if table not in loaded:
+                loaded[table] = catalog_loader(table)
+            return render_template(template_name, rows=loaded[table])
+        
+        key = f'fragment:{name}:{versions[table]}'
+        fragments[name] = Markup(get_cache().get_or_set(key, render, current_app.config['FRAGMENT_CACHE_TTL']))
+    return fragments
+
+def mark_selected(options, value):
+    """Pre-select one option in a cached <option> list"""
+    if not value or options is None:
+        return options
+    marker = f'value="{escape(value)}"'
+    return Markup(str(options).replace(marker, f'{marker} selected', 1))
+
+def search_text(value):
+    """Case-folded words of a name or SKU, with punctuation treated as a word break"""
+    return ' '.join(re.findall(r'\w+', value.casefold())) if value else ''
+
+@lru_cache(maxsize=65536)
+def word_trigrams(word):
+    """Trigrams of one word, padded so its start and end carry extra weight"""
+    padded = f'  {word} '
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+def trigrams(text):
+    return frozenset().union(*map(word_trigrams, text.split()))
+
+class CatalogSearchIndex:
+    """In-memory prefix and trigram index over catalog names and codes (SKUs), built for one catalog version"""
+    
+    def __init__(self, entries, version=None):
+        # entries: (id, label, name, code) tuples
+        self.entries = entries
+        self.version = version
+        self.labels = {entry[0]: entry[1] for entry in entries}
+        keys = []
+        postings = defaultdict(list)
+        for position, (_, _, name, code) in enumerate(entries):
+            name, code = search_text(name), search_text(code)
+            # Rank 0 keys are the whole name or code; rank 1 keys are later words of the name
+            keys.append((name, 0, position))
+            if code:
+                keys.append((code, 0, position))
+            for word in name.split()[1:]:
+                keys.append((word, 1, position))
+            for gram in trigrams(f'{name} {code}'):
+                postings[gram].append(position)
+        keys.sort()
+        self.keys = keys
+        self.key_text = [key for key, _, _ in keys]
+        self.postings = dict(postings)
+        # Grams shared by a large part of the catalog select too many candidates to be worth scanning,
+        # so they only add to the score of candidates found through rarer grams
+        self.max_posting = max(1000, len(entries) // 20)
+        self.common = {gram: set(posting) for gram, posting in self.postings.items() if len(posting) > self.max_posting}
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def search(self, query, limit=10, min_similarity=0.5):
+        """Best matches first: exact name/code, then prefixes, then fuzzy trigram matches for typos"""
+        query = search_text(query)
+        if not query:
+            return []
+        
+        scores = {}
+        start = bisect.bisect_left(self.key_text, query)
+        # Past limit * 20 prefix hits the rest would only tie, so stop scanning
+        for key, rank, position in self.keys[start:start + limit * 20]:
+            if not key.startswith(query):
+                break
+            score = 3.0 if key == query and rank == 0 else 2.0 - rank * 0.5
+            scores[position] = max(score, scores.get(position, 0))
+        
+        # Fuzzy scores stay below 1, so they only fill places the prefix matches left open
+        if len(scores) < limit:
+            grams = trigrams(query)
+            shared = Counter()
+            common = [self.common[gram] for gram in grams if gram in self.common]
+            for gram in grams:
+                if gram not in self.common:
+                    shared.update(self.postings.get(gram, ()))
+            for position, count in shared.items():
+                similarity = (count + sum(position in posting for posting in common)) / len(grams)
+                if similarity >= min_similarity and position not in scores:
+                    scores[position] = similarity * 0.99
+        
+        best = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], len(self.entries[item[0]][2]), item[0]))
+        return [
+            {'id': self.entries[position][0], 'label': self.entries[position][1], 'score': round(score, 3)}
+            for position, score in best
+        ]
+
+def catalog_search_entries(kind):
+    """(id, label, name, code) rows for a search index, labelled like the catalog <option> fragments"""
+    if kind == 'products':
+        return [
+            (row.id, f'{row.name} ({row.sku})', row.name, row.sku)
+            for row in db.session.query(Product.id, Product.name, Product.sku).order_by(Product.name)
+        ]
+    return [
+        (row.id, f'{row.name} ({row.type})' if row.type else row.name, row.name, None)
+        for row in db.session.query(Location.id, Location.name, Location.type).order_by(Location.name)
+    ]
+
+_search_index_lock = threading.Lock()
+
+def search_index(kind):
+    """This process's index for 'products' or 'locations', rebuilt when that catalog's version moves"""
+    version = get_versions(kind)[kind]
+    indexes = current_app.extensions.setdefault('arele_search', {})
+    index = indexes.get(kind)
+    if index is None or index.version != version:
+        with _search_index_lock:
+            index = indexes.get(kind)
+            if index is None or index.version != version:
+                index = indexes[kind] = CatalogSearchIndex(catalog_search_entries(kind), version)
+    return index
+
+def catalog_choices(product_fragment, location_fragment):
+    """<option> fragments for catalogs small enough for a <select>; larger ones are flagged for a typeahead instead"""
+    threshold = current_app.config['SEARCH_TYPEAHEAD_THRESHOLD']
+    typeahead = {kind: len(search_index(kind)) > threshold for kind in ('products', 'locations')}
+    names = [name for name, kind in ((product_fragment, 'products'), (location_fragment, 'locations')) if not typeahead[kind]]
+    return dict(catalog_fragments(*names), typeahead=typeahead)
+
+@setup.template_global()
+def catalog_label(kind, id):
+    """Typeahead text for a preselected product or location id"""
+    return search_index(kind).labels.get(id, '') if id else ''
+
+@setup.route('/')
 def index():
-    product_count = Product.query.count()
-    location_count = Location.query.count()
-    movement_count = ProductMovement.query.count()
-    
-    total_inflow = db.session.query(func.sum(ProductMovement.qty)).filter(
-        ProductMovement.to_location_id.isnot(None)
-    ).scalar() or 0
-    
-    total_outflow = db.session.query(func.sum(ProductMovement.qty)).filter(
-        ProductMovement.from_location_id.isnot(None)
-    ).scalar() or 0
-    
-    return render_template('index.html', 
-                           product_count=product_count,
-                           location_count=location_count,
-                           movement_count=movement_count,
-                           total_inflow=total_inflow,
-                           total_outflow=total_outflow)
-
-@app.route('/products')
+    return render_template('index.html', **get_dashboard_stats())
+
+@setup.route('/products')
 def products():
-    products = Product.query.all()
-    return render_template('products.html', products=products)
+    return render_template('products.html', **catalog_fragments('product_rows'))
 
-@app.route('/products/add', methods=['GET', 'POST'])
+@setup.route('/products/add', methods=['GET', 'POST'])
 def add_product():
     if request.method == 'POST':
         name = request.form['name']
@@ -310,13 +2175,15 @@ def add_product():
         
         product = Product(name=name, sku=sku, description=description, unit_of_measure=unit_of_measure)
         db.session.add(product)
+        bump_version('products')
         db.session.commit()
+        adjust_dashboard_stats(product_count=1)
         flash('Product added successfully!', 'success')
         return redirect(url_for('products'))
     
     return render_template('add_product.html')
 
-@app.route('/products/edit/<id>', methods=['GET', 'POST'])
+@setup.route('/products/edit/<id>', methods=['GET', 'POST'])
 def edit_product(id):
     product = Product.query.get_or_404(id)
     
@@ -340,32 +2207,35 @@ def edit_product(id):
         product.sku = sku
         product.description = description
         product.unit_of_measure = unit_of_measure
+        bump_version('products')
         db.session.commit()
         flash('Product updated successfully!', 'success')
         return redirect(url_for('products'))
     
     return render_template('edit_product.html', product=product)
 
-@app.route('/products/delete/<id>', methods=['POST'])
+@setup.route('/products/delete/<id>', methods=['POST'])
 def delete_product(id):
     product = Product.query.get_or_404(id)
     
-    movement_count = ProductMovement.query.filter_by(product_id=id).count()
-    if movement_count > 0:
+    if has_movements(lambda: movements_for_product(id)):
         flash('Cannot delete product with existing movements!', 'error')
         return redirect(url_for('products'))
     
+    ReorderThreshold.query.filter_by(product_id=id).delete()
+    StockAlert.query.filter_by(product_id=id).delete()
     db.session.delete(product)
+    bump_version('products')
     db.session.commit()
+    adjust_dashboard_stats(product_count=-1)
     flash('Product deleted successfully!', 'success')
     return redirect(url_for('products'))
 
-@app.route('/locations')
+@setup.route('/locations')
 def locations():
-    locations = Location.query.all()
-    return render_template('locations.html', locations=locations)
+    return render_template('locations.html', **catalog_fragments('location_rows'))
 
-@app.route('/locations/add', methods=['GET', 'POST'])
+@setup.route('/locations/add', methods=['GET', 'POST'])
 def add_location():
     if request.method == 'POST':
         name = request.form['name']
@@ -379,13 +2249,15 @@ def add_location():
         
         location = Location(name=name, address=address, type=type)
         db.session.add(location)
+        bump_version('locations')
         db.session.commit()
+        adjust_dashboard_stats(location_count=1)
         flash('Location added successfully!', 'success')
         return redirect(url_for('locations'))
     
     return render_template('add_location.html')
 
-@app.route('/locations/edit/<id>', methods=['GET', 'POST'])
+@setup.route('/locations/edit/<id>', methods=['GET', 'POST'])
 def edit_location(id):
     location = Location.query.get_or_404(id)
     
@@ -399,52 +2271,48 @@ def edit_location(id):
             flash('Location with this name already exists!', 'error')
             return redirect(url_for('edit_location', id=id))
         
+        if assigned_shard(location.id, name) != assigned_shard(location.id, location.name):
+            flash('Renaming this location would move it to another ledger shard; update LEDGER_SHARDS instead.', 'error')
+            return redirect(url_for('edit_location', id=id))
+        
         location.name = name
         location.address = address
         location.type = type
+        bump_version('locations')
         db.session.commit()
         flash('Location updated successfully!', 'success')
         return redirect(url_for('locations'))
     
     return render_template('edit_location.html', location=location)
 
-@app.route('/locations/delete/<id>', methods=['POST'])
+@setup.route('/locations/delete/<id>', methods=['POST'])
 def delete_location(id):
     location = Location.query.get_or_404(id)
     
-    incoming_count = ProductMovement.query.filter_by(to_location_id=id).count()
-    outgoing_count = ProductMovement.query.filter_by(from_location_id=id).count()
-    
-    if incoming_count > 0 or outgoing_count > 0:
+    if has_movements(lambda: movements_for_location(id)):
         flash('Cannot delete location with existing movements!', 'error')
         return redirect(url_for('locations'))
     
+    ReorderThreshold.query.filter_by(location_id=id).delete()
+    StockAlert.query.filter_by(location_id=id).delete()
     db.session.delete(location)
+    bump_version('locations')
     db.session.commit()
+    adjust_dashboard_stats(location_count=-1)
     flash('Location deleted successfully!', 'success')
     return redirect(url_for('locations'))
 
-@app.route('/movements')
+@setup.route('/movements')
 def movements():
-    FromLocation = aliased(Location) 
-    ToLocation = aliased(Location)   
+    page = get_movement_page(
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        page_size=requested_page_size()
+    )
+    # Only the newest page gets live rows prepended
+    return render_template('movements.html', movements=page.rows, page=page, live=not request.args.get('after') and page.prev_cursor is None)
 
-    movements = db.session.query(
-        ProductMovement, 
-        Product, 
-        FromLocation, 
-        ToLocation    
-    ).outerjoin(
-        Product, ProductMovement.product_id == Product.id
-    ).outerjoin(
-        FromLocation, ProductMovement.from_location_id == FromLocation.id 
-    ).outerjoin(
-        ToLocation, ProductMovement.to_location_id == ToLocation.id       
-    ).order_by(ProductMovement.timestamp.desc()).all()
-    
-    return render_template('movements.html', movements=movements)
-
-@app.route('/movements/add', methods=['GET', 'POST'])
+@setup.route('/movements/add', methods=['GET', 'POST'])
 def add_movement():
     if request.method == 'POST':
         product_id = request.form['product_id']
@@ -461,194 +2329,692 @@ def add_movement():
             flash('Quantity must be greater than 0!', 'error')
             return redirect(url_for('add_movement'))
         
-        if from_location_id:
-            # Subquery for incoming quantity
-            incoming_qty = db.session.query(func.coalesce(func.sum(ProductMovement.qty), 0)).filter(
-                ProductMovement.product_id == product_id,
-                ProductMovement.to_location_id == from_location_id
-            ).scalar()
-            
-            # Subquery for outgoing quantity
-            outgoing_qty = db.session.query(func.coalesce(func.sum(ProductMovement.qty), 0)).filter(
-                ProductMovement.product_id == product_id,
-                ProductMovement.from_location_id == from_location_id
-            ).scalar()
-            
-            current_balance = incoming_qty - outgoing_qty
-            
-            if current_balance - qty < 0:
-                product = Product.query.get(product_id)
-                location = Location.query.get(from_location_id)
-                flash(f'Transaction failed: Insufficient stock ({current_balance} units available) in {location.name} to move {qty} units of {product.name}.', 'error')
-                return redirect(url_for('add_movement'))
+        try:
+            submit_movement(product_id, from_location_id, to_location_id, qty, note)
+        except InsufficientStockError as error:
+            product = Product.query.get(product_id)
+            location = Location.query.get(from_location_id)
+            flash(f'Transaction failed: Insufficient stock ({error.available} units available) in {location.name} to move {qty} units of {product.name}.', 'error')
+            return redirect(url_for('add_movement'))
         
-        movement = ProductMovement(
-            product_id=product_id,
-            from_location_id=from_location_id,
-            to_location_id=to_location_id,
-            qty=qty,
-            note=note,
-            user_id='SYSTEM_ADMIN'
-        )
-        db.session.add(movement)
-        db.session.commit()
         flash('Movement added successfully!', 'success')
         return redirect(url_for('movements'))
     
-    products = Product.query.all()
-    locations = Location.query.all()
-    return render_template('add_movement.html', products=products, locations=locations)
-@app.route('/download_report')
-def download_report():
-    """Generate PDF report of inventory balances"""
-    balances = get_inventory_balances()
-    
-    # Create a buffer for the PDF
-    buffer = io.BytesIO()
-    
-    # Create the PDF object
-    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=1*inch)
-    
-    # Container for the 'Flowable' objects
-    elements = []
-    
-    # Styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        spaceAfter=30,
-        alignment=1,  # Center alignment
+    return render_template('add_movement.html', **catalog_choices('product_options', 'location_options'))
+
+REPORT_GROUPS = ('location',)
+
+def build_inventory_pdf(balances, output, as_of=None, group=None, rows_per_table=None):
+    """Generate PDF report of inventory balances (any iterable, in report order) into a filename or file object"""
+    # ReportLab is imported by the first report rather than by every worker and CLI start
+    import pdf_report
+    if rows_per_table is None:
+        rows_per_table = current_app.config['REPORT_TABLE_ROWS']
+    pdf_report.build_inventory_pdf(balances, output, as_of, group, rows_per_table)
+
+# Report workers also need the settings that decide where and how reports are written
+REPORT_WORKER_CONFIG = AGGREGATION_WORKER_CONFIG + ('REPORT_CACHE_DIR', 'REPORT_CACHE_KEEP', 'REPORT_TABLE_ROWS',
+                                                    'EXPORT_BATCH_SIZE')
+
+_report_app = None
+_report_jobs = {}
+_report_jobs_lock = threading.Lock()
+REPORT_JOB_ID_PATTERN = re.compile(r'^(?:m\d+|a(\d{8}T\d{6})(?:-m\d+)?)-p\d+-l\d+(?:-by-(location))?$')
+
+def report_version(as_of=None, group=None):
+    """Key for cached reports; changes whenever balances or catalog names can change"""
+    versions = get_versions('movements', 'products', 'locations')
+    if as_of is not None:
+        # Balances as of a cutoff older than the snapshot grace window are fixed, so only catalog renames
+        # invalidate them; a cutoff today or in the future still moves with every new movement
+        settled = as_of < datetime.utcnow() - timedelta(seconds=current_app.config['SNAPSHOT_GRACE_SECONDS'])
+        pending = '' if settled else '-m{movements}'.format(**versions)
+        version = 'a{as_of:%Y%m%dT%H%M%S}{pending}-p{products}-l{locations}'.format(as_of=as_of, pending=pending, **versions)
+    else:
+        version = 'm{movements}-p{products}-l{locations}'.format(**versions)
+    return f'{version}-by-{group}' if group else version
+
+def report_job_as_of(job_id):
+    match = REPORT_JOB_ID_PATTERN.match(job_id)
+    if match and match.group(1):
+        return datetime.strptime(match.group(1), '%Y%m%dT%H%M%S')
+    return None
+
+def report_job_group(job_id):
+    match = REPORT_JOB_ID_PATTERN.match(job_id)
+    return match.group(2) if match else None
+
+def report_cache_path(version):
+    return os.path.join(current_app.config['REPORT_CACHE_DIR'], f'inventory_report_{version}.pdf')
+
+def prune_report_cache(keep):
+    directory = current_app.config['REPORT_CACHE_DIR']
+    reports = sorted(
+        (os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.pdf')),
+        key=os.path.getmtime,
+        reverse=True
     )
+    for path in reports[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def report_balances(as_of=None, group=None):
+    """Balance rows in report order; current balances are streamed from the database in batches"""
+    if as_of is not None or sharding_enabled():
+        balances = get_inventory_balances(as_of)
+        if group == 'location':
+            balances.sort(key=lambda row: (row.location_name, row.product_name))
+        return balances
     
-    # Add title
-    title = Paragraph("Inventory Report - Arele", title_style)
-    elements.append(title)
-    
-    # Add generation date
-    date_style = ParagraphStyle(
-        'CustomDate',
-        parent=styles['Normal'],
-        fontSize=10,
-        alignment=1,
-        spaceAfter=20,
-    )
-    date_text = Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", date_style)
-    elements.append(date_text)
-    
-    # Prepare table data
-    table_data = [['Product', 'SKU', 'Location', 'Incoming', 'Outgoing', 'Balance']]
-    
-    for balance in balances:
-        table_data.append([
-            balance.product_name,
-            balance.sku,
-            balance.location_name,
-            str(balance.incoming),
-            str(balance.outgoing),
-            str(balance.balance)
-        ])
-    
-    # Create table
-    table = Table(table_data, repeatRows=1)
-    
-    # Add style to table
-    table_style = TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f2937')),  # Dark gray header
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9fafb')]),  # Alternate row colors
-    ])
-    
-    # Apply conditional formatting for balance column
-    for i in range(1, len(table_data)):
-        balance_value = balances[i-1].balance
-        if balance_value > 100:
-            table_style.add('BACKGROUND', (5, i), (5, i), colors.HexColor('#10b981'))  # Green
-            table_style.add('TEXTCOLOR', (5, i), (5, i), colors.white)
-        elif balance_value > 0:
-            table_style.add('BACKGROUND', (5, i), (5, i), colors.HexColor('#0ea5e9'))  # Blue
-            table_style.add('TEXTCOLOR', (5, i), (5, i), colors.white)
-        elif balance_value == 0:
-            table_style.add('BACKGROUND', (5, i), (5, i), colors.HexColor('#f59e0b'))  # Amber
-            table_style.add('TEXTCOLOR', (5, i), (5, i), colors.white)
-        else:
-            table_style.add('BACKGROUND', (5, i), (5, i), colors.HexColor('#dc2626'))  # Red
-            table_style.add('TEXTCOLOR', (5, i), (5, i), colors.white)
-    
-    table.setStyle(table_style)
-    elements.append(table)
-    
-    # Add summary
-    if balances:
-        total_items = len(balances)
-        positive_balance = sum(1 for b in balances if b.balance > 0)
-        zero_balance = sum(1 for b in balances if b.balance == 0)
-        negative_balance = sum(1 for b in balances if b.balance < 0)
-        
-        elements.append(Spacer(1, 20))
-        
-        summary_style = ParagraphStyle(
-            'CustomSummary',
-            parent=styles['Normal'],
-            fontSize=10,
-            spaceAfter=5,
+    query = inventory_balances_query()
+    if group == 'location':
+        query = query.order_by(None).order_by(Location.name, Product.name)
+    return query.yield_per(current_app.config['EXPORT_BATCH_SIZE'])
+
+def init_report_worker(config):
+    """Worker-process initializer: build the submitting app's configuration once per process"""
+    global _report_app
+    _report_app = create_app(config)
+
+def render_report_job(path, as_of=None, group=None):
+    """Worker-process entry point: render balances to path atomically, returning the build time in ms"""
+    started = time.perf_counter()
+    partial_path = f'{path}.{os.getpid()}.tmp'
+    with _report_app.app_context():
+        try:
+            build_inventory_pdf(report_balances(as_of, group), partial_path, as_of, group)
+        finally:
+            db.session.remove()
+        os.replace(partial_path, path)
+        prune_report_cache(current_app.config['REPORT_CACHE_KEEP'])
+    return (time.perf_counter() - started) * 1000
+
+def get_report_executor():
+    """The app's report pool, whose workers open the same databases and cache directory as the app"""
+    executor = current_app.extensions.get('arele_reports')
+    if executor is None:
+        config = {key: current_app.config[key] for key in REPORT_WORKER_CONFIG if key in current_app.config}
+        # spawn keeps the parent's pooled DB connections out of the worker processes
+        executor = current_app.extensions['arele_reports'] = ProcessPoolExecutor(
+            max_workers=current_app.config['REPORT_WORKERS'],
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_report_worker,
+            initargs=(config,)
         )
+    return executor
+
+def submit_report_job(version=None, as_of=None, group=None):
+    """Queue a report render for a ledger version, reusing a cached or in-flight one"""
+    version = version or report_version(as_of, group)
+    path = report_cache_path(version)
+    
+    # Jobs are keyed by cache path, so apps with different cache directories never share one
+    with _report_jobs_lock:
+        job = _report_jobs.get(path)
+        if job is not None and ((job['future'] and not job['future'].done()) or os.path.exists(job['path'])):
+            return job
         
-        summary_text = f"""
-        <b>Summary:</b><br/>
-        Total Items: {total_items}<br/>
-        Positive Balance: {positive_balance}<br/>
-        Zero Balance: {zero_balance}<br/>
-        Negative Balance: {negative_balance}
-        """
-        summary = Paragraph(summary_text, summary_style)
-        elements.append(summary)
+        if os.path.exists(path):
+            job = {'id': version, 'path': path, 'future': None}
+        else:
+            os.makedirs(current_app.config['REPORT_CACHE_DIR'], exist_ok=True)
+            job = {'id': version, 'path': path, 'future': get_report_executor().submit(render_report_job, path, as_of, group)}
+        _report_jobs[path] = job
+        return job
+
+def report_job_status(job):
+    future = job['future']
+    if future is None or (future.done() and future.exception() is None):
+        return 'done' if os.path.exists(job['path']) else 'failed'
+    if future.done():
+        return 'failed'
+    return 'running' if future.running() else 'queued'
+
+def find_report_job(job_id):
+    """Look up a job; ids are ledger versions, so other workers' jobs can be resumed here"""
+    if not REPORT_JOB_ID_PATTERN.match(job_id):
+        return None
     
-    # Build PDF
-    doc.build(elements)
+    with _report_jobs_lock:
+        job = _report_jobs.get(report_cache_path(job_id))
+    if job is not None:
+        return job
+    as_of = report_job_as_of(job_id)
+    group = report_job_group(job_id)
+    if os.path.exists(report_cache_path(job_id)) or job_id == report_version(as_of, group):
+        return submit_report_job(job_id, as_of, group)
+    return None
+
+def report_job_payload(job):
+    return {
+        'id': job['id'],
+        'status': report_job_status(job),
+        'status_url': url_for('report_job', job_id=job['id']),
+        'download_url': url_for('download_report_job', job_id=job['id'])
+    }
+
+def send_report(path):
+    return send_file(
+        path,
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=f'inventory_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+    )
+
+def requested_as_of():
+    return parse_date_arg(request.args.get('as_of'), end_of_day=True)
+
+def requested_report_group():
+    group = request.args.get('group')
+    return group if group in REPORT_GROUPS else None
+
+@setup.route('/download_report')
+def download_report():
+    as_of = requested_as_of()
+    job = submit_report_job(as_of=as_of, group=requested_report_group())
+    if job['future'] is not None:
+        waited = not job['future'].done()
+        try:
+            build_ms = job['future'].result(timeout=current_app.config['REPORT_SYNC_WAIT'])
+            if waited:
+                perf_span('pdf', build_ms)
+        except Exception:
+            pass
     
-    # Get PDF value from buffer
-    pdf = buffer.getvalue()
-    buffer.close()
+    if report_job_status(job) == 'done':
+        return send_report(job['path'])
     
-    # Create response
-    response = Response(pdf)
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'attachment; filename=inventory_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+    flash('The PDF report is still being generated. It will download automatically when ready.', 'success')
+    return redirect(url_for('report', report_job=job['id'], as_of=request.args.get('as_of'), group=requested_report_group()))
+
+@setup.route('/reports/jobs', methods=['POST'])
+def create_report_job():
+    job = submit_report_job(as_of=requested_as_of(), group=requested_report_group())
+    return jsonify(report_job_payload(job)), 202
+
+@setup.route('/reports/jobs/<job_id>')
+def report_job(job_id):
+    job = find_report_job(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(report_job_payload(job))
+
+@setup.route('/reports/jobs/<job_id>/download')
+def download_report_job(job_id):
+    job = find_report_job(job_id)
+    if job is None:
+        abort(404)
     
-    return response
+    status = report_job_status(job)
+    if status != 'done':
+        return jsonify(report_job_payload(job)), 409
+    return send_report(job['path'])
 
-@app.route('/report')
+@setup.route('/report')
 def report():
-    balances = get_inventory_balances()
-    return render_template('report.html', balances=balances)
+    balances = get_inventory_balances(requested_as_of())
+    return render_template('report.html', balances=balances, report_job=request.args.get('report_job'),
+                           as_of=request.args.get('as_of', ''), group=requested_report_group())
+
+PRODUCT_API_FIELDS = ('id', 'name', 'sku', 'description', 'unit_of_measure')
+LOCATION_API_FIELDS = ('id', 'name', 'address', 'type')
+MOVEMENT_API_FIELDS = ('id', 'timestamp', 'product_id', 'from_location_id', 'to_location_id', 'qty', 'note', 'user_id')
+BALANCE_API_FIELDS = BalanceRow._fields
 
-@app.route('/log')
+def api_error(status, message):
+    response = jsonify({'error': message})
+    response.status_code = status
+    return response
+
+def requested_fields(allowed):
+    """Fields named in ?fields=a,b (all of allowed by default); unknown names are a 400"""
+    value = request.args.get('fields')
+    if not value:
+        return allowed
+    
+    fields = tuple(field.strip() for field in value.split(',') if field.strip())
+    unknown = [field for field in fields if field not in allowed]
+    if unknown or not fields:
+        abort(api_error(400, f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}"))
+    return fields
+
+def requested_limit():
+    limit = request.args.get('limit', type=int)
+    if not limit or limit < 1:
+        return current_app.config['API_PAGE_SIZE']
+    return min(limit, current_app.config['API_MAX_PAGE_SIZE'])
+
+def serialize(obj, fields):
+    """Compact dict of the selected attributes, with datetimes as ISO strings"""
+    data = {}
+    for field in fields:
+        value = getattr(obj, field)
+        data[field] = value.isoformat() if isinstance(value, datetime) else value
+    return data
+
+def versioned_response(names, build, tag=None):
+    """JSON from build() tagged with the tables' change counters; revalidation returns 304 without calling build"""
+    stamps = get_version_stamps(*names)
+    
+    # The query string is part of the tag because filters and fields change the body
+    query_digest = hashlib.sha1(request.query_string).hexdigest()[:12]
+    etag = '-'.join(f'{name[0]}{stamps[name][0]}' for name in names) + f'-{query_digest}'
+    if tag:
+        etag += f'-{tag}'
+    last_modified = max((updated_at for _, updated_at in stamps.values() if updated_at is not None), default=None)
+    if last_modified is not None:
+        last_modified = last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+    
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    else:
+        not_modified = bool(last_modified and request.if_modified_since and last_modified <= request.if_modified_since)
+    
+    response = Response(status=304) if not_modified else jsonify(build())
+    response.set_etag(etag)
+    if last_modified is not None:
+        # Assigning None would stamp the header with the current time, which no later request could revalidate against
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@setup.route('/search')
+def search():
+    kind = request.args.get('type', 'products')
+    if kind not in ('products', 'locations'):
+        return api_error(400, "type must be 'products' or 'locations'.")
+    limit = min(request.args.get('limit', 10, type=int) or 10, current_app.config['SEARCH_MAX_RESULTS'])
+    return jsonify({'type': kind, 'results': search_index(kind).search(request.args.get('q', ''), max(limit, 1))})
+
+@setup.route('/api/v1/products')
+def api_products():
+    fields = requested_fields(PRODUCT_API_FIELDS)
+    
+    def build():
+        query = Product.query.order_by(Product.id)
+        if request.args.get('after'):
+            query = query.filter(Product.id > request.args['after'])
+        products = query.limit(requested_limit() + 1).all()
+        has_more = len(products) > requested_limit()
+        products = products[:requested_limit()]
+        return {
+            'products': [serialize(product, fields) for product in products],
+            'next': products[-1].id if has_more else None
+        }
+    
+    return versioned_response(('products',), build)
+
+@setup.route('/api/v1/products/<id>')
+def api_product(id):
+    fields = requested_fields(PRODUCT_API_FIELDS)
+    
+    def build():
+        product = db.session.get(Product, id)
+        if product is None:
+            abort(api_error(404, 'Product not found'))
+        return serialize(product, fields)
+    
+    return versioned_response(('products',), build)
+
+@setup.route('/api/v1/locations')
+def api_locations():
+    fields = requested_fields(LOCATION_API_FIELDS)
+    
+    def build():
+        query = Location.query.order_by(Location.id)
+        if request.args.get('after'):
+            query = query.filter(Location.id > request.args['after'])
+        locations = query.limit(requested_limit() + 1).all()
+        has_more = len(locations) > requested_limit()
+        locations = locations[:requested_limit()]
+        return {
+            'locations': [serialize(location, fields) for location in locations],
+            'next': locations[-1].id if has_more else None
+        }
+    
+    return versioned_response(('locations',), build)
+
+@setup.route('/api/v1/locations/<id>')
+def api_location(id):
+    fields = requested_fields(LOCATION_API_FIELDS)
+    
+    def build():
+        location = db.session.get(Location, id)
+        if location is None:
+            abort(api_error(404, 'Location not found'))
+        return serialize(location, fields)
+    
+    return versioned_response(('locations',), build)
+
+@setup.route('/api/v1/movements')
+def api_movements():
+    fields = requested_fields(MOVEMENT_API_FIELDS)
+    start, end = requested_date_range()
+    
+    def build():
+        page = get_movement_page(
+            request.args.get('product_id'),
+            request.args.get('location_id'),
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+            page_size=requested_limit(),
+            start=start,
+            end=end,
+            include_archived=request.args.get('include_archived') == '1'
+        )
+        return {
+            'movements': [serialize(movement, fields) for movement, _, _, _ in page.rows],
+            'next': page.next_cursor,
+            'prev': page.prev_cursor
+        }
+    
+    return versioned_response(('movements',), build)
+
+@setup.route('/api/v1/balances')
+def api_balances():
+    as_of = requested_as_of()
+    fields = requested_fields(BALANCE_API_FIELDS)
+    
+    def build():
+        balances = get_inventory_balances(as_of)
+        return {
+            'as_of': as_of.isoformat() if as_of else None,
+            'balances': [serialize(row, fields) for row in balances]
+        }
+    
+    return versioned_response(('movements', 'products', 'locations'), build)
+
+ALERT_API_FIELDS = ('id', 'product_id', 'location_id', 'kind', 'balance', 'threshold', 'raised_at', 'resolved_at')
+THRESHOLD_API_FIELDS = ('product_id', 'location_id', 'min_qty', 'updated_at')
+
+def alerts_query(status='open', kind=None):
+    query = StockAlert.query
+    if status == 'open':
+        query = query.filter(StockAlert.resolved_at.is_(None))
+    elif status == 'resolved':
+        query = query.filter(StockAlert.resolved_at.isnot(None))
+    if kind:
+        query = query.filter(StockAlert.kind == kind)
+    return query.order_by(StockAlert.raised_at.desc(), StockAlert.id.desc())
+
+@setup.route('/alerts')
+def alerts():
+    open_alerts = alerts_query().options(db.joinedload(StockAlert.product), db.joinedload(StockAlert.location)).all()
+    thresholds = db.session.query(ReorderThreshold, Product, Location).join(
+        Product, ReorderThreshold.product_id == Product.id
+    ).join(
+        Location, ReorderThreshold.location_id == Location.id
+    ).order_by(Product.name, Location.name).all()
+    choices = catalog_choices('product_options', 'location_names')
+    return render_template('alerts.html', alerts=open_alerts, thresholds=thresholds, typeahead=choices['typeahead'],
+                           product_options=choices.get('product_options'), location_options=choices.get('location_names'))
+
+@setup.route('/alerts/thresholds', methods=['POST'])
+def save_threshold():
+    product_id = request.form['product_id']
+    location_id = request.form['location_id']
+    min_qty = request.form.get('min_qty', '').strip()
+    
+    if db.session.get(Product, product_id) is None or db.session.get(Location, location_id) is None:
+        flash('Choose a product and a location!', 'error')
+        return redirect(url_for('alerts'))
+    if min_qty and (not min_qty.isdigit()):
+        flash('Reorder threshold must be a whole number of 0 or more!', 'error')
+        return redirect(url_for('alerts'))
+    
+    set_reorder_threshold(product_id, location_id, int(min_qty) if min_qty else None)
+    flash('Reorder threshold saved!' if min_qty else 'Reorder threshold removed!', 'success')
+    return redirect(url_for('alerts'))
+
+@setup.route('/api/v1/alerts')
+def api_alerts():
+    fields = requested_fields(ALERT_API_FIELDS)
+    status = request.args.get('status', 'open')
+    if status not in ('open', 'resolved', 'all'):
+        abort(api_error(400, 'status must be open, resolved or all'))
+    
+    def build():
+        query = alerts_query(status, request.args.get('kind'))
+        if request.args.get('product_id'):
+            query = query.filter(StockAlert.product_id == request.args['product_id'])
+        if request.args.get('location_id'):
+            query = query.filter(StockAlert.location_id == request.args['location_id'])
+        return {'alerts': [serialize(alert, fields) for alert in query.limit(requested_limit())]}
+    
+    return versioned_response(('alerts',), build)
+
+@setup.route('/api/v1/thresholds', methods=['GET', 'PUT'])
+def api_thresholds():
+    if request.method == 'GET':
+        fields = requested_fields(THRESHOLD_API_FIELDS)
+        return versioned_response(('alerts',), lambda: {
+            'thresholds': [serialize(threshold, fields) for threshold in ReorderThreshold.query.all()]
+        })
+    
+    entries = request.get_json(silent=True)
+    if isinstance(entries, dict):
+        entries = [entries]
+    if not isinstance(entries, list):
+        return api_error(400, 'Expected a JSON object or array of {product_id, location_id, min_qty}')
+    
+    errors = []
+    for index, entry in enumerate(entries):
+        min_qty = entry.get('min_qty') if isinstance(entry, dict) else None
+        if not isinstance(entry, dict) or not entry.get('product_id') or not entry.get('location_id'):
+            errors.append({'index': index, 'error': 'product_id and location_id are required'})
+        elif min_qty is not None and (not isinstance(min_qty, int) or min_qty < 0):
+            errors.append({'index': index, 'error': 'min_qty must be a non-negative integer or null'})
+        elif db.session.get(Product, entry['product_id']) is None or db.session.get(Location, entry['location_id']) is None:
+            errors.append({'index': index, 'error': 'Unknown product or location'})
+    if errors:
+        return jsonify({'updated': 0, 'errors': errors}), 400
+    
+    for entry in entries:
+        set_reorder_threshold(entry['product_id'], entry['location_id'], entry.get('min_qty'))
+    return jsonify({'updated': len(entries), 'errors': []})
+
+def event_stream(broker, subscription, keepalive):
+    # Runs after the request context is gone, so everything it needs is passed in
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            try:
+                message = subscription.queue.get(timeout=keepalive)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            if subscription.overflowed:
+                # Events were dropped, so patching in place would leave the page wrong
+                yield 'event: resync\ndata: {}\n\n'
+                return
+            yield message
+    finally:
+        broker.unsubscribe(subscription)
+
+@setup.route('/stream')
+def stream():
+    topics = set(request.args.get('topics', 'movements,balances').split(',')) & {'movements', 'balances'}
+    if not topics:
+        abort(400)
+    
+    broker = get_event_broker()
+    if broker.subscriber_count() >= current_app.config['SSE_MAX_CLIENTS']:
+        return Response('Too many live clients\n', status=503, headers={'Retry-After': '30'})
+    
+    subscription = broker.subscribe(topics)
+    response = Response(event_stream(broker, subscription, current_app.config['SSE_KEEPALIVE_SECONDS']), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@setup.route('/log')
 def movement_log():
     product_id = request.args.get('product_id')
     location_id = request.args.get('location_id')
-    movements = get_movement_log(product_id, location_id)
+    start, end = requested_date_range()
+    include_archived = request.args.get('include_archived') == '1'
+    page = get_movement_page(
+        product_id,
+        location_id,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        page_size=requested_page_size(),
+        start=start,
+        end=end,
+        include_archived=include_archived
+    )
     
-    products = Product.query.all()
-    locations = Location.query.all()
+    choices = catalog_choices('product_options', 'location_names')
     
-    return render_template('log.html', movements=movements, products=products, locations=locations, 
-                           selected_product_id=product_id, selected_location_id=location_id)
+    return render_template('log.html', movements=page.rows, page=page, typeahead=choices['typeahead'],
+                           product_options=mark_selected(choices.get('product_options'), product_id),
+                           location_options=mark_selected(choices.get('location_names'), location_id),
+                           selected_product_id=product_id, selected_location_id=location_id,
+                           date_from=request.args.get('date_from', ''), date_to=request.args.get('date_to', ''),
+                           include_archived=include_archived)
 
-@app.errorhandler(404)
+def stream_export(columns, rows, fmt, filename):
+    """Stream rows as CSV or NDJSON in fixed-size chunks so memory stays flat"""
+    batch_size = current_app.config['EXPORT_BATCH_SIZE']
+    
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if fmt == 'csv':
+            writer.writerow(columns)
+        
+        for count, row in enumerate(rows, 1):
+            if fmt == 'csv':
+                writer.writerow(row)
+            else:
+                buffer.write(json.dumps(dict(zip(columns, row)), default=str))
+                buffer.write('\n')
+            
+            if count % batch_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        
+        yield buffer.getvalue()
+    
+    if fmt == 'csv':
+        response = Response(stream_with_context(generate()), mimetype='text/csv')
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}.csv'
+    else:
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    return response
+
+@setup.route('/export/balances.<any(csv, ndjson):fmt>')
+def export_balances(fmt):
+    if sharding_enabled():
+        return stream_export(BalanceRow._fields, inventory_balance_rows(), fmt, 'inventory_balances')
+    
+    query = inventory_balances_query()
+    columns = [column['name'] for column in query.column_descriptions]
+    rows = query.yield_per(current_app.config['EXPORT_BATCH_SIZE'])
+    return stream_export(columns, rows, fmt, 'inventory_balances')
+
+MOVEMENT_EXPORT_COLUMNS = (
+    'id', 'timestamp', 'product_id', 'sku', 'product_name', 'from_location_id', 'from_location',
+    'to_location_id', 'to_location', 'qty', 'note', 'user_id'
+)
+
+def sharded_movement_export_rows(product_id, location_id, start, end):
+    """Every shard's movements streamed with yield_per and merged newest first, with catalog names looked up per batch"""
+    batch_size = current_app.config['EXPORT_BATCH_SIZE']
+    streams = []
+    for shard in ledger_shards():
+        with ledger_shard(shard):
+            query = movement_log_query(product_id, location_id, start=start, end=end, with_catalog=False).with_entities(
+                ProductMovement.id, ProductMovement.timestamp, ProductMovement.product_id, ProductMovement.from_location_id,
+                ProductMovement.to_location_id, ProductMovement.qty, ProductMovement.note, ProductMovement.user_id
+            )
+            # Executed now, while the shard is selected; the open cursor is then read in batches
+            streams.append(db.session.execute(query.statement, execution_options={'yield_per': batch_size}))
+    
+    merged = heapq.merge(*streams, key=lambda row: (row.timestamp, row.id), reverse=True)
+    while batch := list(islice(merged, batch_size)):
+        products = {
+            row.id: row for row in db.session.query(Product.id, Product.sku, Product.name).filter(
+                Product.id.in_({row.product_id for row in batch})
+            )
+        }
+        location_ids = {row.from_location_id for row in batch} | {row.to_location_id for row in batch}
+        location_names = dict(db.session.query(Location.id, Location.name).filter(Location.id.in_(location_ids - {None})))
+        for row in batch:
+            product = products.get(row.product_id)
+            yield (row.id, row.timestamp, row.product_id, product and product.sku, product and product.name,
+                   row.from_location_id, location_names.get(row.from_location_id), row.to_location_id,
+                   location_names.get(row.to_location_id), row.qty, row.note, row.user_id)
+
+@setup.route('/export/movements.<any(csv, ndjson):fmt>')
+def export_movements(fmt):
+    start, end = requested_date_range()
+    if sharding_enabled():
+        rows = sharded_movement_export_rows(request.args.get('product_id'), request.args.get('location_id'), start, end)
+        return stream_export(MOVEMENT_EXPORT_COLUMNS, rows, fmt, 'movement_log')
+    
+    query = movement_log_query(
+        request.args.get('product_id'),
+        request.args.get('location_id'),
+        start=start,
+        end=end
+    )
+    
+    # Select plain columns from the same joins instead of building ORM objects per row
+    _, product, from_location, to_location = (column['entity'] for column in query.column_descriptions)
+    query = query.with_entities(
+        ProductMovement.id.label('id'),
+        ProductMovement.timestamp.label('timestamp'),
+        ProductMovement.product_id.label('product_id'),
+        product.sku.label('sku'),
+        product.name.label('product_name'),
+        ProductMovement.from_location_id.label('from_location_id'),
+        from_location.name.label('from_location'),
+        ProductMovement.to_location_id.label('to_location_id'),
+        to_location.name.label('to_location'),
+        ProductMovement.qty.label('qty'),
+        ProductMovement.note.label('note'),
+        ProductMovement.user_id.label('user_id')
+    )
+    columns = [column['name'] for column in query.column_descriptions]
+    rows = query.yield_per(current_app.config['EXPORT_BATCH_SIZE'])
+    return stream_export(columns, rows, fmt, 'movement_log')
+
+@setup.route('/api/movements/bulk', methods=['POST'])
+def bulk_movements():
+    chunk_size = request.args.get('chunk_size', type=int)
+    if chunk_size is not None and chunk_size < 1:
+        return jsonify({'error': 'chunk_size must be at least 1'}), 400
+    
+    fmt = 'csv' if request.mimetype in ('text/csv', 'application/csv') else 'json'
+    try:
+        records = parse_movement_records(request.get_data(as_text=True), fmt)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    
+    try:
+        result = ingest_movements(records, chunk_size)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    return jsonify(result)
+
+@setup.errorhandler(404)
 def not_found_error(error):
     return render_template('404.html'), 404
 
+def __getattr__(name):
+    # app:app is built on first use rather than at import, so analytics.py and bench.py can import this module first
+    if name == 'app':
+        app = globals()['app'] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == '__main__':
+    # Serve the importable module, which analytics.py imports, not this script copy of the routes
+    from app import app, init_db
     with app.app_context():
-        db.create_all()
-    app.run(debug=True)
\ No newline at end of file
+        init_db()
+    app.run(debug=True)
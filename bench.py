@@ -0,0 +1,647 @@
+"""Synthetic scale data and the benchmark/stress commands of the flask bench group, loaded only when it runs"""
+import json
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import or_, func, event
+from sqlalchemy.exc import OperationalError
+
+from app import (
+    create_app, init_db, BalanceRow, InsufficientStockError, CatalogSearchIndex, REPORT_GROUPS, record_movement,
+    submit_movement, get_movement_writer, apply_balance_deltas, invalidate_dashboard_stats, compute_ledger_balances,
+    total_ledger_balances, parallel_ledger_balances, get_inventory_balances, get_movement_page, convert_uuid_keys,
+    vacuum_database, build_inventory_pdf, percentile
+)
+from models import db, Product, Location, ProductMovement, StockBalance, BalanceSnapshot, bump_version
+from rollups import apply_movements_to_rollups, total_movement_rollups, find_rollup_drift
+
+cli = AppGroup('bench')
+
+SCALE_LOCATION_TYPES = ['Warehouse', 'Warehouse', 'Warehouse', 'Retail', 'Fulfillment']
+
+def zipf_weights(count, exponent=1.07):
+    """Cumulative weights giving a long-tailed popularity curve over count items"""
+    cumulative, total = [], 0.0
+    for rank in range(count):
+        total += 1.0 / (rank + 1) ** exponent
+        cumulative.append(total)
+    return cumulative
+
+def generate_scale_data(products, locations, movements, days=365, seed=None, batch_size=50000):
+    """Top up synthetic SCALE-* catalog rows and append movements with skewed product/location use"""
+    rng = random.Random(seed)
+    
+    existing_products = {name for (name,) in db.session.query(Product.name).filter(Product.name.like('SCALE-P%'))}
+    new_products = [
+        {'id': str(uuid.uuid4()), 'name': f'SCALE-P{i:07d}', 'sku': f'SCALE-{i:07d}', 'unit_of_measure': 'unit'}
+        for i in range(products) if f'SCALE-P{i:07d}' not in existing_products
+    ]
+    existing_locations = {name for (name,) in db.session.query(Location.name).filter(Location.name.like('SCALE-L%'))}
+    new_locations = [
+        {'id': str(uuid.uuid4()), 'name': f'SCALE-L{i:05d}', 'type': SCALE_LOCATION_TYPES[i % len(SCALE_LOCATION_TYPES)]}
+        for i in range(locations) if f'SCALE-L{i:05d}' not in existing_locations
+    ]
+    if new_products:
+        db.session.execute(Product.__table__.insert(), new_products)
+        bump_version('products')
+    if new_locations:
+        db.session.execute(Location.__table__.insert(), new_locations)
+        bump_version('locations')
+    db.session.commit()
+    
+    product_ids = [product_id for (product_id,) in db.session.query(Product.id).filter(Product.name.like('SCALE-P%')).order_by(Product.name)]
+    location_ids = [location_id for (location_id,) in db.session.query(Location.id).filter(Location.name.like('SCALE-L%')).order_by(Location.name)]
+    product_weights = zipf_weights(len(product_ids))
+    location_weights = zipf_weights(len(location_ids), 0.8)
+    
+    balances = {
+        (row.product_id, row.location_id): row.balance
+        for row in db.session.query(StockBalance.product_id, StockBalance.location_id, StockBalance.balance)
+    }
+    existing_pairs = set(balances)
+    
+    end = datetime.utcnow() - timedelta(seconds=current_app.config['SNAPSHOT_GRACE_SECONDS'])
+    start = end - timedelta(days=days)
+    step = (end - start) / max(movements, 1)
+    
+    written = 0
+    while written < movements:
+        count = min(batch_size, movements - written)
+        picked_products = rng.choices(product_ids, cum_weights=product_weights, k=count)
+        picked_from = rng.choices(location_ids, cum_weights=location_weights, k=count)
+        picked_to = rng.choices(location_ids, cum_weights=location_weights, k=count)
+        
+        rows, deltas = [], {}
+        for i in range(count):
+            product_id, from_location_id, to_location_id = picked_products[i], picked_from[i], picked_to[i]
+            available = balances.get((product_id, from_location_id), 0)
+            kind = rng.random()
+            
+            # Receipts whenever the source is empty, otherwise ~50% transfers and ~20% dispatches
+            if available <= 0 or kind < 0.3:
+                from_location_id, qty, note = None, rng.randint(20, 500), 'Synthetic receipt'
+            elif kind < 0.8 and to_location_id != from_location_id:
+                qty, note = rng.randint(1, min(available, 100)), 'Synthetic transfer'
+            else:
+                to_location_id, qty, note = None, rng.randint(1, min(available, 25)), 'Synthetic dispatch'
+            
+            if from_location_id:
+                balances[(product_id, from_location_id)] = available - qty
+                deltas.setdefault((product_id, from_location_id), [0, 0])[1] += qty
+            if to_location_id:
+                balances[(product_id, to_location_id)] = balances.get((product_id, to_location_id), 0) + qty
+                deltas.setdefault((product_id, to_location_id), [0, 0])[0] += qty
+            
+            rows.append({
+                'id': str(uuid.uuid4()),
+                'timestamp': start + step * (written + i) + timedelta(microseconds=rng.randint(0, 999)),
+                'product_id': product_id,
+                'from_location_id': from_location_id,
+                'to_location_id': to_location_id,
+                'qty': qty,
+                'note': note,
+                'user_id': 'SCALE_SEED'
+            })
+        
+        db.session.execute(ProductMovement.__table__.insert(), rows)
+        apply_balance_deltas(deltas, existing_pairs)
+        apply_movements_to_rollups(rows)
+        existing_pairs.update(deltas)
+        bump_version('movements')
+        db.session.commit()
+        written += count
+    
+    # Backdated history invalidates any snapshot whose cutoff it falls behind
+    stale = BalanceSnapshot.query.filter(BalanceSnapshot.taken_at >= start).all()
+    for snapshot in stale:
+        db.session.delete(snapshot)
+    db.session.commit()
+    invalidate_dashboard_stats()
+    return len(new_products), len(new_locations), written
+
+@cli.command('seed-scale')
+@click.option('--products', default=1000, show_default=True)
+@click.option('--locations', default=50, show_default=True)
+@click.option('--movements', default=100000, show_default=True)
+@click.option('--days', default=365, show_default=True, help='Spread movement timestamps over this many past days.')
+@click.option('--seed', default=None, type=int, help='Random seed for reproducible data.')
+def seed_scale_command(products, locations, movements, days, seed):
+    """Generate a large synthetic catalog and ledger with bulk inserts"""
+    init_db()
+    started = time.perf_counter()
+    new_products, new_locations, written = generate_scale_data(products, locations, movements, days, seed)
+    elapsed = time.perf_counter() - started
+    print(f"Added {new_products} products, {new_locations} locations and {written} movements in {elapsed:.1f}s.")
+
+def time_key_queries(repeat):
+    """Median ms for the key-heavy ledger queries against the current database"""
+    location_id = db.session.query(StockBalance.location_id).first()[0]
+    product_id = db.session.query(StockBalance.product_id).first()[0]
+    queries = {
+        'ledger GROUP BY': lambda: compute_ledger_balances(),
+        'inventory balances': lambda: get_inventory_balances(),
+        'log page by location': lambda: get_movement_page(location_id=location_id),
+        'log page by product': lambda: get_movement_page(product_id),
+    }
+    
+    timings = {}
+    for name, run in queries.items():
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            samples.append((time.perf_counter() - started) * 1000)
+            db.session.remove()
+        timings[name] = statistics.median(samples)
+    return timings
+
+@cli.command('uuid-keys')
+@click.option('--movements', default=200000, show_default=True)
+@click.option('--repeat', default=5, show_default=True)
+def bench_uuid_keys_command(movements, repeat):
+    """Compare file size and query time on a scratch database before and after migrate-uuid-keys"""
+    path = os.path.join(tempfile.mkdtemp(), 'uuid-keys.db')
+    bench_app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + path, 'LEDGER_SHARDS': {}, 'COMPACT_UUID_KEYS': False})
+    
+    with bench_app.app_context():
+        db.create_all(bind_key=None)
+        generate_scale_data(1000, 50, movements, seed=1)
+        vacuum_database()
+        text_size, text_times = os.path.getsize(path), time_key_queries(repeat)
+        text_balances = get_inventory_balances()
+        
+        convert_uuid_keys(to_binary=True)
+        vacuum_database()
+        bench_app.config['COMPACT_UUID_KEYS'] = True
+        binary_size, binary_times = os.path.getsize(path), time_key_queries(repeat)
+        if get_inventory_balances() != text_balances:
+            raise click.ClickException('Balances differ after converting keys.')
+    
+    print(f"{'':<22}{'text keys':>12}{'16-byte keys':>14}")
+    print(f"{'database size (MB)':<22}{text_size / 1048576:>12.1f}{binary_size / 1048576:>14.1f}")
+    for name in text_times:
+        print(f"{name + ' (ms)':<22}{text_times[name]:>12.1f}{binary_times[name]:>14.1f}")
+
+@cli.command('aggregation')
+@click.option('--movements', default=1000000, show_default=True, help='Ledger size of the scratch database.')
+@click.option('--workers', default='1,2,4,8', show_default=True, help='Comma-separated worker counts to time.')
+@click.option('--repeat', default=3, show_default=True, help='Runs per worker count; the fastest is reported.')
+def bench_aggregation_command(movements, workers, repeat):
+    """Time full ledger recomputes on a scratch database, single query vs. the worker pool at each size
+
+    On one CPU the pool never wins: at 1M movements the single query took 4.9s, a warm 2-worker pool 4.6s and its
+    first run 8.0s. With several cores it pays off once the single query runs several times longer than the pool
+    start-up (about 1.5s), which is where AGGREGATION_MIN_MOVEMENTS (5M) sits.
+    """
+    counts = [int(count) for count in workers.split(',')]
+    path = os.path.join(tempfile.mkdtemp(), 'aggregation.db')
+    bench_app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + path, 'LEDGER_SHARDS': {}})
+    
+    with bench_app.app_context():
+        db.create_all(bind_key=None)
+        generate_scale_data(1000, 50, movements, seed=1)
+        db.session.remove()
+        
+        def timed(compute):
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                totals = compute()
+                timings.append(time.perf_counter() - started)
+            return timings, totals
+        
+        timings, expected = timed(total_ledger_balances)
+        baseline = min(timings)
+        print(f"{movements} movements, {len(expected)} balance rows, {os.cpu_count()} CPUs")
+        print(f"{'single query':<14}{baseline:>9.2f}s")
+        for count in counts:
+            # The first run includes starting the pool; later runs reuse it like repeated rebuilds do
+            timings, totals = timed(lambda: parallel_ledger_balances(count))
+            if totals != expected:
+                raise click.ClickException(f'{count} workers produced different totals.')
+            warm = min(timings[1:] or timings)
+            print(f"{f'{count} workers':<14}{warm:>9.2f}s  speedup {baseline / warm:>5.2f}x  (first run {timings[0]:.2f}s)")
+        pool = current_app.extensions.pop('arele_aggregation', None)
+        if pool is not None:
+            pool[1].shutdown()
+
+@cli.command('stress-stock')
+@click.option('--threads', default=300, show_default=True, help='Number of concurrent pickers.')
+@click.option('--stock', default=100, show_default=True, help='Units on hand before the run.')
+@click.option('--database', default=None, help='Database URI to hammer (defaults to a throwaway SQLite file).')
+def stress_stock_command(threads, stock, database):
+    """Race single-unit picks against one balance row and verify nothing oversells"""
+    if database is None:
+        database = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'stress.db')
+    
+    stress_app = create_app({'SQLALCHEMY_DATABASE_URI': database, 'LEDGER_SHARDS': {}})
+    
+    with stress_app.app_context():
+        db.create_all(bind_key=None)
+        tag = uuid.uuid4().hex[:8]
+        product = Product(name=f'Stress Product {tag}', sku=f'STRESS-{tag}')
+        location = Location(name=f'Stress Bin {tag}')
+        db.session.add_all([product, location])
+        db.session.commit()
+        product_id, location_id = product.id, location.id
+        record_movement(product_id, None, location_id, stock, 'Stress test receipt')
+    
+    outcomes = {'ok': 0, 'insufficient': 0, 'locked': 0}
+    outcomes_lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+    
+    def pick():
+        with stress_app.app_context():
+            barrier.wait()
+            try:
+                record_movement(product_id, location_id, None, 1, 'Stress test pick')
+                outcome = 'ok'
+            except InsufficientStockError:
+                outcome = 'insufficient'
+            except OperationalError:
+                outcome = 'locked'
+            finally:
+                db.session.remove()
+            with outcomes_lock:
+                outcomes[outcome] += 1
+    
+    workers = [threading.Thread(target=pick) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    
+    with stress_app.app_context():
+        stored = StockBalance.query.get((product_id, location_id))
+        shipped = db.session.query(func.coalesce(func.sum(ProductMovement.qty), 0)).filter(
+            ProductMovement.product_id == product_id,
+            ProductMovement.from_location_id == location_id
+        ).scalar()
+    
+    print(f"Database: {database}")
+    print(f"Picks: {outcomes['ok']} succeeded, {outcomes['insufficient']} refused, {outcomes['locked']} lock timeouts")
+    print(f"Ledger shipped {shipped} of {stock}; stored balance {stored.balance}")
+    
+    if stored.balance < 0 or shipped > stock or stored.balance != stock - shipped:
+        print("FAIL: stock was oversold or stock_balances drifted from the ledger.")
+        raise SystemExit(1)
+    print("OK: no oversell.")
+
+def concurrency_worker(database, pragmas, duration, write_ratio, seed, product_ids, location_ids):
+    """Worker-process entry point: mix movement-log reads and receipts against database until the deadline"""
+    worker_app = create_app({'SQLALCHEMY_DATABASE_URI': database, 'SQLITE_PRAGMAS': pragmas, 'LEDGER_SHARDS': {}})
+    
+    rng = random.Random(seed)
+    results = {'reads': [], 'writes': [], 'errors': 0}
+    with worker_app.app_context():
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                if rng.random() < write_ratio:
+                    record_movement(rng.choice(product_ids), None, rng.choice(location_ids), 1, 'Concurrency benchmark')
+                    results['writes'].append((time.perf_counter() - started) * 1000)
+                else:
+                    get_movement_page(product_id=rng.choice(product_ids), page_size=50)
+                    results['reads'].append((time.perf_counter() - started) * 1000)
+            except OperationalError:
+                db.session.rollback()
+                results['errors'] += 1
+            finally:
+                db.session.remove()
+    return results
+
+@cli.command('concurrency')
+@click.option('--processes', default=4, show_default=True, help='Worker processes sharing one database file.')
+@click.option('--duration', default=10.0, show_default=True, help='Seconds each mode runs for.')
+@click.option('--write-ratio', default=0.2, show_default=True, help='Fraction of operations that record a movement.')
+@click.option('--movements', default=20000, show_default=True, help='Ledger size to seed each scratch database with.')
+def bench_concurrency_command(processes, duration, write_ratio, movements):
+    """Compare multi-process read/write throughput on SQLite with default settings and the tuned pragmas"""
+    modes = [('default', {}), ('tuned', current_app.config['SQLITE_PRAGMAS'])]
+    context = multiprocessing.get_context('spawn')
+    
+    for mode, pragmas in modes:
+        database = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), f'concurrency-{mode}.db')
+        
+        scratch_app = create_app({'SQLALCHEMY_DATABASE_URI': database, 'SQLITE_PRAGMAS': pragmas, 'LEDGER_SHARDS': {}})
+        with scratch_app.app_context():
+            db.create_all(bind_key=None)
+            generate_scale_data(50, 10, movements, seed=1)
+            product_ids = [row[0] for row in db.session.query(Product.id)]
+            location_ids = [row[0] for row in db.session.query(Location.id)]
+            db.session.remove()
+            db.engine.dispose()
+        
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+            futures = [
+                executor.submit(concurrency_worker, database, pragmas, duration, write_ratio, seed, product_ids, location_ids)
+                for seed in range(processes)
+            ]
+            results = [future.result() for future in futures]
+        
+        reads = [sample for result in results for sample in result['reads']]
+        writes = [sample for result in results for sample in result['writes']]
+        errors = sum(result['errors'] for result in results)
+        print(f"{mode:<8} reads {len(reads) / duration:>8.1f}/s (p95 {percentile(reads, 0.95) if reads else 0:>7.1f}ms)  "
+              f"writes {len(writes) / duration:>7.1f}/s (p95 {percentile(writes, 0.95) if writes else 0:>7.1f}ms)  "
+              f"lock errors {errors}")
+
+@cli.command('group-commit')
+@click.option('--threads', default=32, show_default=True, help='Concurrent submitters.')
+@click.option('--duration', default=5.0, show_default=True, help='Seconds each mode runs for.')
+@click.option('--pick-ratio', default=0.5, show_default=True, help='Fraction of movements that pick stock instead of receiving it.')
+@click.option('--synchronous', default=None, help='SQLite synchronous pragma for the scratch databases (defaults to SQLITE_PRAGMAS).')
+def bench_group_commit_command(threads, duration, pick_ratio, synchronous):
+    """Compare movement throughput and latency with a commit per movement and with the group-commit writer"""
+    pragmas = dict(current_app.config['SQLITE_PRAGMAS'])
+    if synchronous:
+        pragmas['synchronous'] = synchronous
+    
+    for mode, group_commit in (('per-request', False), ('group', True)):
+        database = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), f'group-commit-{mode}.db')
+        bench_app = create_app({
+            'SQLALCHEMY_DATABASE_URI': database, 'SQLITE_PRAGMAS': pragmas,
+            'LEDGER_SHARDS': {}, 'MOVEMENT_GROUP_COMMIT': group_commit
+        })
+        with bench_app.app_context():
+            db.create_all(bind_key=None)
+            generate_scale_data(20, 5, 1000, seed=1)
+            product_ids = [row[0] for row in db.session.query(Product.id)]
+            location_ids = [row[0] for row in db.session.query(Location.id)]
+            db.session.remove()
+        
+        results = {'ok': [], 'insufficient': 0, 'locked': 0}
+        results_lock = threading.Lock()
+        barrier = threading.Barrier(threads)
+        
+        def submit(seed):
+            rng = random.Random(seed)
+            latencies, insufficient, locked = [], 0, 0
+            with bench_app.app_context():
+                barrier.wait()
+                deadline = time.perf_counter() + duration
+                while time.perf_counter() < deadline:
+                    product_id, location_id = rng.choice(product_ids), rng.choice(location_ids)
+                    pick = rng.random() < pick_ratio
+                    started = time.perf_counter()
+                    try:
+                        submit_movement(product_id, location_id if pick else None, None if pick else location_id,
+                                        rng.randint(1, 20), 'Group commit benchmark')
+                        latencies.append((time.perf_counter() - started) * 1000)
+                    except InsufficientStockError:
+                        insufficient += 1
+                    except OperationalError:
+                        db.session.rollback()
+                        locked += 1
+                    finally:
+                        db.session.remove()
+            with results_lock:
+                results['ok'].extend(latencies)
+                results['insufficient'] += insufficient
+                results['locked'] += locked
+        
+        workers = [threading.Thread(target=submit, args=(seed,)) for seed in range(threads)]
+        for worker in workers:
+            worker.start()
+        started = time.perf_counter()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        
+        with bench_app.app_context():
+            if group_commit:
+                get_movement_writer().close()
+            stored = {
+                (row.product_id, row.location_id): (row.incoming, row.outgoing)
+                for row in StockBalance.query.filter(or_(StockBalance.incoming != 0, StockBalance.outgoing != 0))
+            }
+            drifted = stored != compute_ledger_balances() or bool(find_rollup_drift(total_movement_rollups()))
+            oversold = StockBalance.query.filter(StockBalance.balance < 0).count()
+            db.session.remove()
+        
+        ok = results['ok']
+        print(f"{mode:<12} {len(ok) / elapsed:>8.1f} movements/s  "
+              f"p50 {percentile(ok, 0.5) if ok else 0:>7.1f}ms  p95 {percentile(ok, 0.95) if ok else 0:>7.1f}ms  "
+              f"p99 {percentile(ok, 0.99) if ok else 0:>7.1f}ms  refused {results['insufficient']}  lock errors {results['locked']}")
+        if drifted or oversold:
+            raise click.ClickException(f'{mode}: balances or rollups drifted from the ledger, or stock was oversold.')
+
+def benchmark_route(client, name, send, repeat, query_counter):
+    """Time repeated requests through the test client, counting SQL statements per request"""
+    timings, queries = [], []
+    for _ in range(repeat):
+        query_counter['count'] = 0
+        started = time.perf_counter()
+        response = send(client)
+        timings.append((time.perf_counter() - started) * 1000)
+        queries.append(query_counter['count'])
+        if response.status_code >= 400:
+            raise click.ClickException(f'{name} returned HTTP {response.status_code}')
+    
+    return {
+        'p50_ms': round(percentile(timings, 0.5), 2),
+        'p95_ms': round(percentile(timings, 0.95), 2),
+        'mean_ms': round(statistics.mean(timings), 2),
+        'queries': max(queries),
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+
+@cli.command('routes')
+@click.option('--sizes', default='10000,100000,1000000', show_default=True, help='Comma-separated ledger sizes to grow through.')
+@click.option('--repeat', default=20, show_default=True, help='Requests per route and size.')
+@click.option('--products', default=1000, show_default=True)
+@click.option('--locations', default=50, show_default=True)
+@click.option('--output', default='bench_routes.json', show_default=True, type=click.Path(dir_okay=False))
+@click.option('--yes', is_flag=True, help='Do not ask before adding synthetic data to the configured database.')
+def bench_routes_command(sizes, repeat, products, locations, output, yes):
+    """Grow the ledger to each size and record p50/p95 latency, query count and peak RSS per route"""
+    database = current_app.config['SQLALCHEMY_DATABASE_URI']
+    if not yes:
+        click.confirm(f'This adds synthetic SCALE-* data to {database}. Continue?', abort=True)
+    
+    init_db()
+    current_app.config['REPORT_SYNC_WAIT'] = 3600
+    query_counter = {'count': 0}
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: query_counter.__setitem__('count', query_counter['count'] + 1))
+    
+    def post_movement(client):
+        product_id, location_id = rng.choice(scale_products), rng.choice(scale_locations)
+        return client.post('/movements/add', data={
+            'product_id': product_id, 'from_location_id': '', 'to_location_id': location_id,
+            'qty': '1', 'note': 'Benchmark receipt'
+        })
+    
+    def cold_download_report(client):
+        for name in os.listdir(current_app.config['REPORT_CACHE_DIR']) if os.path.isdir(current_app.config['REPORT_CACHE_DIR']) else []:
+            os.remove(os.path.join(current_app.config['REPORT_CACHE_DIR'], name))
+        return client.get('/download_report')
+    
+    routes = [
+        ('index', lambda client: client.get('/'), repeat),
+        ('report', lambda client: client.get('/report'), repeat),
+        ('download_report', cold_download_report, max(1, repeat // 5)),
+        ('log', lambda client: client.get('/log'), repeat),
+        ('movements', lambda client: client.get('/movements'), repeat),
+        ('analytics_velocity', lambda client: client.get('/api/v1/analytics/velocity?sort=velocity'), repeat),
+        ('analytics_daily', lambda client: client.get('/api/v1/analytics/daily'), repeat),
+        ('add_movement', post_movement, repeat),
+    ]
+    
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    
+    results = {'generated_at': datetime.utcnow().isoformat(), 'commit': commit, 'database': database, 'sizes': {}}
+    rng = random.Random(0)
+    client = current_app.test_client()
+    for size in (int(value) for value in sizes.split(',')):
+        current = ProductMovement.query.count()
+        if current < size:
+            print(f"Growing ledger from {current} to {size} movements...")
+            generate_scale_data(products, locations, size - current, seed=size)
+        scale_products = [row[0] for row in db.session.query(Product.id).filter(Product.name.like('SCALE-P%'))]
+        scale_locations = [row[0] for row in db.session.query(Location.id).filter(Location.name.like('SCALE-L%'))]
+        db.session.remove()
+        
+        results['sizes'][size] = {}
+        for name, send, count in routes:
+            results['sizes'][size][name] = stats = benchmark_route(client, name, send, count, query_counter)
+            print(f"{size:>9} {name:<16} p50 {stats['p50_ms']:>9.1f}ms  p95 {stats['p95_ms']:>9.1f}ms  "
+                  f"queries {stats['queries']:>3}  peak RSS {stats['peak_rss_kb'] // 1024} MB")
+    
+    with open(output, 'w', encoding='utf-8') as handle:
+        json.dump(results, handle, indent=2)
+    print(f"Wrote {output}")
+
+STARTUP_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+status = app.app.test_client().get(sys.argv[1]).status_code
+served = time.perf_counter()
+reportlab_loaded = 'reportlab' in sys.modules
+import pdf_report
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (served - imported) * 1000,
+    'report_import_ms': (time.perf_counter() - served) * 1000,
+    'status': status,
+    'reportlab_loaded': reportlab_loaded
+}))
+"""
+
+@cli.command('startup')
+@click.option('--repeat', default=10, show_default=True, help='Fresh interpreters to time.')
+@click.option('--path', default='/', show_default=True, help='Route served as the first request.')
+def bench_startup_command(repeat, path):
+    """Time importing the app and serving its first request, each in a fresh interpreter"""
+    samples = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', STARTUP_PROBE, path], cwd=current_app.root_path,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise click.ClickException(result.stderr.strip().splitlines()[-1])
+        samples.append(json.loads(result.stdout.splitlines()[-1]))
+    
+    for name in ('import_ms', 'first_request_ms', 'report_import_ms'):
+        values = [sample[name] for sample in samples]
+        print(f"{name:<18} p50 {percentile(values, 0.5):>8.1f}ms  min {min(values):>8.1f}ms  max {max(values):>8.1f}ms")
+    print(f"First request to {path} returned {samples[-1]['status']}; "
+          f"ReportLab {'was' if samples[-1]['reportlab_loaded'] else 'was not'} loaded before the first report.")
+
+@cli.command('search')
+@click.option('--size', default=50000, show_default=True, help='Synthetic products in the index.')
+@click.option('--queries', default=500, show_default=True, help='Lookups timed per query kind.')
+@click.option('--seed', default=1, show_default=True, help='Random seed for the catalog and the queries.')
+def bench_search_command(size, queries, seed):
+    """Time building a product search index and answering prefix and misspelt lookups against it"""
+    rng = random.Random(seed)
+    syllables = ['ka', 'lo', 'mi', 'ter', 'ro', 'van', 'si', 'del', 'tu', 'nor', 'pe', 'gal', 'bri', 'so', 'quen', 'xa']
+    words = sorted({''.join(rng.choices(syllables, k=rng.randint(2, 4))) for _ in range(max(size // 10, 100))})
+    entries = []
+    for number in range(size):
+        name = ' '.join(rng.sample(words, 3)).title() + f' {number}'
+        sku = f'SKU-{number:06d}'
+        entries.append((str(number), f'{name} ({sku})', name, sku))
+    
+    started = time.perf_counter()
+    index = CatalogSearchIndex(entries, version=0)
+    print(f"Built index over {len(index)} products in {(time.perf_counter() - started) * 1000:.0f}ms")
+    
+    def misspell(word):
+        position = rng.randrange(1, len(word) - 1)
+        return word[:position] + word[position + 1] + word[position] + word[position + 2:]
+    
+    lookups = {
+        'prefix': [rng.choice(entries)[2][:rng.randint(2, 8)] for _ in range(queries)],
+        'sku': [rng.choice(entries)[3][:rng.randint(6, 10)] for _ in range(queries)],
+        'typo': [misspell(rng.choice(entries)[2].split()[0].lower()) for _ in range(queries)],
+    }
+    for kind, texts in lookups.items():
+        samples = []
+        empty = 0
+        for text in texts:
+            started = time.perf_counter()
+            results = index.search(text)
+            samples.append((time.perf_counter() - started) * 1000)
+            empty += not results
+        print(f"{kind:<7} p50 {percentile(samples, 0.5):>7.2f}ms  p95 {percentile(samples, 0.95):>7.2f}ms  "
+              f"max {max(samples):>7.2f}ms  no match {empty}/{len(texts)}")
+
+def synthetic_balances(count, locations=50):
+    """Lazily generate balance rows in location order for report benchmarks"""
+    per_location = max(1, -(-count // locations))
+    for index in range(count):
+        location = index // per_location
+        incoming = 50 + (index * 37) % 300
+        outgoing = (index * 53) % 320
+        yield BalanceRow(
+            f'Product {index:07d}', f'Location {location:03d}', f'SKU-{index:07d}',
+            incoming, outgoing, incoming - outgoing, f'P{index}', f'L{location}'
+        )
+
+def report_memory_worker(rows, group, rows_per_table):
+    """Worker-process entry point: render a synthetic report and measure how far peak RSS grew"""
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    with tempfile.TemporaryFile() as output:
+        build_inventory_pdf(synthetic_balances(rows), output, group=group, rows_per_table=rows_per_table)
+        size = output.tell()
+    return {
+        'seconds': time.perf_counter() - started,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'growth_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_kb,
+        'pdf_bytes': size
+    }
+
+@cli.command('report-memory')
+@click.option('--sizes', default='1000,10000,50000,200000', show_default=True, help='Comma-separated row counts to render.')
+@click.option('--group', type=click.Choice(REPORT_GROUPS), default=None, help='Render grouped with subtotals.')
+@click.option('--rows-per-table', type=int, default=None, help='Rows per table chunk (default REPORT_TABLE_ROWS); 0 lays out one table like the old report.')
+def bench_report_memory_command(sizes, group, rows_per_table):
+    """Render synthetic PDF reports of growing size, each in a fresh process, and print time and peak memory"""
+    rows_per_table = current_app.config['REPORT_TABLE_ROWS'] if rows_per_table is None else rows_per_table
+    context = multiprocessing.get_context('spawn')
+    print(f"{'rows':>9} {'seconds':>9} {'peak RSS MB':>12} {'growth MB':>10} {'PDF MB':>8}")
+    for rows in [int(size) for size in sizes.split(',') if size.strip()]:
+        # A fresh process per size, so each peak RSS reading starts from the same baseline
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(report_memory_worker, rows, group, rows_per_table).result()
+        print(f"{rows:>9} {result['seconds']:>9.2f} {result['peak_rss_kb'] / 1024:>12.1f} "
+              f"{result['growth_kb'] / 1024:>10.1f} {result['pdf_bytes'] / 1048576:>8.2f}")
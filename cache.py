@@ -0,0 +1,86 @@
+"""Pluggable app-wide cache: the CacheBackend interface, the in-process LRUCache and get_cache()"""
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from werkzeug.utils import import_string
+
+class CacheBackend:
+    """Interface for the shared cache; swap implementations with CACHE_BACKEND"""
+    
+    def get(self, key, default=None):
+        raise NotImplementedError
+    
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+    
+    def delete(self, key):
+        raise NotImplementedError
+    
+    def clear(self):
+        raise NotImplementedError
+    
+    def update(self, key, func):
+        """Replace a cached value with func(value); missing entries stay missing"""
+        value = self.get(key)
+        if value is not None:
+            self.set(key, func(value))
+    
+    def get_or_set(self, key, factory, ttl=None):
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.set(key, value, ttl)
+        return value
+
+class LRUCache(CacheBackend):
+    """Thread-safe in-process LRU cache with optional per-entry TTL"""
+    
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+    
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def update(self, key, func):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (func(entry[0]), entry[1])
+
+def get_cache():
+    """The app-wide cache, built from CACHE_BACKEND (a class, factory or import path)"""
+    cache = current_app.extensions.get('arele_cache')
+    if cache is None:
+        backend = current_app.config['CACHE_BACKEND'] or LRUCache
+        if isinstance(backend, str):
+            backend = import_string(backend)
+        cache = current_app.extensions['arele_cache'] = backend(**current_app.config['CACHE_OPTIONS'])
+    return cache
@@ -0,0 +1,323 @@
+"""Database, models and ledger shard routing shared by the app, analytics and the worker processes"""
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from flask import current_app
+from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import inspect
+from sqlalchemy.sql.util import find_tables
+
+from cache import get_cache
+
+LEDGER_TABLES = frozenset({'product_movements', 'stock_balances', 'movement_rollups', 'data_versions'})
+
+class LedgerSession(Session):
+    """Session that sends ledger tables to the shard chosen with ledger_shard(); other tables use their usual bind"""
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        shard = self.info.get('ledger_shard')
+        if bind is None and shard is not None:
+            if mapper is not None:
+                tables = [inspect(mapper).local_table]
+            else:
+                tables = find_tables(clause, include_crud=True) if clause is not None else []
+            if any(table.name in LEDGER_TABLES for table in tables):
+                return self._db.engines[shard]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(session_options={'class_': LedgerSession})
+
+def sharding_enabled():
+    return bool(current_app.config.get('LEDGER_SHARDS'))
+
+def ledger_shards():
+    """Bind keys holding part of the ledger: the default database first, then each LEDGER_SHARDS group"""
+    return [None, *current_app.config.get('LEDGER_SHARDS', {})]
+
+@contextmanager
+def ledger_shard(shard):
+    """Route movement, balance and version queries in this block to a shard's bind (None is the default database)"""
+    info = db.session.info
+    previous = info.get('ledger_shard')
+    info['ledger_shard'] = shard
+    try:
+        yield
+    finally:
+        info['ledger_shard'] = previous
+
+_fanout_executor = None
+
+def fan_out(func):
+    """Call func once per ledger shard, in parallel threads with their own sessions, in ledger_shards() order"""
+    shards = ledger_shards()
+    if len(shards) == 1:
+        return [func()]
+    
+    global _fanout_executor
+    if _fanout_executor is None:
+        _fanout_executor = ThreadPoolExecutor(max_workers=current_app.config['LEDGER_FANOUT_WORKERS'])
+    current = current_app._get_current_object()
+    
+    def run(shard):
+        with current.app_context(), ledger_shard(shard):
+            try:
+                return func()
+            finally:
+                db.session.remove()
+    
+    return list(_fanout_executor.map(run, shards))
+
+def reset_fanout_after_fork():
+    # The executor's threads did not survive the fork; the child starts its own on first use
+    global _fanout_executor
+    _fanout_executor = None
+
+os.register_at_fork(after_in_child=reset_fanout_after_fork)
+
+class UUIDKey(db.TypeDecorator):
+    """UUID string in Python, stored as 16 raw bytes on SQLite when COMPACT_UUID_KEYS is on"""
+    impl = db.String(36)
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        if value is None or not current_app.config['COMPACT_UUID_KEYS'] or dialect.name != 'sqlite':
+            return value
+        try:
+            if len(value) == 36:
+                return bytes.fromhex(value.replace('-', ''))
+        except (TypeError, ValueError):
+            pass
+        # Malformed ids from URLs still bind as something that matches no key
+        return str(value).encode()
+    
+    def process_result_value(self, value, dialect):
+        # Hand-formatted because uuid.UUID() dominates large GROUP BY results
+        if isinstance(value, bytes) and len(value) == 16:
+            h = value.hex()
+            return f'{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}'
+        return value
+
+class Product(db.Model):
+    __tablename__ = 'products'
+    
+    id = db.Column(UUIDKey, primary_key=True, default=lambda: str(uuid.uuid4()))
+    name = db.Column(db.String(100), nullable=False, unique=True)
+    sku = db.Column(db.String(50), nullable=False, unique=True)
+    description = db.Column(db.Text, nullable=True)
+    unit_of_measure = db.Column(db.String(20), nullable=False, default='unit')
+
+class Location(db.Model):
+    __tablename__ = 'locations'
+    
+    id = db.Column(UUIDKey, primary_key=True, default=lambda: str(uuid.uuid4()))
+    name = db.Column(db.String(100), nullable=False, unique=True)
+    address = db.Column(db.Text, nullable=True)
+    type = db.Column(db.String(50), nullable=False, default='Warehouse')
+
+class ProductMovement(db.Model):
+    __tablename__ = 'product_movements'
+    
+    id = db.Column(UUIDKey, primary_key=True, default=lambda: str(uuid.uuid4()))
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    product_id = db.Column(UUIDKey, db.ForeignKey('products.id'), nullable=False)
+    from_location_id = db.Column(UUIDKey, db.ForeignKey('locations.id'), nullable=True)
+    to_location_id = db.Column(UUIDKey, db.ForeignKey('locations.id'), nullable=True)
+    qty = db.Column(db.Integer, nullable=False)
+    note = db.Column(db.Text, nullable=True)
+    user_id = db.Column(db.String(50), nullable=False, default='SYSTEM_ADMIN')
+    
+    product = db.relationship('Product', backref='movements')
+    from_location = db.relationship('Location', foreign_keys=[from_location_id], backref='outgoing_movements')
+    to_location = db.relationship('Location', foreign_keys=[to_location_id], backref='incoming_movements')
+    
+    __table_args__ = (
+        db.Index('ix_product_movements_product_to', 'product_id', 'to_location_id'),
+        db.Index('ix_product_movements_product_from', 'product_id', 'from_location_id'),
+        db.Index('ix_product_movements_product_timestamp', 'product_id', 'timestamp', 'id'),
+        db.Index('ix_product_movements_to_timestamp', 'to_location_id', 'timestamp', 'id'),
+        db.Index('ix_product_movements_from_timestamp', 'from_location_id', 'timestamp', 'id'),
+        db.Index('ix_product_movements_timestamp', 'timestamp', 'id'),
+    )
+
+class ArchivedMovement(db.Model):
+    """Original movements moved out of product_movements by compact-ledger"""
+    __tablename__ = 'product_movements_archive'
+    
+    id = db.Column(UUIDKey, primary_key=True)
+    timestamp = db.Column(db.DateTime, nullable=False)
+    product_id = db.Column(UUIDKey, db.ForeignKey('products.id'), nullable=False)
+    from_location_id = db.Column(UUIDKey, db.ForeignKey('locations.id'), nullable=True)
+    to_location_id = db.Column(UUIDKey, db.ForeignKey('locations.id'), nullable=True)
+    qty = db.Column(db.Integer, nullable=False)
+    note = db.Column(db.Text, nullable=True)
+    user_id = db.Column(db.String(50), nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_product_movements_archive_product_timestamp', 'product_id', 'timestamp', 'id'),
+        db.Index('ix_product_movements_archive_to_timestamp', 'to_location_id', 'timestamp', 'id'),
+        db.Index('ix_product_movements_archive_from_timestamp', 'from_location_id', 'timestamp', 'id'),
+        db.Index('ix_product_movements_archive_timestamp', 'timestamp', 'id'),
+    )
+
+class LedgerCompaction(db.Model):
+    __tablename__ = 'ledger_compactions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    before = db.Column(db.DateTime, nullable=False, index=True)
+    archived = db.Column(db.Integer, nullable=False)
+    opening_entries = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+COMPACTION_USER = 'SYSTEM_COMPACTION'
+
+class StockBalance(db.Model):
+    __tablename__ = 'stock_balances'
+    
+    product_id = db.Column(UUIDKey, db.ForeignKey('products.id'), primary_key=True)
+    location_id = db.Column(UUIDKey, db.ForeignKey('locations.id'), primary_key=True)
+    incoming = db.Column(db.Integer, nullable=False, default=0)
+    outgoing = db.Column(db.Integer, nullable=False, default=0)
+    balance = db.Column(db.Integer, nullable=False, default=0)
+
+class DataVersion(db.Model):
+    __tablename__ = 'data_versions'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+def bump_version(name):
+    """Increment a table's change counter in the caller's transaction"""
+    table = DataVersion.__table__
+    now = datetime.utcnow()
+    result = db.session.execute(
+        table.update().where(table.c.name == name).values(version=table.c.version + 1, updated_at=now)
+    )
+    if result.rowcount == 0:
+        db.session.execute(table.insert().values(name=name, version=1, updated_at=now))
+
+def get_version_stamps(*names):
+    """name -> (version, updated_at or None), with the movement counter summed over every ledger shard"""
+    def load(names):
+        return db.session.query(DataVersion.name, DataVersion.version, DataVersion.updated_at).filter(
+            DataVersion.name.in_(names)
+        ).all()
+    
+    rows = load(names)
+    if 'movements' in names and sharding_enabled():
+        # Each shard counts its own ledger commits; the sum still moves on every one of them
+        for shard in ledger_shards()[1:]:
+            with ledger_shard(shard):
+                rows.extend(load(['movements']))
+    
+    stamps = dict.fromkeys(names, (0, None))
+    for name, version, updated_at in rows:
+        total, latest = stamps[name]
+        stamps[name] = (total + version, updated_at if latest is None or updated_at > latest else latest)
+    return stamps
+
+def get_versions(*names):
+    return {name: version for name, (version, _) in get_version_stamps(*names).items()}
+
+class BalanceSnapshot(db.Model):
+    __tablename__ = 'balance_snapshots'
+    
+    id = db.Column(UUIDKey, primary_key=True, default=lambda: str(uuid.uuid4()))
+    taken_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    rows = db.relationship('BalanceSnapshotRow', backref='snapshot', cascade='all, delete-orphan')
+
+class BalanceSnapshotRow(db.Model):
+    __tablename__ = 'balance_snapshot_rows'
+    
+    snapshot_id = db.Column(UUIDKey, db.ForeignKey('balance_snapshots.id'), primary_key=True)
+    product_id = db.Column(UUIDKey, db.ForeignKey('products.id'), primary_key=True)
+    location_id = db.Column(UUIDKey, db.ForeignKey('locations.id'), primary_key=True)
+    incoming = db.Column(db.Integer, nullable=False, default=0)
+    outgoing = db.Column(db.Integer, nullable=False, default=0)
+    balance = db.Column(db.Integer, nullable=False, default=0)
+
+class ReorderThreshold(db.Model):
+    __tablename__ = 'reorder_thresholds'
+    
+    product_id = db.Column(UUIDKey, db.ForeignKey('products.id'), primary_key=True)
+    location_id = db.Column(UUIDKey, db.ForeignKey('locations.id'), primary_key=True)
+    min_qty = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class StockAlert(db.Model):
+    __tablename__ = 'stock_alerts'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(UUIDKey, db.ForeignKey('products.id'), nullable=False)
+    location_id = db.Column(UUIDKey, db.ForeignKey('locations.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    balance = db.Column(db.Integer, nullable=False)
+    threshold = db.Column(db.Integer, nullable=True)
+    raised_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    resolved_at = db.Column(db.DateTime, nullable=True)
+    
+    product = db.relationship('Product')
+    location = db.relationship('Location')
+    
+    __table_args__ = (
+        db.Index('ix_stock_alerts_pair', 'product_id', 'location_id', 'resolved_at'),
+        db.Index('ix_stock_alerts_resolved_raised', 'resolved_at', 'raised_at'),
+    )
+
+class MovementRollup(db.Model):
+    """One product's movement totals at one location for one UTC day, kept in step with the ledger"""
+    __tablename__ = 'movement_rollups'
+    
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(UUIDKey, db.ForeignKey('products.id'), primary_key=True)
+    location_id = db.Column(UUIDKey, db.ForeignKey('locations.id'), primary_key=True)
+    incoming = db.Column(db.Integer, nullable=False, default=0)
+    outgoing = db.Column(db.Integer, nullable=False, default=0)
+    # The receipt/dispatch part of incoming/outgoing; transfers between locations are excluded
+    received = db.Column(db.Integer, nullable=False, default=0)
+    dispatched = db.Column(db.Integer, nullable=False, default=0)
+    # No secondary indexes: analytics always read a window of days, which the (day, ...) primary key covers
+
+def assigned_shard(location_id, name):
+    """The LEDGER_SHARDS group a location id or name is listed under, or None for the default database"""
+    for shard, locations in current_app.config['LEDGER_SHARDS'].items():
+        if location_id in locations or name in locations:
+            return shard
+    return None
+
+def location_shards():
+    """Location id -> ledger shard for every location assigned to one, cached per catalog version"""
+    def load():
+        shards = {}
+        for location_id, name in db.session.query(Location.id, Location.name):
+            shard = assigned_shard(location_id, name)
+            if shard is not None:
+                shards[location_id] = shard
+        return shards
+    
+    return get_cache().get_or_set(f"ledger-shards:{get_versions('locations')['locations']}", load)
+
+def location_shard(location_id):
+    if not sharding_enabled():
+        return None
+    return location_shards().get(location_id)
+
+def shard_ledger_tables():
+    """Copies of the ledger tables for shard databases, minus foreign keys into the catalog they do not hold"""
+    metadata = db.MetaData()
+    tables = []
+    for name in sorted(LEDGER_TABLES):
+        table = db.metadata.tables[name]
+        copy = db.Table(name, metadata, *(
+            db.Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable)
+            for column in table.columns
+        ))
+        for index in table.indexes:
+            db.Index(index.name, *(copy.c[column.name] for column in index.columns), unique=index.unique)
+        tables.append(copy)
+    return metadata, tables
@@ -0,0 +1,235 @@
+"""PDF inventory report, imported by app.build_inventory_pdf() on first use so ReportLab stays off the startup path"""
+import os
+import tempfile
+import zlib
+from datetime import datetime
+from itertools import groupby
+from markupsafe import escape
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib import colors
+from reportlab.lib.units import inch
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.pdfbase.pdfdoc import PDFArray, PDFDictionary, PDFName, PDFStream
+
+REPORT_COLUMNS = ['Product', 'SKU', 'Location', 'Incoming', 'Outgoing', 'Balance']
+# Fixed widths keep consecutive table chunks aligned on the page
+REPORT_COLUMN_WIDTHS = [125, 70, 110, 50, 50, 50]
+REPORT_BALANCE_COLORS = {
+    'high': colors.HexColor('#10b981'),  # Green
+    'positive': colors.HexColor('#0ea5e9'),  # Blue
+    'zero': colors.HexColor('#f59e0b'),  # Amber
+    'negative': colors.HexColor('#dc2626'),  # Red
+}
+
+# Styles are built once per process and shared by every report
+STYLESHEET = getSampleStyleSheet()
+TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=STYLESHEET['Heading1'],
+    fontSize=16,
+    spaceAfter=30,
+    alignment=1,  # Center alignment
+)
+DATE_STYLE = ParagraphStyle(
+    'CustomDate',
+    parent=STYLESHEET['Normal'],
+    fontSize=10,
+    alignment=1,
+    spaceAfter=20,
+)
+GROUP_STYLE = ParagraphStyle(
+    'CustomGroup',
+    parent=STYLESHEET['Heading2'],
+    fontSize=12,
+    spaceBefore=12,
+    spaceAfter=6,
+    keepWithNext=1,
+)
+SUMMARY_STYLE = ParagraphStyle(
+    'CustomSummary',
+    parent=STYLESHEET['Normal'],
+    fontSize=10,
+    spaceAfter=5,
+)
+BALANCE_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f2937')),  # Dark gray header
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 9),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9fafb')]),  # Alternate row colors
+    ('TEXTCOLOR', (5, 1), (5, -1), colors.white),
+])
+SUBTOTAL_TABLE_STYLE = TableStyle([
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('BACKGROUND', (2, 0), (-1, 0), colors.HexColor('#e5e7eb')),
+    ('BOX', (2, 0), (-1, 0), 1, colors.black),
+    ('INNERGRID', (2, 0), (-1, 0), 1, colors.black),
+])
+
+def balance_band(balance):
+    if balance > 100:
+        return 'high'
+    if balance > 0:
+        return 'positive'
+    if balance == 0:
+        return 'zero'
+    return 'negative'
+
+class StreamedFlowables(list):
+    """Flowables pulled from an iterator as ReportLab consumes them, so the whole report never sits in memory"""
+    
+    def __init__(self, flowables, lookahead=2):
+        super().__init__()
+        self._source = iter(flowables)
+        self._lookahead = lookahead
+    
+    def _fill(self):
+        while self._source is not None and list.__len__(self) < self._lookahead:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+    
+    def __len__(self):
+        self._fill()
+        return list.__len__(self)
+    
+    def __getitem__(self, index):
+        self._fill()
+        return list.__getitem__(self, index)
+
+class SpooledPageStream(PDFStream):
+    """A finished page's content, deflated into a spool file until the PDF is written out"""
+    
+    def __init__(self, spool, content):
+        super().__init__(PDFDictionary({'Filter': PDFArray([PDFName('FlateDecode')])}))
+        self.spool = spool
+        self.offset = spool.seek(0, os.SEEK_END)
+        self.length = spool.write(zlib.compress(content.encode('utf8')))
+    
+    def format(self, document):
+        self.spool.seek(self.offset)
+        self.content = self.spool.read(self.length)
+        try:
+            return super().format(document)
+        finally:
+            self.content = None
+
+class SpoolingCanvas(Canvas):
+    """Canvas that moves each page's content to a temp file when the page ends instead of holding all pages until save"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._spool = tempfile.TemporaryFile()
+    
+    def showPage(self):
+        super().showPage()
+        page = self._doc.Pages.pages[-1]
+        page.Contents = SpooledPageStream(self._spool, page.stream)
+        page.stream = None
+    
+    def save(self):
+        try:
+            super().save()
+        finally:
+            self._spool.close()
+
+def balance_table(rows):
+    """One chunk of the balance table: the shared base style plus a command per colour run instead of per row"""
+    table_data = [REPORT_COLUMNS]
+    for balance in rows:
+        table_data.append([
+            balance.product_name,
+            balance.sku,
+            balance.location_name,
+            str(balance.incoming),
+            str(balance.outgoing),
+            str(balance.balance)
+        ])
+    
+    # Conditional formatting for the balance column, one BACKGROUND per run of equal bands
+    commands = []
+    row = 1
+    for band, run in groupby(rows, key=lambda balance: balance_band(balance.balance)):
+        length = sum(1 for _ in run)
+        commands.append(('BACKGROUND', (5, row), (5, row + length - 1), REPORT_BALANCE_COLORS[band]))
+        row += length
+    
+    table = Table(table_data, colWidths=REPORT_COLUMN_WIDTHS, repeatRows=1, style=BALANCE_TABLE_STYLE)
+    table.setStyle(TableStyle(commands))
+    return table
+
+def subtotal_table(label, incoming, outgoing, balance):
+    return Table(
+        [['', '', label, str(incoming), str(outgoing), str(balance)]],
+        colWidths=REPORT_COLUMN_WIDTHS,
+        style=SUBTOTAL_TABLE_STYLE
+    )
+
+def inventory_pdf_flowables(balances, as_of, group, rows_per_table):
+    """Yield the report flowables, consuming balances one table chunk at a time"""
+    # Add title
+    yield Paragraph("Inventory Report - Arele", TITLE_STYLE)
+    
+    # Add generation date
+    yield Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", DATE_STYLE)
+    
+    if as_of is not None:
+        yield Paragraph(f"Balances as of: {as_of.strftime('%Y-%m-%d %H:%M:%S')} UTC", DATE_STYLE)
+    
+    counts = {'total': 0, 'positive': 0, 'zero': 0, 'negative': 0}
+    if group == 'location':
+        groups = groupby(balances, key=lambda balance: balance.location_id)
+    else:
+        groups = [(None, balances)]
+    
+    for location_id, rows in groups:
+        location_name = None
+        chunk = []
+        subtotal = [0, 0, 0]
+        for balance in rows:
+            if location_id is not None and location_name is None:
+                location_name = balance.location_name
+                yield Paragraph(escape(location_name), GROUP_STYLE)
+            counts['total'] += 1
+            counts['positive' if balance.balance > 0 else 'zero' if balance.balance == 0 else 'negative'] += 1
+            subtotal[0] += balance.incoming
+            subtotal[1] += balance.outgoing
+            subtotal[2] += balance.balance
+            chunk.append(balance)
+            if len(chunk) == rows_per_table:
+                yield balance_table(chunk)
+                chunk = []
+        
+        if chunk or (location_id is None and not counts['total']):
+            yield balance_table(chunk)
+        if location_id is not None:
+            yield subtotal_table(f'{location_name} total', *subtotal)
+    
+    # Add summary
+    if counts['total']:
+        yield Spacer(1, 20)
+        
+        summary_text = f"""
+        <b>Summary:</b><br/>
+        Total Items: {counts['total']}<br/>
+        Positive Balance: {counts['positive']}<br/>
+        Zero Balance: {counts['zero']}<br/>
+        Negative Balance: {counts['negative']}
+        """
+        yield Paragraph(summary_text, SUMMARY_STYLE)
+
+def build_inventory_pdf(balances, output, as_of, group, rows_per_table):
+    """Render balances (any iterable, in report order) into a filename or file object"""
+    doc = SimpleDocTemplate(output, pagesize=A4, topMargin=1*inch)
+    doc.build(StreamedFlowables(inventory_pdf_flowables(balances, as_of, group, rows_per_table)), canvasmaker=SpoolingCanvas)
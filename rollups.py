@@ -0,0 +1,165 @@
+"""Maintenance of the daily movement_rollups table, kept in step with the ledger like stock_balances"""
+from sqlalchemy import bindparam, case, func
+
+from models import (
+    db, MovementRollup, ProductMovement, ArchivedMovement, COMPACTION_USER, sharding_enabled, ledger_shards,
+    ledger_shard, location_shards, fan_out, bump_version
+)
+
+ROLLUP_COLUMNS = ('incoming', 'outgoing', 'received', 'dispatched')
+
+def apply_rollup_delta(day, product_id, location_id, **deltas):
+    """Add incoming/outgoing/received/dispatched quantities to one day's rollup row"""
+    table = MovementRollup.__table__
+    key = (table.c.day == day, table.c.product_id == product_id, table.c.location_id == location_id)
+    result = db.session.execute(
+        table.update().where(*key).values({name: table.c[name] + qty for name, qty in deltas.items()})
+    )
+    
+    if result.rowcount == 0:
+        db.session.execute(table.insert().values(
+            day=day,
+            product_id=product_id,
+            location_id=location_id,
+            **{name: deltas.get(name, 0) for name in ROLLUP_COLUMNS}
+        ))
+
+def movement_rollup_deltas(movements):
+    """(day, product_id, location_id) -> [incoming, outgoing, received, dispatched] for movement dicts"""
+    deltas = {}
+    for movement in movements:
+        day, qty = movement['timestamp'].date(), movement['qty']
+        from_location_id, to_location_id = movement['from_location_id'], movement['to_location_id']
+        if from_location_id:
+            delta = deltas.setdefault((day, movement['product_id'], from_location_id), [0, 0, 0, 0])
+            delta[1] += qty
+            delta[3] += qty if not to_location_id else 0
+        if to_location_id:
+            delta = deltas.setdefault((day, movement['product_id'], to_location_id), [0, 0, 0, 0])
+            delta[0] += qty
+            delta[2] += qty if not from_location_id else 0
+    return deltas
+
+def apply_movement_to_rollups(movement):
+    """Update movement_rollups for one movement in the caller's transaction"""
+    for (day, product_id, location_id), delta in movement_rollup_deltas([{
+        'timestamp': movement.timestamp,
+        'product_id': movement.product_id,
+        'from_location_id': movement.from_location_id,
+        'to_location_id': movement.to_location_id,
+        'qty': movement.qty
+    }]).items():
+        apply_rollup_delta(day, product_id, location_id, **{name: qty for name, qty in zip(ROLLUP_COLUMNS, delta) if qty})
+
+def apply_rollup_deltas(deltas):
+    """Apply aggregated rollup deltas with two executemany calls, as apply_balance_deltas() does for balances"""
+    if not deltas:
+        return
+    table = MovementRollup.__table__
+    days = [day for day, _, _ in deltas]
+    existing = set(db.session.query(MovementRollup.day, MovementRollup.product_id, MovementRollup.location_id).filter(
+        MovementRollup.day.between(min(days), max(days))
+    ).all())
+    
+    updates, inserts = [], []
+    for (day, product_id, location_id), delta in deltas.items():
+        values = dict(zip(ROLLUP_COLUMNS, delta))
+        if (day, product_id, location_id) in existing:
+            updates.append({'b_day': day, 'b_product_id': product_id, 'b_location_id': location_id,
+                            **{f'b_{name}': qty for name, qty in values.items()}})
+        else:
+            inserts.append({'day': day, 'product_id': product_id, 'location_id': location_id, **values})
+    
+    if updates:
+        db.session.execute(
+            table.update().where(
+                table.c.day == bindparam('b_day'),
+                table.c.product_id == bindparam('b_product_id'),
+                table.c.location_id == bindparam('b_location_id')
+            ).values({name: table.c[name] + bindparam(f'b_{name}') for name in ROLLUP_COLUMNS}),
+            updates
+        )
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+
+def apply_movements_to_rollups(movements):
+    """Update movement_rollups for a batch of movement dicts in the caller's transaction"""
+    apply_rollup_deltas(movement_rollup_deltas(movements))
+
+def compute_movement_rollups(model=ProductMovement):
+    """(day, product_id, location_id) -> [incoming, outgoing, received, dispatched] from one ledger table"""
+    day = func.date(model.timestamp, type_=db.Date)
+    # Opening-balance entries left by compact-ledger restate older history, which the archive already holds
+    real = model.user_id != COMPACTION_USER
+    incoming_rows = db.session.query(
+        day, model.product_id, model.to_location_id,
+        func.sum(model.qty),
+        func.sum(case((model.from_location_id.is_(None), model.qty), else_=0))
+    ).filter(model.to_location_id.isnot(None), real).group_by(day, model.product_id, model.to_location_id)
+    outgoing_rows = db.session.query(
+        day, model.product_id, model.from_location_id,
+        func.sum(model.qty),
+        func.sum(case((model.to_location_id.is_(None), model.qty), else_=0))
+    ).filter(model.from_location_id.isnot(None), real).group_by(day, model.product_id, model.from_location_id)
+    
+    totals = {}
+    for day, product_id, location_id, qty, received in incoming_rows:
+        total = totals.setdefault((day, product_id, location_id), [0, 0, 0, 0])
+        total[0] += qty
+        total[2] += received
+    for day, product_id, location_id, qty, dispatched in outgoing_rows:
+        total = totals.setdefault((day, product_id, location_id), [0, 0, 0, 0])
+        total[1] += qty
+        total[3] += dispatched
+    return totals
+
+def total_movement_rollups():
+    """compute_movement_rollups() over every ledger shard and the archive"""
+    totals = {}
+    for result in [*fan_out(compute_movement_rollups), compute_movement_rollups(ArchivedMovement)]:
+        for key, values in result.items():
+            total = totals.setdefault(key, [0, 0, 0, 0])
+            for i, value in enumerate(values):
+                total[i] += value
+    return totals
+
+def find_rollup_drift(totals):
+    """Keys whose stored rollup row differs from the ledger totals"""
+    stored = {}
+    for rows in fan_out(lambda: db.session.query(MovementRollup).all()):
+        for row in rows:
+            stored[(row.day, row.product_id, row.location_id)] = [getattr(row, name) for name in ROLLUP_COLUMNS]
+    return sorted(
+        (key for key in set(stored) | set(totals) if stored.get(key) != totals.get(key)),
+        key=lambda key: (key[0], str(key[1]), str(key[2]))
+    )
+
+def rebuild_movement_rollups(totals=None):
+    """Replace the contents of movement_rollups with daily totals from the ledger"""
+    if totals is None:
+        totals = total_movement_rollups()
+    
+    # Like balance rows, each rollup row lives on the shard that owns its location
+    owners = location_shards() if sharding_enabled() else {}
+    rows_by_shard = {shard: [] for shard in ledger_shards()}
+    for (day, product_id, location_id), values in totals.items():
+        rows_by_shard[owners.get(location_id)].append({
+            'day': day,
+            'product_id': product_id,
+            'location_id': location_id,
+            **dict(zip(ROLLUP_COLUMNS, values))
+        })
+    
+    for shard, rows in rows_by_shard.items():
+        with ledger_shard(shard):
+            db.session.execute(MovementRollup.__table__.delete())
+            if rows:
+                db.session.execute(MovementRollup.__table__.insert(), rows)
+            bump_version('movements')
+            db.session.commit()
+    return len(totals)
+
+def backfill_movement_rollups():
+    """One-off rebuild for databases whose ledger predates movement_rollups"""
+    if MovementRollup.query.first() is None and ProductMovement.query.first() is not None:
+        rebuild_movement_rollups()
@@ -0,0 +1,37 @@
+import pytest
+
+from app import create_app, db, init_db
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Build apps on throwaway SQLite databases, disposing their engines afterwards"""
+    apps = []
+
+    def make(**config):
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / f'inventory{len(apps)}.db'}",
+            'LEDGER_SHARDS': {},
+            'TESTING': True,
+            **config
+        })
+        with app.app_context():
+            init_db()
+        apps.append(app)
+        return app
+
+    yield make
+    for app in apps:
+        with app.app_context():
+            writer = app.extensions.pop('arele_writer', None)
+            if writer is not None:
+                writer.close()
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
@@ -0,0 +1,60 @@
+import pytest
+
+import app as inventory
+from app import Location, Product, ProductMovement, StockAlert, db, ingest_movements, record_movement, set_reorder_threshold
+
+
+@pytest.fixture
+def pair(app):
+    with app.app_context():
+        product = Product(name='Alert Product', sku='ALERT-1')
+        location = Location(name='Alert Bin')
+        db.session.add_all([product, location])
+        db.session.commit()
+        return product.id, location.id
+
+
+def open_alerts():
+    return [(alert.kind, alert.balance, alert.threshold) for alert in StockAlert.query.filter(StockAlert.resolved_at.is_(None))]
+
+
+def test_low_stock_alert_is_raised_updated_and_resolved(app, pair):
+    product_id, location_id = pair
+    with app.app_context():
+        record_movement(product_id, None, location_id, 10)
+        set_reorder_threshold(product_id, location_id, 5)
+        assert open_alerts() == []
+
+        record_movement(product_id, location_id, None, 6)
+        assert open_alerts() == [('low_stock', 4, 5)]
+
+        record_movement(product_id, location_id, None, 1)
+        assert open_alerts() == [('low_stock', 3, 5)]
+
+        record_movement(product_id, None, location_id, 10)
+        assert open_alerts() == []
+        assert StockAlert.query.count() == 1
+
+
+def test_failed_bookkeeping_does_not_fail_a_committed_movement(app, pair, monkeypatch, caplog):
+    product_id, location_id = pair
+
+    def fail(pairs):
+        raise RuntimeError('alert store unavailable')
+
+    monkeypatch.setattr(inventory, 'evaluate_stock_alerts', fail)
+    with app.app_context():
+        movement = record_movement(product_id, None, location_id, 3)
+        result = ingest_movements([{'product_id': product_id, 'to_location_id': location_id, 'qty': 2}])
+
+        assert movement.qty == 3
+        assert result['inserted'] == 1
+        assert ProductMovement.query.count() == 2
+    assert 'Post-commit bookkeeping failed' in caplog.text
+
+    response = app.test_client().post('/movements/add', data={
+        'product_id': product_id, 'from_location_id': '', 'to_location_id': location_id, 'qty': '1', 'note': ''
+    })
+    assert response.status_code == 302
+    with app.app_context():
+        assert ProductMovement.query.count() == 3
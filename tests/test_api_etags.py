@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import Location, Product, db, get_versions, record_movement
+
+CATALOG_ROUTES = {'products': '/api/v1/products', 'locations': '/api/v1/locations'}
+LEDGER_ROUTES = ['/api/v1/movements', '/api/v1/balances']
+
+
+@pytest.fixture
+def pair(app):
+    with app.app_context():
+        product = Product(name='ETag Product', sku='ETAG-1')
+        location = Location(name='North Bin')
+        db.session.add_all([product, location])
+        db.session.commit()
+        record_movement(product.id, None, location.id, 5)
+        return product.id, location.id
+
+
+def etags(client, *urls):
+    return {url: client.get(url).headers['ETag'] for url in urls}
+
+
+def test_matching_etag_revalidates_without_a_body(app, pair):
+    client = app.test_client()
+    for url in [*CATALOG_ROUTES.values(), *LEDGER_ROUTES]:
+        response = client.get(url)
+        assert response.status_code == 200 and response.headers['ETag'], url
+
+        revalidated = client.get(url, headers={'If-None-Match': response.headers['ETag']})
+        assert revalidated.status_code == 304, url
+        assert revalidated.data == b''
+        assert revalidated.headers['ETag'] == response.headers['ETag']
+
+
+def test_query_string_is_part_of_the_etag(app, pair):
+    client = app.test_client()
+    assert client.get('/api/v1/products').headers['ETag'] != client.get('/api/v1/products?limit=1').headers['ETag']
+
+
+def test_catalog_write_changes_only_its_own_etags(app, pair):
+    client = app.test_client()
+    before = etags(client, *CATALOG_ROUTES.values(), *LEDGER_ROUTES)
+
+    response = client.post('/products/add', data={
+        'name': 'Second Product', 'sku': 'ETAG-2', 'description': '', 'unit_of_measure': 'each'
+    })
+    assert response.status_code == 302
+
+    after = etags(client, *CATALOG_ROUTES.values(), *LEDGER_ROUTES)
+    # Balances embed product names, so they depend on the product counter as well as the ledger
+    assert after['/api/v1/products'] != before['/api/v1/products']
+    assert after['/api/v1/balances'] != before['/api/v1/balances']
+    assert after['/api/v1/locations'] == before['/api/v1/locations']
+    assert after['/api/v1/movements'] == before['/api/v1/movements']
+    stale = client.get('/api/v1/products', headers={'If-None-Match': before['/api/v1/products']})
+    assert stale.status_code == 200
+    assert 'Second Product' in [product['name'] for product in stale.get_json()['products']]
+
+
+def test_movement_changes_ledger_etags_only(app, pair):
+    product_id, location_id = pair
+    client = app.test_client()
+    before = etags(client, *CATALOG_ROUTES.values(), *LEDGER_ROUTES)
+    with app.app_context():
+        versions = get_versions('movements', 'products')
+
+        record_movement(product_id, location_id, None, 2)
+
+        assert get_versions('movements', 'products') == {'movements': versions['movements'] + 1, 'products': versions['products']}
+
+    after = etags(client, *CATALOG_ROUTES.values(), *LEDGER_ROUTES)
+    for url in LEDGER_ROUTES:
+        assert after[url] != before[url], url
+        assert client.get(url, headers={'If-None-Match': before[url]}).status_code == 200, url
+    for url in CATALOG_ROUTES.values():
+        assert after[url] == before[url], url
+
+
+def test_if_modified_since_is_used_without_an_etag(app, pair):
+    client = app.test_client()
+    response = client.get('/api/v1/movements')
+    last_modified = response.headers['Last-Modified']
+
+    assert client.get('/api/v1/movements', headers={'If-Modified-Since': last_modified}).status_code == 304
+    earlier = response.last_modified - timedelta(seconds=1)
+    assert client.get('/api/v1/movements', headers={'If-Modified-Since': earlier}).status_code == 200
+    # A stale ETag wins over a current date: the tag is the precise validator
+    assert client.get('/api/v1/movements', headers={
+        'If-None-Match': '"m0-stale"', 'If-Modified-Since': datetime.now(timezone.utc)
+    }).status_code == 200
+
+
+def test_unwritten_tables_send_no_last_modified(app):
+    client = app.test_client()
+    response = client.get('/api/v1/products')
+
+    assert 'Last-Modified' not in response.headers
+    assert client.get('/api/v1/products', headers={'If-Modified-Since': datetime.now(timezone.utc)}).status_code == 200
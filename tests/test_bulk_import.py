@@ -0,0 +1,94 @@
+import pytest
+
+from app import Location, Product, ProductMovement, StockBalance, db
+
+
+@pytest.fixture
+def catalog(app):
+    with app.app_context():
+        product = Product(name='Bulk Product', sku='BULK-1')
+        source = Location(name='Bulk Source')
+        target = Location(name='Bulk Target')
+        db.session.add_all([product, source, target])
+        db.session.commit()
+        return product.id, source.id, target.id
+
+
+def post_bulk(app, payload, **params):
+    return app.test_client().post('/api/movements/bulk', json=payload, query_string=params)
+
+
+@pytest.mark.parametrize('qty', [2.9, True, False, '1e3', '2.5', 'ten', None, [1]])
+def test_non_integer_quantities_are_rejected(app, catalog, qty):
+    product_id, _, target_id = catalog
+    response = post_bulk(app, [{'product_id': product_id, 'to_location_id': target_id, 'qty': qty}])
+
+    assert response.status_code == 200
+    assert response.get_json() == {
+        'inserted': 0, 'rejected': 1, 'errors': [{'row': 1, 'error': 'Quantity must be an integer'}]
+    }
+    with app.app_context():
+        assert ProductMovement.query.count() == 0
+
+
+@pytest.mark.parametrize('qty', [3, 3.0, '3', ' 3 '])
+def test_integral_quantities_are_accepted(app, catalog, qty):
+    product_id, _, target_id = catalog
+    response = post_bulk(app, [{'product_id': product_id, 'to_location_id': target_id, 'qty': qty}])
+
+    assert response.get_json()['inserted'] == 1
+    with app.app_context():
+        assert db.session.get(StockBalance, (product_id, target_id)).balance == 3
+
+
+def test_rows_are_validated_in_order_against_running_balances(app, catalog):
+    product_id, source_id, target_id = catalog
+    response = post_bulk(app, [
+        {'sku': 'BULK-1', 'to_location_id': source_id, 'qty': 10},
+        {'product_id': product_id, 'from_location_id': source_id, 'to_location_id': target_id, 'qty': 4},
+        {'product_id': 'missing', 'to_location_id': target_id, 'qty': 1},
+        {'product_id': product_id, 'qty': 1},
+        {'product_id': product_id, 'to_location_id': 'missing', 'qty': 1},
+        {'product_id': product_id, 'to_location_id': target_id, 'qty': 0},
+        {'product_id': product_id, 'from_location_id': source_id, 'qty': 7},
+        'not an object',
+        {'product_id': product_id, 'from_location_id': source_id, 'qty': 6},
+    ], chunk_size=2)
+
+    result = response.get_json()
+    assert result['inserted'] == 3
+    assert result['errors'] == [
+        {'row': 3, 'error': 'Unknown product'},
+        {'row': 4, 'error': 'Either source or destination location must be specified'},
+        {'row': 5, 'error': 'Unknown location'},
+        {'row': 6, 'error': 'Quantity must be greater than 0'},
+        {'row': 7, 'error': 'Insufficient stock (6 units available)'},
+        {'row': 8, 'error': 'Movement must be an object'},
+    ]
+    with app.app_context():
+        assert db.session.get(StockBalance, (product_id, source_id)).balance == 0
+        assert db.session.get(StockBalance, (product_id, target_id)).balance == 4
+
+
+def test_csv_upload(app, catalog):
+    product_id, _, target_id = catalog
+    body = f'product_id,from_location_id,to_location_id,qty\n{product_id},,{target_id},5\n{product_id},,{target_id},x\n'
+    response = app.test_client().post('/api/movements/bulk', data=body, content_type='text/csv')
+
+    result = response.get_json()
+    assert (result['inserted'], result['rejected']) == (1, 1)
+
+
+@pytest.mark.parametrize('chunk_size', [0, -1])
+def test_non_positive_chunk_size_is_refused(app, catalog, chunk_size):
+    product_id, _, target_id = catalog
+    response = post_bulk(app, [{'product_id': product_id, 'to_location_id': target_id, 'qty': 1}], chunk_size=chunk_size)
+
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'chunk_size must be at least 1'}
+
+
+def test_malformed_payload_is_refused(app):
+    response = post_bulk(app, {'rows': []})
+
+    assert response.status_code == 400
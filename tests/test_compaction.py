@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import (
+    COMPACTION_USER, ArchivedMovement, BalanceSnapshot, BalanceSnapshotRow, Location, Product, ProductMovement, compact_ledger,
+    db, find_balance_drift, get_inventory_balances, get_movement_log, record_movement, take_balance_snapshot,
+    total_ledger_balances
+)
+from rollups import find_rollup_drift, rebuild_movement_rollups, total_movement_rollups
+
+DAY = timedelta(days=1)
+
+
+def backdate(movement, timestamp):
+    db.session.query(ProductMovement).filter(ProductMovement.id == movement.id).update({'timestamp': timestamp})
+    db.session.commit()
+
+
+@pytest.fixture
+def history(app):
+    """A receipt, a transfer and a dispatch 30, 20 and 10 days ago, then a receipt today"""
+    with app.app_context():
+        product = Product(name='Compaction Product', sku='COMPACT-1')
+        source = Location(name='Compaction Source')
+        target = Location(name='Compaction Target')
+        db.session.add_all([product, source, target])
+        db.session.commit()
+
+        now = datetime.utcnow()
+        days = [now - 30 * DAY, now - 20 * DAY, now - 10 * DAY]
+        backdated = [
+            record_movement(product.id, None, source.id, 10),
+            record_movement(product.id, source.id, target.id, 4),
+            record_movement(product.id, target.id, None, 3),
+        ]
+        for movement, timestamp in zip(backdated, days):
+            backdate(movement, timestamp)
+        record_movement(product.id, None, source.id, 5)
+        # The daily rollups were written under today's date before the backdating
+        rebuild_movement_rollups()
+        return days
+
+
+def test_compaction_preserves_current_and_as_of_balances(app, history):
+    with app.app_context():
+        take_balance_snapshot(history[1] + DAY)
+        take_balance_snapshot(history[2] + DAY)
+        cutoffs = [history[0] + DAY, history[1] + DAY, history[2] - DAY, history[2] + DAY, None]
+        expected = {cutoff: get_inventory_balances(cutoff) for cutoff in cutoffs}
+
+        compaction = compact_ledger(history[2] - DAY)
+
+        assert (compaction.archived, compaction.opening_entries) == (2, 3)
+        assert ArchivedMovement.query.count() == 2
+        assert ProductMovement.query.filter_by(user_id=COMPACTION_USER).count() == 3
+        for cutoff in cutoffs:
+            assert get_inventory_balances(cutoff) == expected[cutoff], cutoff
+        assert find_balance_drift(total_ledger_balances()) == []
+        assert find_rollup_drift(total_movement_rollups()) == []
+        # The snapshot from before the cutoff went with its rows; the later one still serves as-of reads
+        assert [snapshot.taken_at for snapshot in BalanceSnapshot.query] == [history[2] + DAY]
+        assert {row.snapshot_id for row in BalanceSnapshotRow.query} == {BalanceSnapshot.query.one().id}
+
+
+def test_archived_log_shows_originals_instead_of_opening_entries(app, history):
+    with app.app_context():
+        originals = [row[0].id for row in get_movement_log()]
+
+        compact_ledger(history[2] - DAY)
+
+        assert [row[0].id for row in get_movement_log(include_archived=True)] == originals
+        live = get_movement_log()
+        assert len(live) == 5
+        assert sum(row[0].user_id == COMPACTION_USER for row in live) == 3
+
+
+def test_compaction_cutoff_must_move_forward(app, history):
+    with app.app_context():
+        compact_ledger(history[1] + DAY)
+
+        with pytest.raises(ValueError):
+            compact_ledger(history[1] + DAY)
+        with pytest.raises(ValueError):
+            compact_ledger(history[0] + DAY)
@@ -0,0 +1,122 @@
+import pytest
+
+import app as inventory
+from app import (
+    InsufficientStockError, Location, Product, ProductMovement, StockAlert, StockBalance, compute_ledger_balances, db,
+    find_balance_drift, get_movement_writer, record_movement, set_reorder_threshold, submit_movement
+)
+from rollups import find_rollup_drift, total_movement_rollups
+
+
+@pytest.fixture
+def app(make_app):
+    # A long wait lets one test thread queue several movements into the same group
+    return make_app(MOVEMENT_GROUP_COMMIT=True, GROUP_COMMIT_MAX_WAIT_MS=200)
+
+
+@pytest.fixture
+def catalog(app):
+    with app.app_context():
+        product = Product(name='Group Product', sku='GROUP-1')
+        source = Location(name='Group Source')
+        target = Location(name='Group Target')
+        db.session.add_all([product, source, target])
+        db.session.commit()
+        return product.id, source.id, target.id
+
+
+def balance(product_id, location_id):
+    row = db.session.get(StockBalance, (product_id, location_id))
+    return row.balance if row else 0
+
+
+def assert_ledger_consistent():
+    db.session.expire_all()
+    assert find_balance_drift(compute_ledger_balances()) == []
+    assert find_rollup_drift(total_movement_rollups()) == []
+
+
+def test_submit_returns_the_committed_movement(app, catalog):
+    product_id, _, target_id = catalog
+    with app.app_context():
+        movement = submit_movement(product_id, None, target_id, 5, 'Receipt', user_id='tester')
+
+        assert (movement.qty, movement.note, movement.user_id) == (5, 'Receipt', 'tester')
+        stored = db.session.get(ProductMovement, movement.id)
+        assert (stored.product_id, stored.to_location_id, stored.qty) == (product_id, target_id, 5)
+        assert balance(product_id, target_id) == 5
+        assert_ledger_consistent()
+
+
+def test_a_group_is_checked_in_submission_order(app, catalog):
+    product_id, source_id, target_id = catalog
+    with app.app_context():
+        writer = get_movement_writer()
+        futures = [
+            writer.submit(product_id, None, source_id, 5),
+            writer.submit(product_id, source_id, target_id, 3),
+            writer.submit(product_id, source_id, None, 3),
+            writer.submit(product_id, source_id, None, 2),
+        ]
+
+        assert [future.result().qty for future in (futures[0], futures[1], futures[3])] == [5, 3, 2]
+        # Only the caller that would have overdrawn the bin is refused; the rest of its group commits
+        with pytest.raises(InsufficientStockError) as refused:
+            futures[2].result()
+        assert refused.value.available == 2
+        assert ProductMovement.query.count() == 3
+        assert (balance(product_id, source_id), balance(product_id, target_id)) == (0, 3)
+        assert_ledger_consistent()
+
+
+def test_a_failed_group_fails_every_caller_and_writes_nothing(app, catalog, monkeypatch):
+    product_id, source_id, _ = catalog
+
+    def fail(rows):
+        raise RuntimeError('rollup store unavailable')
+
+    monkeypatch.setattr(inventory, 'apply_movements_to_rollups', fail)
+    with app.app_context():
+        writer = get_movement_writer()
+        futures = [writer.submit(product_id, None, source_id, qty) for qty in (1, 2)]
+
+        for future in futures:
+            with pytest.raises(RuntimeError, match='rollup store unavailable'):
+                future.result()
+        assert ProductMovement.query.count() == 0
+        assert balance(product_id, source_id) == 0
+
+        monkeypatch.undo()
+        # The writer thread survives a failed group and keeps serving later ones
+        assert submit_movement(product_id, None, source_id, 4).qty == 4
+        assert_ledger_consistent()
+
+
+def test_close_commits_what_is_queued(app, catalog):
+    product_id, _, target_id = catalog
+    with app.app_context():
+        writer = get_movement_writer()
+        futures = [writer.submit(product_id, None, target_id, 1) for _ in range(10)]
+
+        writer.close()
+        app.extensions.pop('arele_writer')
+
+        assert all(future.done() for future in futures)
+        assert balance(product_id, target_id) == 10
+        assert_ledger_consistent()
+
+
+def test_writer_and_direct_writes_share_balances(app, catalog):
+    product_id, source_id, _ = catalog
+    with app.app_context():
+        record_movement(product_id, None, source_id, 2)
+        set_reorder_threshold(product_id, source_id, 1)
+
+        with pytest.raises(InsufficientStockError):
+            submit_movement(product_id, source_id, None, 3)
+        submit_movement(product_id, source_id, None, 2)
+
+        assert balance(product_id, source_id) == 0
+        # Group commits run the same post-commit bookkeeping as direct writes
+        assert [(alert.kind, alert.balance) for alert in StockAlert.query] == [('low_stock', 0)]
+        assert_ledger_consistent()
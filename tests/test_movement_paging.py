@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import Location, Product, ProductMovement, db, decode_cursor, get_movement_page, record_movement
+
+PAGE_SIZE = 5
+
+
+@pytest.fixture(params=[False, True], ids=['text-keys', 'compact-keys'])
+def app(make_app, request):
+    # Cursors compare (timestamp, id) in SQL, so they must also order correctly on 16-byte keys
+    return make_app(COMPACT_UUID_KEYS=request.param)
+
+
+@pytest.fixture
+def ledger(app):
+    """23 movements between two locations, in clusters that share a timestamp so only the id breaks ties"""
+    with app.app_context():
+        product = Product(name='Paging Product', sku='PAGE-1')
+        north = Location(name='North Bin')
+        south = Location(name='South Bin')
+        db.session.add_all([product, north, south])
+        db.session.commit()
+
+        start = datetime.utcnow() - timedelta(days=1)
+        for i in range(23):
+            if i % 3 == 2:
+                movement = record_movement(product.id, north.id, south.id, 1)
+            else:
+                movement = record_movement(product.id, None, north.id, 2)
+            db.session.query(ProductMovement).filter(ProductMovement.id == movement.id).update(
+                {'timestamp': start + timedelta(minutes=i // 4)}
+            )
+        db.session.commit()
+        return product.id, north.id, south.id
+
+
+def log_order(**filters):
+    """Ids newest first, as every page walk must reproduce them"""
+    query = ProductMovement.query
+    if filters.get('location_id'):
+        location_id = filters['location_id']
+        query = query.filter((ProductMovement.from_location_id == location_id) | (ProductMovement.to_location_id == location_id))
+    return [movement.id for movement in query.order_by(ProductMovement.timestamp.desc(), ProductMovement.id.desc())]
+
+
+def walk(**filters):
+    """Follow next cursors from the first page, then prev cursors back, returning both page sequences"""
+    forward = [get_movement_page(page_size=PAGE_SIZE, **filters)]
+    while forward[-1].next_cursor:
+        forward.append(get_movement_page(after=forward[-1].next_cursor, page_size=PAGE_SIZE, **filters))
+    backward = [forward[-1]]
+    while backward[-1].prev_cursor:
+        backward.append(get_movement_page(before=backward[-1].prev_cursor, page_size=PAGE_SIZE, **filters))
+    return forward, backward
+
+
+def page_ids(page):
+    return [row[0].id for row in page.rows]
+
+
+@pytest.mark.parametrize('by_location', [False, True], ids=['all', 'by-location'])
+def test_cursor_walks_cover_the_log_once_in_both_directions(app, ledger, by_location):
+    _, _, south_id = ledger
+    filters = {'location_id': south_id if by_location else None}
+    with app.app_context():
+        expected = log_order(**filters)
+        forward, backward = walk(**filters)
+
+        assert [movement_id for page in forward for movement_id in page_ids(page)] == expected
+        assert [len(page.rows) for page in forward[:-1]] == [PAGE_SIZE] * (len(forward) - 1)
+        assert forward[0].prev_cursor is None and forward[-1].next_cursor is None
+        assert [page_ids(page) for page in backward] == [page_ids(page) for page in reversed(forward)]
+        assert backward[-1].prev_cursor is None
+
+
+def test_cursor_survives_inserts_ahead_of_it(app, ledger):
+    product_id, north_id, _ = ledger
+    with app.app_context():
+        first = get_movement_page(page_size=PAGE_SIZE)
+        second = get_movement_page(after=first.next_cursor, page_size=PAGE_SIZE)
+
+        record_movement(product_id, None, north_id, 7)
+
+        assert page_ids(get_movement_page(after=first.next_cursor, page_size=PAGE_SIZE)) == page_ids(second)
+
+
+def test_malformed_cursor_falls_back_to_the_first_page(app, ledger):
+    with app.app_context():
+        assert decode_cursor('not-a-cursor') is None
+        assert page_ids(get_movement_page(after='not-a-cursor', page_size=PAGE_SIZE)) == log_order()[:PAGE_SIZE]
+
+    client = app.test_client()
+    assert client.get('/movements?after=not-a-cursor').status_code == 200
+    assert client.get('/log?before=%%%').status_code == 200
+
+
+def test_api_movements_pages_with_next_and_prev(app, ledger):
+    client = app.test_client()
+    first = client.get('/api/v1/movements', query_string={'limit': PAGE_SIZE}).get_json()
+    second = client.get('/api/v1/movements', query_string={'limit': PAGE_SIZE, 'after': first['next']}).get_json()
+    back = client.get('/api/v1/movements', query_string={'limit': PAGE_SIZE, 'before': second['prev']}).get_json()
+
+    assert len(first['movements']) == len(second['movements']) == PAGE_SIZE
+    assert not {movement['id'] for movement in first['movements']} & {movement['id'] for movement in second['movements']}
+    assert back['movements'] == first['movements']
@@ -0,0 +1,82 @@
+import re
+import uuid
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, text
+
+from app import (
+    ArchivedMovement, Location, Product, ProductMovement, StockBalance, db, inventory_balances_query,
+    movement_log_query, movements_for_location, movements_for_product
+)
+
+FULL_SCAN_PATTERN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?! USING)')
+LEDGER_TABLES = (ProductMovement.__tablename__, ArchivedMovement.__tablename__)
+
+PRODUCT_ID = str(uuid.uuid4())
+LOCATION_ID = str(uuid.uuid4())
+CURSOR = (datetime(2024, 1, 1), str(uuid.uuid4()))
+PAGE_SIZE = 51
+
+# The ledger queries issued by the routes; the movement count is the only one where a scan is inherent
+ROUTE_QUERIES = {
+    'index: inflow/outflow totals (cache miss)': lambda: db.session.query(
+        func.sum(StockBalance.incoming), func.sum(StockBalance.outgoing)
+    ),
+    'report: inventory balances': inventory_balances_query,
+    'report: inventory balances by location': lambda: inventory_balances_query().order_by(None).order_by(
+        Location.name, Product.name
+    ),
+    'movements: first page': lambda: movement_log_query(limit=PAGE_SIZE),
+    'movements: deep page': lambda: movement_log_query(cursor=CURSOR, limit=PAGE_SIZE),
+    'movements: previous page': lambda: movement_log_query(cursor=CURSOR, backwards=True, limit=PAGE_SIZE),
+    'log: filter by product': lambda: movement_log_query(PRODUCT_ID, cursor=CURSOR, limit=PAGE_SIZE),
+    'log: filter by location': lambda: movement_log_query(location_id=LOCATION_ID, cursor=CURSOR, limit=PAGE_SIZE),
+    'log: filter by product and location': lambda: movement_log_query(PRODUCT_ID, LOCATION_ID, CURSOR, limit=PAGE_SIZE),
+    'log: archived history': lambda: movement_log_query(cursor=CURSOR, limit=PAGE_SIZE, model=ArchivedMovement),
+    'log: archived history by location': lambda: movement_log_query(
+        location_id=LOCATION_ID, cursor=CURSOR, limit=PAGE_SIZE, model=ArchivedMovement
+    ),
+    'add_movement: stock reservation': lambda: db.session.query(StockBalance.balance).filter(
+        StockBalance.product_id == PRODUCT_ID,
+        StockBalance.location_id == LOCATION_ID
+    ),
+    'delete_product: movement check': lambda: movements_for_product(PRODUCT_ID).limit(1),
+    'delete_location: movement check': lambda: movements_for_location(LOCATION_ID).limit(1),
+}
+
+
+def explain_query_plan(query):
+    """Return the SQLite EXPLAIN QUERY PLAN detail lines for an ORM query"""
+    statement = query.statement if hasattr(query, 'statement') else query
+    connection = db.session.connection()
+    compiled = statement.compile(dialect=connection.dialect)
+    params = compiled.construct_params()
+    args = tuple(params[name] for name in compiled.positiontup)
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), args).fetchall()
+    return [row[-1] for row in rows]
+
+
+def ledger_scans(plan):
+    return [
+        line for line in plan
+        if (match := FULL_SCAN_PATTERN.match(line)) and match.group(1) in LEDGER_TABLES
+    ]
+
+
+@pytest.mark.parametrize('name', ROUTE_QUERIES)
+def test_route_query_uses_ledger_index(app, name):
+    with app.app_context():
+        plan = explain_query_plan(ROUTE_QUERIES[name]())
+    assert not ledger_scans(plan), f'{name} falls back to a full scan:\n' + '\n'.join(plan)
+
+
+@pytest.mark.parametrize('index, name', [
+    ('ix_product_movements_timestamp', 'movements: deep page'),
+    ('ix_product_movements_to_timestamp', 'delete_location: movement check'),
+])
+def test_dropped_index_is_reported(app, index, name):
+    with app.app_context():
+        db.session.execute(text(f'DROP INDEX {index}'))
+        plan = explain_query_plan(ROUTE_QUERIES[name]())
+    assert ledger_scans(plan)
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+from app import Location, Product, db, record_movement, report_job_as_of, report_version
+
+
+def add_pair():
+    product = Product(name='Report Product', sku='REPORT-1')
+    location = Location(name='Report Bin')
+    db.session.add_all([product, location])
+    db.session.commit()
+    return product.id, location.id
+
+
+def test_current_as_of_report_key_follows_new_movements(app):
+    with app.app_context():
+        product_id, location_id = add_pair()
+        # ?as_of=<today> is parsed as the end of today
+        end_of_today = datetime.combine(datetime.utcnow().date() + timedelta(days=1), datetime.min.time())
+        before = report_version(end_of_today)
+
+        record_movement(product_id, None, location_id, 5, 'Receipt')
+
+        after = report_version(end_of_today)
+        assert after != before
+        assert report_job_as_of(after) == end_of_today
+
+
+def test_settled_as_of_report_key_ignores_new_movements(app):
+    with app.app_context():
+        product_id, location_id = add_pair()
+        last_year = datetime(datetime.utcnow().year - 1, 1, 1)
+        before = report_version(last_year, group='location')
+
+        record_movement(product_id, None, location_id, 5, 'Receipt')
+
+        assert report_version(last_year, group='location') == before
+        assert report_job_as_of(before) == last_year
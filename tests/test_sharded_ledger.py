@@ -0,0 +1,50 @@
+import pytest
+
+from app import Location, Product, ProductMovement, StockBalance, db, get_inventory_balances, ledger_shard, record_movement
+
+
+@pytest.fixture
+def app(make_app, tmp_path):
+    # An explicit bind keeps the shard's file under tmp_path instead of the instance folder
+    return make_app(LEDGER_SHARDS={'north': ['North Bin']}, SQLALCHEMY_BINDS={'north': f"sqlite:///{tmp_path / 'north.db'}"})
+
+
+@pytest.fixture
+def catalog(app):
+    with app.app_context():
+        product = Product(name='Shard Product', sku='SHARD-1')
+        north = Location(name='North Bin')
+        south = Location(name='South Bin')
+        db.session.add_all([product, north, south])
+        db.session.commit()
+        return product.id, north.id, south.id
+
+
+def test_movements_are_written_to_their_locations_shard(app, catalog):
+    product_id, north_id, south_id = catalog
+    with app.app_context():
+        record_movement(product_id, None, north_id, 4)
+        record_movement(product_id, None, south_id, 6)
+
+        assert ProductMovement.query.count() == 1
+        with ledger_shard('north'):
+            assert ProductMovement.query.count() == 1
+            assert db.session.get(StockBalance, (product_id, north_id)).balance == 4
+        balances = {(row.location_name, row.balance) for row in get_inventory_balances()}
+        assert balances == {('North Bin', 4), ('South Bin', 6)}
+
+
+def test_a_movement_on_a_shard_changes_the_ledger_etags(app, catalog):
+    product_id, north_id, south_id = catalog
+    client = app.test_client()
+    with app.app_context():
+        record_movement(product_id, None, south_id, 1)
+    before = {url: client.get(url).headers['ETag'] for url in ('/api/v1/movements', '/api/v1/balances')}
+
+    with app.app_context():
+        record_movement(product_id, None, north_id, 1)
+
+    for url, etag in before.items():
+        response = client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 200, url
+        assert response.headers['ETag'] != etag
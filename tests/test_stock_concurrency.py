@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+
+from app import (
+    InsufficientStockError, Location, Product, ProductMovement, StockBalance, db, record_movement, submit_movement
+)
+
+# The same race as flask bench stress-stock: hundreds of pickers, more than there are units
+THREADS = 300
+STOCK = 100
+
+
+def race_picks(app, product_id, location_id, pick):
+    """Release THREADS single-unit picks at once and count how each one ended"""
+    outcomes = {'ok': 0, 'insufficient': 0, 'locked': 0}
+    outcomes_lock = threading.Lock()
+    barrier = threading.Barrier(THREADS)
+
+    def run():
+        with app.app_context():
+            barrier.wait()
+            try:
+                pick(product_id, location_id, None, 1, 'Concurrent pick')
+                outcome = 'ok'
+            except InsufficientStockError:
+                outcome = 'insufficient'
+            except OperationalError:
+                outcome = 'locked'
+            finally:
+                db.session.remove()
+            with outcomes_lock:
+                outcomes[outcome] += 1
+
+    workers = [threading.Thread(target=run) for _ in range(THREADS)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return outcomes
+
+
+@pytest.mark.parametrize('group_commit', [False, True], ids=['per-request', 'group-commit'])
+def test_concurrent_picks_never_oversell(make_app, group_commit):
+    app = make_app(MOVEMENT_GROUP_COMMIT=group_commit)
+    with app.app_context():
+        product = Product(name='Stress Product', sku='STRESS-1')
+        location = Location(name='Stress Bin')
+        db.session.add_all([product, location])
+        db.session.commit()
+        product_id, location_id = product.id, location.id
+        record_movement(product_id, None, location_id, STOCK, 'Receipt')
+
+    outcomes = race_picks(app, product_id, location_id, submit_movement)
+
+    with app.app_context():
+        stored = db.session.get(StockBalance, (product_id, location_id))
+        shipped = db.session.query(func.coalesce(func.sum(ProductMovement.qty), 0)).filter(
+            ProductMovement.product_id == product_id,
+            ProductMovement.from_location_id == location_id
+        ).scalar()
+
+    assert stored.balance >= 0
+    assert shipped <= STOCK
+    assert stored.balance == STOCK - shipped
+    assert outcomes['ok'] == shipped
+    assert outcomes['ok'] + outcomes['insufficient'] + outcomes['locked'] == THREADS
+    # More pickers than units: once the stock is gone the rest must be refused, not oversold
+    assert outcomes['insufficient'] > 0